@@ -2,17 +2,25 @@ from bokeh.layouts import gridplot
 from bokeh.models import ColumnDataSource, HoverTool
 from bokeh.palettes import RdBu3
 from bokeh.plotting import figure
+from concurrent.futures import Executor, Future
 from datetime import datetime, timedelta
+from functools import partial
 import holoviews as hv
 import hvplot.pandas
 import numpy as np
 import pandas as pd
 import panel as pn
+import os
 import param
 import time
 
 from cred.cred_data import CredData
-from cred.utils.io import fetch_cred_data
+from cred.graph import edge_type_weights, node_type_weights
+from cred.registry import get_registry, parse_instances
+from cred.utils.cache import RenderCache
+from cred.utils.downsample import downsample, downsample_columns
+from cred.utils.executor import get_executor
+from cred.utils.metrics import Trace, start_metrics_server, timed
 from cred.utils.plot import pie_chart
 
 pn.extension()
@@ -25,57 +33,176 @@ react = pn.template.ReactTemplate(title='TECred Dashboard',
 # pn.config.sizing_mode = 'stretch_both'
 pn.config.sizing_mode = 'stretch_width'
 
-# TODO: Get from URI params
-# BASE_URI = 'https://raw.githubusercontent.com/1Hive/pollen/gh-pages'
-BASE_URI = 'https://raw.githubusercontent.com/TECommons/tec-sourcecred/gh-pages'
+BASE_URI = os.environ.get('CRED_BASE_URI', 'https://raw.githubusercontent.com/TECommons/tec-sourcecred/gh-pages')
+# Instances served, as comma-separated name=base_uri pairs (e.g. tec=...,pollen=https://raw.githubusercontent.com/1Hive/pollen/gh-pages),
+# picked per session with the `instance` URI parameter (default: the first one)
+INSTANCES = parse_instances(os.environ.get('CRED_INSTANCES', f'tec={BASE_URI}'))
+# Seconds between two background refreshes of the instance data
+REFRESH_INTERVAL = int(os.environ.get('CRED_REFRESH_INTERVAL', 3600))
+# Max number of rendered views kept in the cache shared by all sessions
+RENDER_CACHE_SIZE = int(os.environ.get('CRED_RENDER_CACHE_SIZE', 256))
+# Points per time series before the plot width is known (about one per pixel)
+PLOT_POINTS = int(os.environ.get('CRED_PLOT_POINTS', 1000))
+# Time series decimation: 'minmax' (keeps every peak) or 'lttb'
+DOWNSAMPLE = os.environ.get('CRED_DOWNSAMPLE', 'minmax')
+# Directory of the data bundles precomputed by `python -m cred.bundle`, one subdirectory per instance (off when unset)
+BUNDLE_DIR = os.environ.get('CRED_BUNDLE_DIR')
+# Only attach to the bundles published by a loader process (`python -m cred.bundle --watch`), never fetch or derive the data
+BUNDLE_ONLY = os.environ.get('CRED_BUNDLE_ONLY', '0') != '0'
+# Seconds between two checks for a new bundle generation
+BUNDLE_POLL_INTERVAL = float(os.environ.get('CRED_BUNDLE_POLL_INTERVAL', 5))
+# Worker threads running what-if cred recomputations, shared by all sessions
+WHAT_IF_WORKERS = int(os.environ.get('CRED_WHAT_IF_WORKERS', 2))
+# Usernames suggested by the user search box
+USER_SEARCH_RESULTS = int(os.environ.get('CRED_USER_SEARCH_RESULTS', 10))
+# Worker threads loading the data of new sessions, shared by all sessions
+LOAD_WORKERS = int(os.environ.get('CRED_LOAD_WORKERS', 4))
+# Check each incremental data update against a full rebuild
+VERIFY_UPDATES = os.environ.get('CRED_VERIFY_UPDATES', '0') != '0'
+# Cred output parsed: 'timeline' (credResult.json, sourcecred <= 0.7) or 'participants' (credGrainView.json,
+# sourcecred >= 0.8, the full graph only loaded when a graph tab opens)
+CRED_FORMAT = os.environ.get('CRED_FORMAT', 'timeline')
+# Store the node and account tables compactly (categoricals, downcast integers, lazily decoded text)
+COMPACT = os.environ.get('CRED_COMPACT', '0') != '0'
+# Port of the Prometheus metrics endpoint (off when unset)
+METRICS_PORT = os.environ.get('CRED_METRICS_PORT')
+# Directory for per-session trace dumps (off when unset)
+TRACE_DIR = os.environ.get('CRED_TRACE_DIR')
+
+if METRICS_PORT:
+    start_metrics_server(int(METRICS_PORT))
 
-# TODO: replace by periods (All-time, Last week, Last month, Last year)
 DEFAULT_DATERANGE = (datetime.fromtimestamp(int(time.time())) - timedelta(days=30),
                      datetime.fromtimestamp(int(time.time()))
                     )
+# Preset periods, counted back from the last cred interval
+PERIODS = {
+    'All-time': None,
+    'Last week': timedelta(days=7),
+    'Last month': timedelta(days=30),
+    'Last year': timedelta(days=365),
+}
+
+# STEP 1: Template shell, served before any data is loaded (the data is
+# shared read-only by every session of the process)
+registry = get_registry(INSTANCES,
+                        refresh_interval=REFRESH_INTERVAL,
+                        render_cache_size=RENDER_CACHE_SIZE,
+                        verify_updates=VERIFY_UPDATES,
+                        bundle_dir=BUNDLE_DIR,
+                        bundle_only=BUNDLE_ONLY,
+                        bundle_poll_interval=BUNDLE_POLL_INTERVAL,
+                        compact=COMPACT,
+                        cred_format=CRED_FORMAT)
+instance = next(iter(INSTANCES))
+if pn.state.session_args.get('instance'):
+    instance = pn.state.session_args['instance'][0].decode()
+    if instance not in INSTANCES:
+        print(f'Unknown instance {instance!r}, showing {next(iter(INSTANCES))!r}')
+        instance = next(iter(INSTANCES))
+service = registry[instance]
+loader = get_executor('load', LOAD_WORKERS)
+doc = pn.state.curdoc
+
+
+def loading() -> pn.Column:
+    """
+    Placeholder of a panel, filled once its data is loaded
+    """
+    return pn.Column(pn.indicators.LoadingSpinner(value=True, width=50, height=50, sizing_mode='fixed'))
+
+
+# one placeholder per CredDashboard view
+slots = {name: loading() for name in ('view_cred_grain_over_time', 'view_distr_stats', 'view_ranking',
+                                      'rank_table', 'view_rank_ordered', 'view_cred_flow_analysis')}
+sidebar_slot = loading()
+what_if_slot = loading()
+comparison_slot = loading()
 
-# STEP 1: Loading data
-cred_data = fetch_cred_data(uri=f'{BASE_URI}/output/credResult.json', filename='data/credResult.json', cache=False)
-accounts_data = fetch_cred_data(uri=f'{BASE_URI}/output/accounts.json', filename='data/accounts.json', cache=False)
+# STEP 2: Creating dashboard
+class SearchInput(pn.widgets.TextInput):
+    """
+    TextInput also syncing its text on every keystroke
+    """
+    value_input = param.String(default='', allow_None=True)
 
-cred = CredData(cred_data, accounts_data)
 
-# STEP 2: Creating dashboard
-user_filter = pn.widgets.AutocompleteInput(options=cred.get_user_nodes().user.unique().tolist(),
-                                           placeholder='Browser by username',
-                                           restrict=False, case_sensitive=False
-                                          )
+# usernames are searched on the server (see CredData.search_users): only
+# the top matches of the text typed so far are sent to the browser
+user_filter = SearchInput(placeholder='Browser by username')
+user_matches = pn.widgets.MultiSelect(options=[], size=USER_SEARCH_RESULTS)
+user_search = pn.Column(user_filter)
 
 class CredDashboard(param.Parameterized):
     
-    # TODO: use intervals
+    period = param.ObjectSelector(default='All-time', objects=list(PERIODS), label='Period')
     date_range = param.DateRange(default=DEFAULT_DATERANGE, bounds=DEFAULT_DATERANGE, label='Date Interval')
     top_n = param.Integer(default=5, bounds=(5, 100), step=5, label="Compare with Top-")
     user = param.String(label='Find a user', default='')
     
-    def __init__(self, cred: CredData, **params):
+    def __init__(self, cred: CredData, render_cache: RenderCache = None, trace: Trace = None, **params):
         super(CredDashboard, self).__init__(**params, name="Filters")
         snapshot_int = cred.get_dt_intervals()
         self.param.date_range.default = (snapshot_int[0], snapshot_int[-1]) 
         self.param.date_range.bounds = (snapshot_int[0], snapshot_int[-1])
+        self.date_range = (snapshot_int[0], snapshot_int[-1])
         self.cred = cred
+        self.render_cache = render_cache if render_cache is not None else RenderCache()
+        self.trace = trace
         self.intervals = cred.get_dt_intervals()
-        self.df = cred.to_df()
 
         self.selectedUser = None
+
+    @param.depends('period', watch=True)
+    def set_period(self):
+        first, last = self.intervals[0], self.intervals[-1]
+        delta = PERIODS[self.period]
+        self.date_range = (first if delta is None else max(first, last - delta), last)
     
-    def set_user(self, value):
+    def _render(self, view: str, params: tuple, render):
+        """
+        Renders `view` through the render cache, keyed by snapshot, view
+        name and the parameters the view depends on
+        """
+        snapshot = self.cred.snapshot_key or id(self.cred)
+        return self.render_cache.get((snapshot, view) + params, render)
+
+    def _zoomable(self, view: str, params: tuple, plot):
+        """
+        DynamicMap of `plot(x_range, n_points)`, called again on zoom and pan
+        so its series are downsampled over the visible range only, at about
+        one point per pixel. Full-range plots go through the render cache;
+        the DynamicMap and its streams belong to the session.
+        """
+        def callback(x_range=None, width=None, **size):
+            # plot widths are rounded up so that sessions share cached plots
+            n_points = PLOT_POINTS if not width else -(-width // 250) * 250
+            if x_range is None:
+                return self._render(view, params + (n_points,), lambda: plot(None, n_points))
+            return plot(x_range, n_points)
+
+        return hv.DynamicMap(callback, streams=[hv.streams.RangeX(), hv.streams.PlotSize()])
+
+    def _interval_range(self) -> tuple:
+        # date ranges covering the same intervals render the same view
+        return self.cred.get_interval_range(self.date_range)
+
+    def set_user(self, value: str = None):
         print(f"******====== SET_USER ******====== {value}")
         if value is not None:
-            self.selectedUser = value.new
-            self.user = value.new
+            self.selectedUser = value
+            self.user = value
             user_filter.disabled = True
         else:
             self.selectedUser = None
             self.user = ''
             user_filter.value = ''
             user_filter.disabled = False
+        user_matches.options = []
+        user_search.objects = [user_filter]
     
+    @param.depends('date_range')
+    @timed(trace_attr='trace')
     def view_distr_stats(self):
         x = [4., 10.]
         y = [1.5, 1.5]
@@ -90,8 +217,8 @@ class CredDashboard(param.Parameterized):
         p = figure(plot_height=300,tools=[], x_range=(0, 14), y_range=(0, 3))
 
         p.circle(x='x', y='y', radius=2., color='color', source=source)
-        p.text(np.array(x), np.array(y), text=['{}\nCRED'.format(round(self.cred.distributed_cred, 2)),
-                                               '{}g\nGRAIN'.format(round(self.cred.distributed_grain, 2))
+        p.text(np.array(x), np.array(y), text=['{}\nCRED'.format(round(self.cred.get_distributed_cred(self.date_range), 2)),
+                                               '{}g\nGRAIN'.format(round(self.cred.get_distributed_grain(self.date_range), 2))
                                               ],
                text_baseline="middle", text_align="center", text_color='#000000', text_font_size={'value': '25px'})
 
@@ -104,11 +231,18 @@ class CredDashboard(param.Parameterized):
 
         return pn.Row(grid)
     
+    @param.depends('date_range')
+    @timed(trace_attr='trace')
     def view_cred_grain_over_time(self):
-        df_grain_distr = self.cred.get_grain_distribution()
-        df_grain_overall = df_grain_distr.groupby('credTimestampMs').sum()
-        df_cred_overall = cred.get_cred_over_time()
-        df_cred_overall.hvplot.line(label='Cred')
+        df_grain_overall = self.cred.get_grain_over_time(self.date_range)
+        df_cred_overall = self.cred.get_cred_over_time(self.date_range)
+        # the grain series is cut at the dates themselves, not at the intervals
+        return self._zoomable('cred_grain_over_time', (self._interval_range(), self.cred.get_grain_range(self.date_range)),
+                              lambda x_range, n_points: self._render_cred_grain_over_time(
+                                  downsample(df_cred_overall, n_points, DOWNSAMPLE, x_range),
+                                  downsample(df_grain_overall, n_points, DOWNSAMPLE, x_range)))
+
+    def _render_cred_grain_over_time(self, df_cred_overall: pd.DataFrame, df_grain_overall: pd.DataFrame):
         
         
         custom_hover = HoverTool(tooltips=[("Date",  "@credTimestampMs{%Y/%m/%d}"),
@@ -124,42 +258,50 @@ class CredDashboard(param.Parameterized):
                                                                                              xlabel='Date',
                                                                                             )
     
+    @param.depends('date_range', 'top_n', 'user')
+    @timed(trace_attr='trace')
     def view_ranking(self):
-        df_rank = self.cred.get_user_ranking()
-        line_alpha = [0.2] * self.top_n
-        df_ucred = None
-        if self.user:
-            user_rank = df_rank.query(f'user=="{self.user}"').index[0] + 1
-            if user_rank > self.top_n:
-                df_ucred = pd.DataFrame([self.intervals, df_rank[df_rank.user == self.user].credOverTime.to_list()[0]]).T
-                df_ucred.columns = ['date', f'{user_rank} - {self.user}']
-                df_ucred.set_index('date', inplace=True)
-                if user_rank > self.top_n:
-                    line_alpha += [1.]
-                else:
-                    line_alpha[user_rank - 1] = 1.
+        params = (self._interval_range(), self.top_n, self.user)
+        df_plot, line_alpha = self._render('ranking_data', params, self._ranking_data)
+        return self._zoomable('ranking', params,
+                              lambda x_range, n_points: self._render_ranking(
+                                  downsample_columns(df_plot, n_points, DOWNSAMPLE, x_range), line_alpha))
+
+    def _ranking_data(self):
+        df_credtop = self.cred.get_top_cred_over_time(self.top_n, self.date_range)
+        df_credtop.columns = [f'{i + 1} - {u}' for i, u in enumerate(df_credtop.columns)]
+        df_credtop.index.name = 'date'
+        df_plot = df_credtop
+
+        user_rank = self.cred.get_user_rank(self.user, self.date_range) if self.user else None
+        if user_rank is None:
+            line_alpha = [1.] * df_credtop.shape[1]
         else:
-            line_alpha = [1.] * self.top_n
-
-        df_top = df_rank.head(self.top_n).copy()
-        df_credtop = pd.DataFrame(df_top.credOverTime.to_list()).T
-        df_credtop.columns = [f'{i + 1} - {u}' for i, u in enumerate(df_top.user.to_list())]
-        df_credtop['date'] = self.intervals
-        df_credtop.set_index('date', drop=True, inplace=True)
-        df_plot = df_credtop.join(df_ucred, on='date') if self.user and user_rank > self.top_n else df_credtop
-
-        return df_plot.hvplot.line(x='date',
-                                   y=df_plot.columns.to_list(),
-                                   xlabel='Date', ylabel='Cred', group_label='User Rank',
-#                                    width=1000, height=400,
-                                   line_alpha=line_alpha, hover_line_alpha=1.,
-                                   hover_cols=['index'],
-                                   title='Ranking + Cred over time'
-                                  )
+            line_alpha = [0.2] * df_credtop.shape[1]
+            if user_rank > df_credtop.shape[1]:
+                df_ucred = self.cred.get_user_cred_over_time(self.user, self.date_range).to_frame(f'{user_rank} - {self.user}')
+                df_ucred.index.name = 'date'
+                df_plot = df_credtop.join(df_ucred, on='date')
+                line_alpha += [1.]
+            else:
+                line_alpha[user_rank - 1] = 1.
+        return df_plot, line_alpha
+
+    def _render_ranking(self, series: list, line_alpha: list):
+        # one curve per user, each downsampled on its own
+        curves = [(s.name, hv.Curve((s.index, s.to_numpy()), ('date', 'Date'), ('cred', 'Cred')).opts(
+                       line_alpha=alpha, hover_line_alpha=1., tools=['hover']))
+                  for s, alpha in zip(series, line_alpha)]
+        return hv.NdOverlay(curves, kdims=['User Rank'], sort=False).opts(title='Ranking + Cred over time',
+                                                                          legend_position='right')
     
+    @param.depends('date_range', 'top_n')
+    @timed(trace_attr='trace')
     def view_rank_ordered(self):
-        df_rank = self.cred.get_user_ranking()
-        df_topn = df_rank.head(self.top_n).copy()
+        return self._render('rank_ordered', (self._interval_range(), self.top_n), self._render_rank_ordered)
+
+    def _render_rank_ordered(self):
+        df_topn = self.cred.get_top_ranking(self.top_n, self.date_range).copy()
         df_topn['rank'] = df_topn.index.map(lambda x: x + 1)#.map(str) + ' - ' + df_top100.user
 
         df_topn.sort_values('user', inplace=True)
@@ -175,46 +317,26 @@ class CredDashboard(param.Parameterized):
     def view(self):
         return pn.Column(f'DateRange: {self.top_n} {self.date_range[0]} - {self.date_range[-1]}\n {self.user} / {self.selectedUser}')
     
-#     @param.depends('top_n')
+    @param.depends('date_range', 'top_n')
+    @timed(trace_attr='trace')
     def rank_table(self):
+        return self._render('rank_table', (self._interval_range(), self.top_n), self._render_rank_table)
+
+    def _render_rank_table(self):
         cols = ['type', 'user', 'active', 'totalCred', 'credShare', 'grainBalance', 'grainPaid']
-        return self.cred.get_user_ranking()[cols].head(self.top_n).hvplot.table(title= f'Top-{self.top_n} Users by Gained Cred')
+        return self.cred.get_top_ranking(self.top_n, self.date_range)[cols].hvplot.table(title= f'Top-{self.top_n} Users by Gained Cred')
     
+    @param.depends()
+    @timed(trace_attr='trace')
     def view_cred_flow_analysis(self):
-        df_nodes, df_edges = self.cred.get_cred_flow_from_graph()
-        
-        f_bar = hv.Bars(df_edges, 'index', ['forward', 'plugin']).opts(color='plugin',
-                                                                       cmap='Category10',
-                                                                       width=1000, height=300,
-                                                                       xrotation=45,
-                                                                       tools=['hover'],
-#                                                                        xlabel='Edges',
-                                                                       ylabel='Forward Cred Flow',
-                                                                       xaxis=None
-                                                                      )
-
-        b_bar = hv.Bars(df_edges, 'index', ['backward', 'plugin']).opts(color='plugin',
-                                                                        cmap='Category10',
-                                                                        width=1000, height=500,
-                                                                        xrotation=45,
-                                                                        tools=['hover'],
-                                                                        xlabel='Edges',
-                                                                        ylabel='Backward Cred Flow'
-                                                                       )
-        
-        n_bar = hv.Bars(df_nodes, 'index', ['weight', 'plugin']).opts(color='plugin',
-                                                                      cmap='Category10',
-                                                                      width=1000, height=500,
-                                                                      xrotation=45,
-                                                                      tools=['hover'],
-                                                                      xlabel='Nodes',
-                                                                      ylabel='Cred Flow'
-                                                                     )
-        
-        df_n_byplugin = df_nodes.groupby('plugin').sum()
-        df_e_byplugin = df_edges.groupby('plugin').sum()
-        
-        colors = ['#0F2EEE', '#0b0a15', '#DEFB48'][:df_e_byplugin.index.shape[0]]
+        # Bokeh figures can't be shared between sessions, so only the
+        # HoloViews charts and the pie data are cached
+        bars, df_n_byplugin, df_e_byplugin = self._render('cred_flow_analysis', (), self._render_cred_flow_analysis)
+
+        # default palette when there are more plugins than brand colors
+        colors = ['#0F2EEE', '#0b0a15', '#DEFB48']
+        edge_colors = colors[:df_e_byplugin.index.shape[0]] if df_e_byplugin.index.shape[0] <= len(colors) else None
+        node_colors = colors[:df_n_byplugin.index.shape[0]] if df_n_byplugin.index.shape[0] <= len(colors) else None
         pie_radius = 0.4
         pieplot_height = 250
         pieplot_width = 400
@@ -222,7 +344,7 @@ class CredDashboard(param.Parameterized):
 
         edge_pie_b = pie_chart(df_e_byplugin.backward,
                                index_name='plugin',
-                               colors=colors,
+                               colors=edge_colors,
                                title='Plugin Edges Backward',
                                radius=pie_radius,
                                plot_height=pieplot_height,
@@ -233,7 +355,7 @@ class CredDashboard(param.Parameterized):
 
         edge_pie_f = pie_chart(df_e_byplugin.forward,
                                index_name='plugin',
-                               colors=colors,
+                               colors=edge_colors,
                                title='Plugin Edges Forward',
                                radius=pie_radius,
                                plot_height=pieplot_height,
@@ -245,7 +367,7 @@ class CredDashboard(param.Parameterized):
 
         nodes_pie = pie_chart(df_n_byplugin.weight,
                               index_name='plugin',
-                              colors=colors,
+                              colors=node_colors,
                               title='Plugin Nodes',
                               radius=pie_radius,
                               plot_height=pieplot_height,
@@ -255,34 +377,349 @@ class CredDashboard(param.Parameterized):
         return pn.Column(
 #             "## Overall Cred Flow through Nodes/Edges",
             pn.Row(edge_pie_b, edge_pie_f, nodes_pie),
-            (f_bar + b_bar).cols(1).opts(title='Cred flow through Edges', shared_axes=True),
-            n_bar.opts(title='Cred flow through Nodes'),
+            *bars
         )
 
+    def _render_cred_flow_analysis(self):
+        df_nodes, df_edges = self.cred.get_cred_flow_from_graph()
+        
+        f_bar = hv.Bars(df_edges, 'index', ['forward', 'plugin']).opts(color='plugin',
+                                                                       cmap='Category10',
+                                                                       width=1000, height=300,
+                                                                       xrotation=45,
+                                                                       tools=['hover'],
+#                                                                        xlabel='Edges',
+                                                                       ylabel='Forward Cred Flow',
+                                                                       xaxis=None
+                                                                      )
+
+        b_bar = hv.Bars(df_edges, 'index', ['backward', 'plugin']).opts(color='plugin',
+                                                                        cmap='Category10',
+                                                                        width=1000, height=500,
+                                                                        xrotation=45,
+                                                                        tools=['hover'],
+                                                                        xlabel='Edges',
+                                                                        ylabel='Backward Cred Flow'
+                                                                       )
+        
+        n_bar = hv.Bars(df_nodes, 'index', ['weight', 'plugin']).opts(color='plugin',
+                                                                      cmap='Category10',
+                                                                      width=1000, height=500,
+                                                                      xrotation=45,
+                                                                      tools=['hover'],
+                                                                      xlabel='Nodes',
+                                                                      ylabel='Cred Flow'
+                                                                     )
+        
+        df_n_byplugin = df_nodes.groupby('plugin').sum()
+        df_e_byplugin = df_edges.groupby('plugin').sum()
 
+        bars = ((f_bar + b_bar).cols(1).opts(title='Cred flow through Edges', shared_axes=True),
+                n_bar.opts(title='Cred flow through Nodes'))
+        return bars, df_n_byplugin, df_e_byplugin
 
-tecred_dashboard = CredDashboard(cred)
+
+
+class WhatIfDashboard(param.Parameterized):
+    """
+    Recomputes cred with other node/edge type weights (see cred.whatif) in
+    a worker thread, and shows how the ranking moves
+    """
+
+    weight_type = param.ObjectSelector(default=None, objects=[], label='Node/Edge type')
+    forwards = param.Number(default=1., bounds=(0, None), label='Weight (forwards for edges)')
+    backwards = param.Number(default=1., bounds=(0, None), label='Backwards weight (edges only)')
+    set_weight = param.Action(lambda self: self.add_override(), label='Set weight')
+    reset_weights = param.Action(lambda self: self.clear_overrides(), label='Reset weights')
+    recompute = param.Action(lambda self: self.submit(), label='Recompute cred')
+    top_n = param.Integer(default=20, bounds=(5, 100), step=5, label='Show Top-')
+    overrides = param.Dict(default={}, precedence=-1)
+    status = param.String(default='Set some weights and recompute cred', precedence=-1)
+    ranking = param.DataFrame(default=None, precedence=-1)
+
+    def __init__(self, cred: CredData, executor: Executor, doc=None, trace: Trace = None, **params):
+        super(WhatIfDashboard, self).__init__(**params, name='What-if')
+        self.cred = cred
+        self.executor = executor
+        self.trace = trace
+        # results are handed over to the session document (if any) from the worker thread
+        self.doc = doc
+        self._future = None
+        # type label -> node/edge type prefix
+        self.types = dict()
+        for plugin in cred.graph_result['plugins']:
+            self.types.update({f"{plugin['name']} node: {nt['name']}": nt['prefix'] for nt in plugin['nodeTypes']})
+            self.types.update({f"{plugin['name']} edge: {et['forwardName']}": et['prefix'] for et in plugin['edgeTypes']})
+        self.param.weight_type.objects = list(self.types)
+        if self.types:
+            self.weight_type = next(iter(self.types))
+
+    @param.depends('weight_type', watch=True)
+    def show_weight(self):
+        prefix = self.types[self.weight_type]
+        weight = self.overrides.get(prefix)
+        if weight is None:
+            cred_result = self.cred.graph_result
+            if prefix.startswith('N'):
+                weight = node_type_weights([prefix], cred_result['nodeWeights'], cred_result['plugins'])[0]
+            else:
+                f, b = edge_type_weights([prefix], cred_result['edgeWeights'], cred_result['plugins'])
+                weight = {'forwards': f[0], 'backwards': b[0]}
+        if prefix.startswith('N'):
+            self.forwards = float(weight)
+        else:
+            self.forwards, self.backwards = float(weight['forwards']), float(weight['backwards'])
+
+    def add_override(self):
+        prefix = self.types[self.weight_type]
+        weight = self.forwards if prefix.startswith('N') else {'forwards': self.forwards, 'backwards': self.backwards}
+        self.overrides = dict(self.overrides, **{prefix: weight})
+
+    def clear_overrides(self):
+        self.overrides = {}
+        self.show_weight()
+
+    def submit(self):
+        if self._future is not None and not self._future.done():
+            return
+        node_weights = {p: w for p, w in self.overrides.items() if p.startswith('N')}
+        edge_weights = {p: w for p, w in self.overrides.items() if p.startswith('E')}
+        self.status = 'Recomputing cred...'
+        self._future = self.executor.submit(self.cred.get_what_if_ranking, node_weights, edge_weights)
+        self._future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future):
+        if self.doc is None:
+            self._show(future)
+        else:
+            self.doc.add_next_tick_callback(partial(self._show, future))
+
+    def _show(self, future: Future):
+        try:
+            df_what_if, run = future.result()
+        except Exception as e:
+            print(f'Error while recomputing cred: {e!r}')
+            self.status = f'Error while recomputing cred: {e}'
+            return
+        self.ranking = df_what_if
+        moved = int((df_what_if.rankDelta != 0).sum())
+        self.status = (f'{moved} users moved ({run.iterations} iterations in {run.seconds:.1f}s'
+                       + (')' if run.converged else ', not converged)'))
+
+    @param.depends('overrides')
+    def view_overrides(self):
+        labels = {prefix: label for label, prefix in self.types.items()}
+        lines = [f'- {labels.get(prefix, prefix)}: {weight}' for prefix, weight in self.overrides.items()]
+        return pn.pane.Markdown('\n'.join(lines) or 'Published weights')
+
+    @param.depends('status')
+    def view_status(self):
+        return pn.pane.Markdown(f'**{self.status}**')
+
+    @param.depends('ranking', 'top_n')
+    @timed(trace_attr='trace')
+    def view_ranking(self):
+        if self.ranking is None:
+            return pn.Spacer()
+        cols = ['whatIfRank', 'rankDelta', 'user', 'rank', 'totalCred', 'whatIfCred', 'whatIfShare']
+        return self.ranking.head(self.top_n)[cols].hvplot.table(title=f'Top-{self.top_n} Users by What-if Cred')
+
+
+def view_instance_comparison():
+    return pn.Column(*service.render_cache.get(('instance_comparison',) + registry.snapshot_keys(),
+                                               _render_instance_comparison))
+
+
+def _render_instance_comparison():
+    df_totals = registry.compare_totals()
+    df_overlap = registry.get_overlapping_contributors()
+    return (df_totals.reset_index().hvplot.table(title='Instances'),
+            registry.get_cred_over_time().hvplot.line(xlabel='Date', ylabel='Cred',
+                                                      title='Distributed Cred over time (weekly)'),
+            df_overlap.reset_index().head(100).hvplot.table(
+                title=f'Contributors in several instances ({len(df_overlap)})'))
+
+
+session_trace = None
+if TRACE_DIR and pn.state.curdoc is not None:
+    session_trace = Trace(name=pn.state.curdoc.session_context.id if pn.state.curdoc.session_context else None)
+    pn.state.curdoc.on_session_destroyed(
+        lambda context: session_trace.dump(os.path.join(TRACE_DIR, f'{context.id}.json')))
 
 # Filter & Refesh
-user_filter.param.watch(tecred_dashboard.set_user, ['options', 'value'], what='value', onlychanged=True)
 refresh_button = pn.widgets.Button(name='\u27f3', width=30, sizing_mode='fixed')
-refresh_button.on_click(lambda e: tecred_dashboard.set_user(None))
 
-react.sidebar.append(pn.panel(tecred_dashboard, parameters=['top_n']))
+react.sidebar.append(sidebar_slot)
 
-react.main[:2,2:10] = tecred_dashboard.view_cred_grain_over_time
-react.main[2:4, 4:8] = tecred_dashboard.view_distr_stats
+react.main[:2,2:10] = slots['view_cred_grain_over_time']
+react.main[2:4, 4:8] = slots['view_distr_stats']
 
 main_view = pn.GridSpec(sizing_mode='stretch_both')
-main_view[:2, :] = pn.Column(pn.Row(user_filter, refresh_button),
-                             tecred_dashboard.view_ranking
+main_view[:2, :] = pn.Column(pn.Row(user_search, refresh_button),
+                             slots['view_ranking']
                             )
-main_view[3:5, :] = pn.Row(tecred_dashboard.rank_table, tecred_dashboard.view_rank_ordered)
-
-react.main[4:,:] = pn.Tabs(("Cred Distribution", main_view),
-                           ("How Cred is Distributed?", pn.Row(tecred_dashboard.view_cred_flow_analysis)
-                           ),
-                           tabs_location='above', active=0
-                          )
+main_view[3:5, :] = pn.Row(slots['rank_table'], slots['view_rank_ordered'])
+
+tabs = pn.Tabs(("Cred Distribution", main_view),
+               ("How Cred is Distributed?", pn.Row(slots['view_cred_flow_analysis'])
+               ),
+               ("What-if Weights", what_if_slot
+               ),
+               tabs_location='above', active=0
+              )
+# tabs over the cred graph, loaded when one of them first opens if the
+# graph isn't loaded yet (see CredData.graph_result)
+graph_tabs = (1, 2)
+if len(registry) > 1:
+    tabs.append(("Compare Instances", comparison_slot))
+react.main[4:,:] = tabs
+
+
+# STEP 3: Loading data off the event loop, each panel showing up as soon as
+# its own data is ready
+cred = None
+tecred_dashboard = None
+what_if_dashboard = None
+graph_tabs_loaded = False
+
+
+def submit(fn) -> Future:
+    """
+    Runs `fn` in the loader threads. Without a server session (scripts,
+    notebooks, benchmarks) it runs inline, so the dashboard is fully loaded
+    once the script ends.
+    """
+    if doc is None:
+        future = Future()
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return loader.submit(fn)
+
+
+def on_main(callback):
+    """
+    Runs `callback` on the session's event loop
+    """
+    if doc is None:
+        callback()
+    else:
+        doc.add_next_tick_callback(callback)
+
+
+def show(slot: pn.Column, future: Future, *objects):
+    try:
+        future.result()
+    except Exception as e:
+        print(f'Error while loading the dashboard: {e!r}')
+        objects = (pn.pane.Markdown(f'**Error while loading the data:** {e}'),)
+    slot.objects = [pn.panel(obj) for obj in objects]
+
+
+def load_dashboards():
+    # every instance is loaded concurrently on first use
+    registry.load()
+    cred = service.cred
+    cred.user_search
+    return cred, CredDashboard(cred, render_cache=service.render_cache, trace=session_trace)
+
+
+def load_what_if():
+    return WhatIfDashboard(cred, get_executor('what-if', WHAT_IF_WORKERS), doc=doc, trace=session_trace)
+
+
+def show_what_if(future: Future):
+    global what_if_dashboard
+    try:
+        what_if_dashboard = future.result()
+    except Exception:
+        show(what_if_slot, future)
+        return
+    show(what_if_slot, future, pn.Row(pn.Column(pn.panel(what_if_dashboard,
+                                                         parameters=['weight_type', 'forwards', 'backwards',
+                                                                     'set_weight', 'reset_weights', 'recompute',
+                                                                     'top_n']),
+                                                what_if_dashboard.view_overrides),
+                                      pn.Column(what_if_dashboard.view_status,
+                                                what_if_dashboard.view_ranking)))
+
+
+def load_graph_tabs(event=None):
+    global graph_tabs_loaded
+    if graph_tabs_loaded or (event is not None and event.new not in graph_tabs):
+        return
+    graph_tabs_loaded = True
+    submit(lambda: cred.graph_result).add_done_callback(lambda f: on_main(partial(show_graph_tabs, f)))
+
+
+def show_graph_tabs(future: Future):
+    try:
+        future.result()
+    except LookupError as e:
+        # the instance doesn't publish its full graph
+        for slot in (slots['view_cred_flow_analysis'], what_if_slot):
+            slot.objects = [pn.pane.Markdown(f'**The cred graph is not available:** {e}')]
+        return
+    except Exception:
+        for slot in (slots['view_cred_flow_analysis'], what_if_slot):
+            show(slot, future)
+        return
+    slot, view = slots['view_cred_flow_analysis'], tecred_dashboard.view_cred_flow_analysis
+    submit(view).add_done_callback(lambda f: on_main(partial(show, slot, f, view)))
+    submit(load_what_if).add_done_callback(lambda f: on_main(partial(show_what_if, f)))
+
+
+def show_dashboards(future: Future):
+    global cred, tecred_dashboard
+    try:
+        cred, tecred_dashboard = future.result()
+    except Exception:
+        for slot in [sidebar_slot, what_if_slot, comparison_slot, *slots.values()]:
+            show(slot, future)
+        return
+
+    user_filter.param.watch(search_user, 'value_input')
+    user_filter.param.watch(enter_user, 'value')
+    user_matches.param.watch(pick_user, 'value')
+    refresh_button.on_click(lambda e: tecred_dashboard.set_user(None))
+    show(sidebar_slot, future, pn.panel(tecred_dashboard, parameters=['period', 'date_range', 'top_n']))
+
+    views = [(slots[name], getattr(tecred_dashboard, name)) for name in slots if name != 'view_cred_flow_analysis']
+    if len(registry) > 1:
+        views.append((comparison_slot, view_instance_comparison))
+    for slot, view in views:
+        # a first call computes the view's data (and fills the render
+        # cache) in the loader threads
+        submit(view).add_done_callback(lambda f, slot=slot, view=view: on_main(partial(show, slot, f, view)))
+    # a participants-only instance fetches its graph when a graph tab opens
+    if cred.has_graph or tabs.active in graph_tabs:
+        load_graph_tabs()
+    else:
+        tabs.param.watch(load_graph_tabs, 'active')
+
+
+def search_user(event):
+    # suggestions start from the second character typed
+    matches = cred.search_users(event.new, USER_SEARCH_RESULTS) if event.new and len(event.new) >= 2 else []
+    user_matches.options = matches
+    user_search.objects = [user_filter, user_matches] if matches else [user_filter]
+
+
+def enter_user(event):
+    # the text entered resolves to its best match
+    matches = cred.search_users(event.new, 1) if event.new else []
+    if matches and not user_filter.disabled:
+        user_matches.value = matches
+
+
+def pick_user(event):
+    if event.new:
+        tecred_dashboard.set_user(event.new[0])
+        user_filter.value = event.new[0]
+
+
+pn.state.onload(lambda: submit(load_dashboards).add_done_callback(lambda f: on_main(partial(show_dashboards, f))))
 
 react.servable();
\ No newline at end of file
@@ -0,0 +1,437 @@
+"""
+Times and memory-profiles the CredData entry points and the dashboard
+views on a synthetic instance (see benchmarks/synthetic.py).
+
+Before timing anything, the outputs of the entry points (in default and
+compact mode) are checked against the baseline implementation
+(benchmarks/baseline.py); the run stops on any difference. Each entry
+point runs on a fresh CredData, so the timings include every derived
+table it depends on. Results are saved under
+benchmarks/results/<size>/ with the commit they were measured on; use
+--compare to check them against the previous run of the same size.
+
+    python -m benchmarks.run --size medium --compare
+"""
+import argparse
+from datetime import datetime
+import functools
+import gc
+import http.server
+import json
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.baseline import CredData as BaselineCredData
+from benchmarks.synthetic import SIZES, generate
+from cred.cred_data import CredData
+from cred.utils.cache import RenderCache
+from cred.utils.columns import memory_report, same_values
+from cred.utils.io import stream_cred_result
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'benchmarks', '.data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+DEFAULT_THRESHOLD = 1.25
+# float columns may differ from the baseline by rounding (e.g. grain amounts
+# summed from exact integer limbs instead of parsed as floats)
+FLOAT_RTOL = 1e-9
+
+ENTRY_POINTS = {
+    'to_df': lambda cred: cred.to_df(),
+    'accounts': lambda cred: cred.accounts,
+    'get_user_ranking': lambda cred: cred.get_user_ranking(),
+    'get_grain_distribution': lambda cred: cred.get_grain_distribution(),
+    'get_cred_over_time': lambda cred: cred.get_cred_over_time(),
+    'get_cred_flow_from_graph': lambda cred: cred.get_cred_flow_from_graph(),
+    'get_what_if_ranking': lambda cred: cred.get_what_if_ranking(),
+    'search_users': lambda cred: cred.search_users('a'),
+}
+
+VIEWS = ['view_distr_stats', 'view_cred_grain_over_time', 'view_ranking',
+         'view_rank_ordered', 'rank_table', 'view_cred_flow_analysis']
+
+
+def measure(run: Callable[[], Any], setup: Callable[[], Any], repeat: int, memory: bool) -> Dict[str, Any]:
+    """
+    Times `run(setup())` `repeat` times, then traces its peak memory once
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    result = {
+        'min': min(times),
+        'median': statistics.median(times),
+        'repeat': repeat,
+        'peakBytes': None,
+    }
+    if memory:
+        state = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(state)
+            result['peakBytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def bench_cred_data(cred_filename: str, accounts_filename: str, repeat: int, memory: bool, compact: bool = False) -> Dict[str, Any]:
+    results = dict()
+
+    def stream(_):
+        with open(cred_filename, 'rb') as f:
+            return stream_cred_result(f)
+
+    results['load.stream_cred_result'] = measure(stream, lambda: None, repeat, memory)
+    cred_result = stream(None)
+    with open(accounts_filename, 'r') as f:
+        accounts_data = json.load(f)
+
+    def fresh():
+        return CredData(cred_result, accounts_data, compact=compact)
+
+    for name, entry_point in ENTRY_POINTS.items():
+        results[f'cred.{name}'] = measure(entry_point, fresh, repeat, memory)
+    results['cred.warm_up'] = measure(lambda cred: cred.warm_up(), fresh, repeat, memory)
+    return results
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_dashboard(instance_dir: str, work_dir: str) -> Dict[str, Any]:
+    """
+    Runs app/dashboard.py against a local HTTP server serving the synthetic
+    instance, from `work_dir`, and returns its globals
+    """
+    handler = functools.partial(_QuietHandler, directory=instance_dir)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['CRED_BASE_URI'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['CRED_REFRESH_INTERVAL'] = '0'
+    os.makedirs(work_dir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        return runpy.run_path(os.path.join(ROOT, 'app', 'dashboard.py'), run_name='dashboard')
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+
+def bench_dashboard(instance_dir: str, work_dir: str, repeat: int, memory: bool) -> Dict[str, Any]:
+    import holoviews as hv
+    import panel as pn
+
+    dashboard = load_dashboard(instance_dir, work_dir)
+    cred = dashboard['cred']
+    cred.warm_up()
+    users = cred.get_user_ranking().user.to_list()
+    scenarios = {
+        'default': dict(),
+        'top_n': dict(top_n=50),
+        'user': dict(user=users[len(users) // 2]),
+        'period': dict(period='Last month'),
+    }
+
+    def render(view: Callable[[], Any]):
+        obj = view()
+        if isinstance(obj, hv.core.Dimensioned):
+            return hv.render(obj)
+        return pn.panel(obj).get_root()
+
+    results = dict()
+    for scenario, params in scenarios.items():
+        for name in VIEWS:
+            def setup():
+                # no caching: every run renders the view
+                d = dashboard['CredDashboard'](cred, render_cache=RenderCache(0))
+                d.param.set_param(**params)
+                return getattr(d, name)
+
+            results[f'dashboard.{scenario}.{name}'] = measure(render, setup, repeat, memory)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+def previous_results(size_dir: str, exclude: str = None) -> Optional[Dict[str, Any]]:
+    if not os.path.isdir(size_dir):
+        return None
+    names = sorted(n for n in os.listdir(size_dir) if n.endswith('.json') and n != exclude)
+    if not names:
+        return None
+    with open(os.path.join(size_dir, names[-1])) as f:
+        return json.load(f)
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Prints the median time ratio of every case against `previous` and
+    returns the cases slower than `threshold`
+    """
+    print(f'\nCompared with {previous["commit"]} ({previous["date"]}):')
+    regressions = []
+    for case, result in current['results'].items():
+        if case not in previous['results']:
+            continue
+        ratio = result['median'] / previous['results'][case]['median']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(case)
+            flag = '  <-- slower'
+        print(f'  {case:55s} {ratio:6.2f}x{flag}')
+    return regressions
+
+
+def compact_mismatches(cred: CredData, compact: CredData) -> List[str]:
+    """
+    Columns of the node, account and ranking tables of the `compact`
+    CredData that do not hold the values of the default one
+    """
+    tables = {
+        'nodes': (cred.node_columns, compact.node_columns),
+        'df': (cred.to_df(), compact.to_df()),
+        'df_accounts': (cred.accounts, compact.accounts),
+        'df_rank': (cred.get_user_ranking(), compact.get_user_ranking()),
+    }
+    return [f'{table}.{name}' for table, (columns, compact_columns) in tables.items()
+            for name in compact_columns if not same_values(compact_columns[name], columns[name])]
+
+
+def same_list(expected: List[Any], actual: Any) -> bool:
+    if len(expected) != len(actual):
+        return False
+    try:
+        return bool(np.allclose(expected, actual, rtol=FLOAT_RTOL))
+    except TypeError:
+        # e.g. the aliases and allocation histories of accounts
+        return list(expected) == list(actual)
+
+
+def same_column(expected: Any, actual: Any) -> bool:
+    """
+    Whether two columns hold the same values, floats up to FLOAT_RTOL
+    """
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    if expected.shape != actual.shape:
+        return False
+    if expected.dtype == object and len(expected) and isinstance(expected[0], list):
+        # e.g. credOverTime
+        return all(same_list(e, a) for e, a in zip(expected, actual))
+    if expected.dtype.kind == 'M' and actual.dtype.kind == 'M':
+        # the baseline converts ms timestamps to ns through floats when some
+        # are missing, which is off by up to a few hundred ns
+        missing = pd.isna(expected)
+        error = expected[~missing].astype(np.int64) - actual[~missing].astype(np.int64)
+        return bool((missing == pd.isna(actual)).all() and np.abs(error).max(initial=0) < 1000)
+    if expected.dtype.kind == 'f' or actual.dtype.kind == 'f':
+        return np.allclose(expected.astype(float), actual.astype(float), rtol=FLOAT_RTOL, equal_nan=True)
+    return same_values(expected, actual)
+
+
+def frame_mismatches(name: str, expected: pd.DataFrame, actual: pd.DataFrame) -> List[str]:
+    """
+    Columns (and index) of `actual` that differ from those of `expected`
+    """
+    if list(actual.columns) != list(expected.columns) or len(actual) != len(expected):
+        return [f'{name} ({len(actual)} rows of {list(actual.columns)} instead of '
+                f'{len(expected)} rows of {list(expected.columns)})']
+    mismatches = [f'{name}.{column}' for column in expected if not same_column(expected[column], actual[column])]
+    if not same_column(expected.index, actual.index):
+        mismatches.append(f'{name}.index')
+    return mismatches
+
+
+def node_table(cred: CredData) -> pd.DataFrame:
+    """
+    to_df() in the schema of the baseline: with the columns compact mode
+    leaves out and the credOverTime lists
+    """
+    df = cred.to_df()
+    lazy = [name for name in cred.node_columns if name not in df]
+    if lazy:
+        positions = df.index.to_numpy()
+        df = df.assign(**{name: cred.node_columns[name][positions] for name in lazy})[list(cred.node_columns)]
+    return cred.with_cred_over_time(df)
+
+
+def grain_rows(df_grain: pd.DataFrame) -> pd.DataFrame:
+    # receipts are ordered by cred timestamp within each account now, as
+    # given in the allocation histories before
+    return df_grain.sort_values(['credTimestampMs', 'amount'], kind='mergesort').reset_index(drop=True)
+
+
+def baseline_mismatches(cred_filename: str, accounts_filename: str) -> List[str]:
+    """
+    Tables returned by the entry points, in default and compact mode, that
+    differ from those of the baseline implementation
+    """
+    with open(cred_filename, 'r') as f:
+        baseline_result = json.load(f)
+    with open(cred_filename, 'rb') as f:
+        cred_result = stream_cred_result(f)
+    with open(accounts_filename, 'r') as f:
+        accounts_data = json.load(f)
+
+    def outputs(cred: Any, df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        df_nflow, df_eflow = cred.get_cred_flow_from_graph()
+        df_rank = cred.get_user_ranking()
+        return {
+            'to_df': df,
+            'accounts': cred.accounts,
+            'get_user_ranking': df_rank if 'credOverTime' in df_rank else cred.with_cred_over_time(df_rank),
+            'get_grain_distribution': grain_rows(cred.get_grain_distribution()),
+            'get_cred_over_time': cred.get_cred_over_time(),
+            'get_cred_flow_from_graph.nodes': df_nflow,
+            'get_cred_flow_from_graph.edges': df_eflow,
+        }
+
+    baseline = BaselineCredData(baseline_result, accounts_data)
+    expected = outputs(baseline, baseline.to_df())
+    mismatches = []
+    for compact in (False, True):
+        cred = CredData(cred_result, accounts_data, compact=compact)
+        actual = outputs(cred, node_table(cred))
+        mode = 'compact' if compact else 'default'
+        for name, df in expected.items():
+            mismatches.extend(f'{m} ({mode})' for m in frame_mismatches(name, df, actual[name]))
+    return mismatches
+
+
+def report_memory(cred_filename: str, accounts_filename: str) -> List[str]:
+    """
+    Prints the bytes per column of the node, account and ranking tables,
+    before (default) and after (compact mode, see CredData), and returns
+    the compact columns that differ from the default ones
+    """
+    with open(cred_filename, 'rb') as f:
+        cred_result = stream_cred_result(f)
+    with open(accounts_filename, 'r') as f:
+        accounts_data = json.load(f)
+    cred = CredData(cred_result, accounts_data)
+    compact = CredData(cred_result, accounts_data, compact=True)
+    df = memory_report(cred.memory_usage(), compact.memory_usage())
+    print(f'\n  {"table":12s} {"column":28s} {"before":>10s} {"after":>10s} {"ratio":>6s}')
+    for (table, column), row in df.iterrows():
+        print(f'  {table:12s} {column:28s} {row.before / 2**20:8.2f}MB {row.after / 2**20:8.2f}MB {row.ratio:6.2f}')
+    mismatches = compact_mismatches(cred, compact)
+    if mismatches:
+        print(f'\nCompact columns differing from the default ones: {", ".join(mismatches)}')
+    return mismatches
+
+
+def report(results: Dict[str, Any]):
+    print(f'\n  {"case":55s} {"median":>10s} {"min":>10s} {"peak":>10s}')
+    for case, result in results.items():
+        peak = '' if result['peakBytes'] is None else f'{result["peakBytes"] / 2**20:.1f}MB'
+        print(f'  {case:55s} {result["median"] * 1000:8.1f}ms {result["min"] * 1000:8.1f}ms {peak:>10s}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--nodes', type=int, help='overrides the number of nodes of --size')
+    parser.add_argument('--intervals', type=int, help='overrides the number of intervals of --size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--no-dashboard', action='store_true', help='skip the dashboard views')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compact', action='store_true', help='benchmark CredData in compact mode')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='only print the bytes per column of the default and compact modes')
+    parser.add_argument('--no-check', action='store_true',
+                        help='skip checking the outputs against the baseline implementation (slow on large sizes)')
+    parser.add_argument('--compare', action='store_true', help='compare with the previous saved run')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    n_nodes, n_intervals = SIZES[args.size]
+    n_nodes = args.nodes or n_nodes
+    n_intervals = args.intervals or n_intervals
+    name = f'{n_nodes}x{n_intervals}-{args.seed}'
+    instance_dir = os.path.join(DATA_DIR, name)
+    output_dir = os.path.join(instance_dir, 'output')
+    cred_filename = os.path.join(output_dir, 'credResult.json')
+    accounts_filename = os.path.join(output_dir, 'accounts.json')
+    if not (os.path.exists(cred_filename) and os.path.exists(accounts_filename)):
+        print(f'Generating a synthetic instance of {n_nodes} nodes and {n_intervals} intervals')
+        generate(output_dir, n_nodes, n_intervals, seed=args.seed)
+
+    if args.memory_report:
+        if report_memory(cred_filename, accounts_filename):
+            sys.exit(1)
+        return
+
+    if not args.no_check:
+        mismatches = baseline_mismatches(cred_filename, accounts_filename)
+        if mismatches:
+            print(f'Outputs differing from the baseline implementation: {", ".join(mismatches)}')
+            sys.exit(1)
+        print('Outputs match the baseline implementation (default and compact mode)')
+
+    memory = not args.no_memory
+    results = bench_cred_data(cred_filename, accounts_filename, args.repeat, memory, args.compact)
+    if not args.no_dashboard:
+        results.update(bench_dashboard(instance_dir, os.path.join(DATA_DIR, f'{name}.run'), args.repeat, memory))
+    report(results)
+
+    current = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'nodes': n_nodes,
+        'intervals': n_intervals,
+        'seed': args.seed,
+        'compact': args.compact,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'results': results,
+    }
+    size_dir = os.path.join(RESULTS_DIR, name)
+    filename = f'{current["date"].replace(":", "")}-{current["commit"]}.json'
+    if not args.no_save:
+        os.makedirs(size_dir, exist_ok=True)
+        with open(os.path.join(size_dir, filename), 'w') as f:
+            json.dump(current, f, indent=1)
+        print(f'\nSaved {os.path.join(size_dir, filename)}')
+
+    if args.compare:
+        previous = previous_results(size_dir, exclude=filename)
+        if previous is None:
+            print('\nNo previous run to compare with')
+        elif compare(current, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
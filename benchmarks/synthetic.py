@@ -0,0 +1,379 @@
+"""
+Synthetic SourceCred instance data.
+
+Writes a credResult.json (TimelineCred format) and an accounts.json with
+the same shape as the files published by a sourcecred instance, streaming
+them chunk by chunk so that instances of up to ~10M nodes can be generated
+without holding the JSON tree in memory.
+
+    python -m benchmarks.synthetic --nodes 100000 --intervals 100 data/synthetic
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict, Iterable, List, TextIO, Tuple
+
+import numpy as np
+
+WEEK_MS = 7 * 24 * 3600 * 1000
+START_MS = 1577836800000  # 2020-01-01
+CHUNK_SIZE = 50000
+
+# name -> (node types with their share of the plugin nodes, edge types)
+PLUGINS = {
+    'discourse': ({'TOPIC': .15, 'POST': .6, 'LIKE': .25},
+                  ['AUTHORS', 'TOPIC_CONTAINS_POST', 'REPLY', 'LIKES', 'REFERENCES_POST']),
+    'discord': ({'MESSAGE': .8, 'REACTION': .2},
+                ['AUTHORS_MESSAGE', 'ADDS_REACTION', 'REACTS_TO', 'MENTIONS']),
+    'github': ({'REPO': .01, 'ISSUE': .15, 'PULL': .15, 'REVIEW': .1, 'COMMENT': .44, 'COMMIT': .15},
+               ['AUTHORS', 'HAS_PARENT', 'MERGED_AS', 'REFERENCES', 'REACTS_HEART']),
+    'initiatives': ({'INITIATIVE': .3, 'CONTRIBUTION': .7},
+                    ['CHAMPIONS', 'CONTRIBUTES_TO', 'DEPENDS_ON']),
+}
+# share of the non-identity nodes per plugin
+PLUGIN_SHARES = {'discourse': .35, 'discord': .4, 'github': .2, 'initiatives': .05}
+
+# name, nodes, intervals
+SIZES = {
+    'small': (1000, 10),
+    'medium': (100000, 100),
+    'large': (1000000, 500),
+    'xlarge': (10000000, 1000),
+}
+
+
+def _node_prefix(source: str, node_type: str) -> str:
+    return f'N\x00sourcecred\x00{source}\x00{node_type}\x00'
+
+
+def _edge_prefix(source: str, edge_type: str) -> str:
+    return f'E\x00sourcecred\x00{source}\x00{edge_type}\x00'
+
+
+def _write_json_array(f: TextIO, chunks: Iterable[List[Any]]):
+    """
+    Writes a JSON array from a stream of lists
+    """
+    f.write('[')
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not first:
+            f.write(',')
+        f.write(json.dumps(chunk)[1:-1])
+        first = False
+    f.write(']')
+
+
+def _write_json_object(f: TextIO, chunks: Iterable[Dict[str, Any]]):
+    """
+    Writes a JSON object from a stream of dicts
+    """
+    f.write('{')
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not first:
+            f.write(',')
+        f.write(json.dumps(chunk)[1:-1])
+        first = False
+    f.write('}')
+
+
+class SyntheticInstance():
+    """
+    Layout of a synthetic instance: sorted node groups, identities and
+    their cred over time. Everything else is generated chunk by chunk from
+    seeded generators, so the output only depends on the parameters.
+    """
+
+    def __init__(self,
+                 n_nodes: int,
+                 n_intervals: int,
+                 n_users: int = None,
+                 edges_per_node: float = 3.,
+                 over_time_share: float = .02,
+                 max_recipients: int = 200,
+                 seed: int = 0):
+        if n_users is None:
+            n_users = max(10, min(n_nodes // 200, 20000))
+        if n_users > n_nodes:
+            raise ValueError('n_users must not exceed n_nodes')
+        self.n_nodes = n_nodes
+        self.n_intervals = n_intervals
+        self.n_users = n_users
+        self.n_edges = int(n_nodes * edges_per_node)
+        self.over_time_share = over_time_share
+        self.max_recipients = max_recipients
+        self.seed = seed
+        self.intervals = [{'startTimeMs': START_MS + k * WEEK_MS, 'endTimeMs': START_MS + (k + 1) * WEEK_MS}
+                          for k in range(n_intervals)]
+
+        rng = self._rng('layout')
+        # (source, node type, count), sorted like the node addresses
+        n_content = n_nodes - n_users
+        plugin_counts = rng.multinomial(n_content, list(PLUGIN_SHARES.values()))
+        groups = [('core', 'IDENTITY', n_users)]
+        for (plugin, count) in zip(PLUGIN_SHARES, plugin_counts):
+            node_types = PLUGINS[plugin][0]
+            for node_type, type_count in zip(node_types, rng.multinomial(count, list(node_types.values()))):
+                groups.append((plugin, node_type, int(type_count)))
+        self.groups = sorted(groups, key=lambda g: _node_prefix(g[0], g[1]))
+        self.group_starts = np.cumsum([0] + [g[2] for g in self.groups])
+        identity_group = [g[1] for g in self.groups].index('IDENTITY')
+        self.identity_start = int(self.group_starts[identity_group])
+
+        # identities: a heavy-tailed intensity over an activity window
+        self.identity_cred = np.zeros((n_users, n_intervals))
+        intensity = rng.lognormal(0., 1.5, n_users)
+        first = rng.integers(0, n_intervals, n_users)
+        length = rng.geometric(1 / max(2, n_intervals / 4), n_users)
+        t = np.arange(n_intervals)
+        for u in range(n_users):
+            active = (t >= first[u]) & (t < first[u] + length[u])
+            decay = np.where(t >= first[u] + length[u], .7 ** (t - first[u] - length[u] + 1), 0.)
+            self.identity_cred[u] = intensity[u] * (active * rng.gamma(2., .5, n_intervals) + decay)
+
+    def _rng(self, *key: Any) -> np.random.Generator:
+        entropy = [self.seed] + [int.from_bytes(str(k).encode(), 'little') % 2 ** 32 for k in key]
+        return np.random.default_rng(entropy)
+
+    def _chunks(self) -> Iterable[Tuple[int, int]]:
+        for start in range(0, self.n_nodes, CHUNK_SIZE):
+            yield start, min(start + CHUNK_SIZE, self.n_nodes)
+
+    def _group_of(self, start: int, stop: int) -> np.ndarray:
+        return np.searchsorted(self.group_starts, np.arange(start, stop), side='right') - 1
+
+    def node_address(self, i: int) -> List[str]:
+        g = np.searchsorted(self.group_starts, i, side='right') - 1
+        source, node_type, _ = self.groups[g]
+        return ['sourcecred', source, node_type, self.node_id(i)]
+
+    def node_id(self, i: int) -> str:
+        return f'{i:012x}'
+
+    def user_name(self, u: int) -> str:
+        return f'user-{u:05d}'
+
+    def addresses(self) -> Iterable[List[List[str]]]:
+        for start, stop in self._chunks():
+            groups = self._group_of(start, stop)
+            yield [['sourcecred', self.groups[g][0], self.groups[g][1], self.node_id(i)]
+                   for i, g in zip(range(start, stop), groups)]
+
+    def _chunk_data(self, start: int, stop: int, with_over_time: bool = True) -> Dict[str, Any]:
+        """
+        Timestamps and cred over time of the nodes in [start, stop)
+        """
+        rng = self._rng('nodes', start)
+        n = stop - start
+        T = self.n_intervals
+        index = np.arange(start, stop)
+        is_identity = (index >= self.identity_start) & (index < self.identity_start + self.n_users)
+        interval = rng.integers(0, T, n)
+        timestamp = START_MS + interval * WEEK_MS + rng.integers(0, WEEK_MS, n)
+        has_over_time = is_identity | (rng.random(n) < self.over_time_share)
+        amplitude = rng.exponential(.05, n)
+        summary = np.where(has_over_time, 0., rng.exponential(.01, n))
+
+        over_time = [None] * n
+        for k in np.flatnonzero(has_over_time) if with_over_time else ():
+            if is_identity[k]:
+                cred = self.identity_cred[index[k] - self.identity_start]
+            else:
+                # contributions earn most of their cred right after they happen
+                t = np.arange(T) - interval[k]
+                cred = np.where(t >= 0, amplitude[k] * .5 ** np.maximum(t, 0), 0.)
+            over_time[k] = cred.tolist()
+        return {
+            'is_identity': is_identity,
+            'timestamp': timestamp,
+            'over_time': over_time,
+            'summary': summary,
+        }
+
+    def write_cred_result(self, filename: str):
+        zeros = [0.] * self.n_intervals
+        plugin_declarations = []
+        for plugin, (node_types, edge_types) in sorted(PLUGINS.items()):
+            plugin_declarations.append({
+                'name': plugin,
+                'nodePrefix': f'N\x00sourcecred\x00{plugin}\x00',
+                'edgePrefix': f'E\x00sourcecred\x00{plugin}\x00',
+                'nodeTypes': [{'name': t.title(), 'pluralName': f'{t.title()}s', 'prefix': _node_prefix(plugin, t),
+                               'defaultWeight': 1., 'description': f'A {plugin} {t.lower()}'} for t in node_types],
+                'edgeTypes': [{'forwardName': t.lower(), 'backwardName': f'is {t.lower()} by',
+                               'prefix': _edge_prefix(plugin, t),
+                               'defaultWeight': {'forwards': 1., 'backwards': 1.},
+                               'description': f'A {plugin} {t.lower()} edge'} for t in edge_types],
+                'userTypes': [],
+            })
+
+        def nodes():
+            for start, stop in self._chunks():
+                data = self._chunk_data(start, stop, with_over_time=False)
+                groups = self._group_of(start, stop)
+                chunk = []
+                for k, i in enumerate(range(start, stop)):
+                    if data['is_identity'][k]:
+                        chunk.append({'index': i, 'description': self.user_name(i - self.identity_start),
+                                      'timestampMs': None})
+                    else:
+                        source, node_type, _ = self.groups[groups[k]]
+                        chunk.append({'index': i, 'description': f'[{source}] {node_type.lower()} #{i}',
+                                      'timestampMs': int(data['timestamp'][k])})
+                yield chunk
+
+        def edges():
+            rng = self._rng('edges')
+            plugins = sorted(PLUGINS)
+            for start in range(0, self.n_edges, CHUNK_SIZE):
+                n = min(CHUNK_SIZE, self.n_edges - start)
+                plugin = rng.integers(0, len(plugins), n)
+                edge_type = rng.integers(0, 1 << 16, n)
+                # a third of the edges start at an identity (authorship)
+                from_identity = rng.random(n) < 1 / 3
+                src = np.where(from_identity,
+                               self.identity_start + rng.integers(0, self.n_users, n),
+                               rng.integers(0, self.n_nodes, n))
+                dst = rng.integers(0, self.n_nodes, n)
+                timestamp = START_MS + rng.integers(0, self.n_intervals * WEEK_MS, n)
+                chunk = []
+                for k in range(n):
+                    source = plugins[plugin[k]]
+                    edge_types = PLUGINS[source][1]
+                    chunk.append({'address': ['sourcecred', source, edge_types[edge_type[k] % len(edge_types)],
+                                              f'{start + k:012x}'],
+                                  'srcIndex': int(src[k]), 'dstIndex': int(dst[k]),
+                                  'timestampMs': int(timestamp[k])})
+                yield chunk
+
+        def node_summaries():
+            for start, stop in self._chunks():
+                data = self._chunk_data(start, stop)
+                yield [{'cred': sum(ot) if ot is not None else float(s), 'seedFlow': 0., 'syntheticLoopFlow': 0.}
+                       for ot, s in zip(data['over_time'], data['summary'])]
+
+        def node_over_time():
+            for start, stop in self._chunks():
+                data = self._chunk_data(start, stop)
+                yield [None if ot is None else {'cred': ot, 'seedFlow': zeros, 'syntheticLoopFlow': zeros}
+                       for ot in data['over_time']]
+
+        def node_weights():
+            yield {_node_prefix(plugin, t): 1. for plugin, (node_types, _) in PLUGINS.items() for t in node_types}
+            # a few hand-tuned nodes, like the initiatives of a real instance
+            rng = self._rng('node weights')
+            overrides = rng.choice(self.n_nodes, min(self.n_nodes // 100, 100000), replace=False)
+            yield {'N\x00' + '\x00'.join(self.node_address(int(i))) + '\x00': float(w)
+                   for i, w in zip(overrides, rng.choice([0., .5, 2., 4.], len(overrides)))}
+
+        def edge_weights():
+            yield {_edge_prefix(plugin, t): {'forwards': 1., 'backwards': 1. / 16}
+                   for plugin, (_, edge_types) in PLUGINS.items() for t in edge_types}
+
+        with open(filename, 'w') as f:
+            f.write('[{"type":"sourcecred/credResult","version":"0.2.0"},{"weightedGraph":'
+                    '[{"type":"sourcecred/weightedGraph","version":"0.1.0"},{"graphJSON":'
+                    '[{"type":"sourcecred/graph","version":"0.8.0"},{"sortedNodeAddresses":')
+            _write_json_array(f, self.addresses())
+            f.write(',"nodes":')
+            _write_json_array(f, nodes())
+            f.write(',"edges":')
+            _write_json_array(f, edges())
+            f.write('}],"weightsJSON":[{"type":"sourcecred/weights","version":"0.2.0"},{"nodeWeights":')
+            _write_json_object(f, node_weights())
+            f.write(',"edgeWeights":')
+            _write_json_object(f, edge_weights())
+            f.write('}]}],"credData":{"intervals":')
+            f.write(json.dumps(self.intervals))
+            f.write(',"nodeSummaries":')
+            _write_json_array(f, node_summaries())
+            f.write(',"nodeOverTime":')
+            _write_json_array(f, node_over_time())
+            f.write(',"edgeSummaries":[],"edgeOverTime":[]},"params":{"alpha":0.2,"intervalDecay":0.5},'
+                    '"plugins":[{"type":"sourcecred/pluginDeclarations","version":"0.1.0"},')
+            f.write(json.dumps(plugin_declarations))
+            f.write(']}]')
+
+    def write_accounts(self, filename: str, budget: float = 10000.):
+        """
+        Every interval, `budget` grain is allocated to the Top
+        `max_recipients` identities of the interval, proportionally to
+        their cred (an IMMEDIATE policy)
+        """
+        rng = self._rng('accounts')
+        history = [[] for _ in range(self.n_users)]
+        paid = np.zeros(self.n_users, dtype=object)
+        for t, interval in enumerate(self.intervals):
+            cred = self.identity_cred[:, t]
+            recipients = np.flatnonzero(cred)
+            if len(recipients) > self.max_recipients:
+                recipients = recipients[np.argpartition(cred[recipients], -self.max_recipients)[-self.max_recipients:]]
+            if len(recipients) == 0:
+                continue
+            amounts = budget * cred[recipients] / cred[recipients].sum()
+            allocation_id = f'{t:08x}-{self.seed:04x}-allocation'
+            for u, amount in zip(recipients, amounts):
+                wei = int(amount * 1e6) * 10 ** 12
+                history[u].append({'grainReceipt': {'id': self.node_id(self.identity_start + int(u)), 'amount': str(wei)},
+                                   'allocationId': allocation_id,
+                                   'credTimestampMs': interval['endTimeMs']})
+                paid[u] += wei
+
+        spent = rng.random(self.n_users)
+        subtype = rng.choice(['USER', 'USER', 'USER', 'BOT', 'ORGANIZATION'], self.n_users)
+        accounts = []
+        for u in range(self.n_users):
+            identity_id = self.node_id(self.identity_start + u)
+            account = {
+                'identity': {'id': identity_id,
+                             'name': self.user_name(u),
+                             'subtype': str(subtype[u]),
+                             'address': f'N\x00sourcecred\x00core\x00IDENTITY\x00{identity_id}\x00',
+                             'aliases': []},
+                'balance': str(int(paid[u] * spent[u])),
+                'paid': str(paid[u]),
+                'active': bool(history[u]) or bool(rng.random() < .2),
+            }
+            if history[u]:
+                account['allocationHistory'] = history[u]
+            accounts.append({'account': account, 'cred': self.identity_cred[u].tolist(),
+                             'totalCred': float(self.identity_cred[u].sum())})
+        with open(filename, 'w') as f:
+            json.dump({'accounts': accounts, 'unclaimedAliases': []}, f)
+
+
+def generate(directory: str, n_nodes: int, n_intervals: int, **kwargs) -> Tuple[str, str]:
+    """
+    Writes credResult.json and accounts.json for a synthetic instance under
+    `directory`. Returns their filenames.
+    """
+    os.makedirs(directory, exist_ok=True)
+    instance = SyntheticInstance(n_nodes, n_intervals, **kwargs)
+    cred_filename = os.path.join(directory, 'credResult.json')
+    accounts_filename = os.path.join(directory, 'accounts.json')
+    instance.write_cred_result(cred_filename)
+    instance.write_accounts(accounts_filename)
+    return cred_filename, accounts_filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--size', choices=SIZES, help='preset number of nodes and intervals')
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--intervals', type=int, default=10)
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    n_nodes, n_intervals = SIZES[args.size] if args.size else (args.nodes, args.intervals)
+    for filename in generate(args.directory, n_nodes, n_intervals, n_users=args.users, seed=args.seed):
+        print(f'{filename}: {os.path.getsize(filename) / 2**20:.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
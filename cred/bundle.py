@@ -0,0 +1,162 @@
+"""
+Offline precompute of the dashboard data.
+
+Fetches (or reads) the cred output (credResult.json, or another format of
+cred.parsers with --format) and accounts.json files of an instance,
+derives every CredData table once and writes them as a snapshot (see
+cred.snapshot: ranking table, cred matrix, plugin flow tables, grain
+ledger and history, user index...) under the bundle directory. The
+`HEAD` file of the directory is a small binary header naming the latest
+complete snapshot, with the snapshot format version and a generation
+counter bumped on every new snapshot, so web workers can load it without
+parsing JSON or deriving anything (the dashboard reads the bundle of each
+instance from a subdirectory named after it):
+
+    python -m cred.bundle --base-uri https://raw.githubusercontent.com/TECommons/tec-sourcecred/gh-pages --output data/bundle/tec
+    CRED_BUNDLE_DIR=data/bundle panel serve app/dashboard.py
+
+Run it after each sourcecred run, or keep it running with --watch; the
+previous bundle is used to update the new one incrementally.
+
+Bundles are always stored in compact mode (see CredData): the node texts
+and repeated strings are kept in buffers and categorical codes instead of
+pickled objects, so that several dashboard workers on the same host share
+them. The bundle arrays are memory-mapped read-only, held once in the page
+cache (or in RAM, with the bundle under /dev/shm) whatever the number of
+workers, and each worker swaps in a new snapshot as soon as it sees the
+generation change.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+from typing import Optional, Tuple
+
+from cred.cred_data import CredData
+from cred.parsers import PARSERS, get_parser
+from cred.snapshot import SNAPSHOT_VERSION, load_cred_data, load_snapshot
+from cred.utils.io import fetch_file
+from cred.utils.metrics import timed
+
+HEAD = 'HEAD'
+HEAD_MAGIC = b'CRED'
+# magic, snapshot format version, generation, snapshot key
+HEAD_FORMAT = struct.Struct('<4sIQ40s')
+
+
+def read_head(directory: str) -> Optional[Tuple[int, str]]:
+    """
+    (generation, snapshot key) of the current bundle in `directory`, None
+    if there is none or it is in another snapshot format version
+    """
+    try:
+        with open(os.path.join(directory, HEAD), 'rb') as f:
+            magic, version, generation, key = HEAD_FORMAT.unpack(f.read(HEAD_FORMAT.size))
+    except (OSError, struct.error):
+        return None
+    if magic != HEAD_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    return generation, key.rstrip(b'\x00').decode('ascii')
+
+
+def bundle_key(directory: str) -> Optional[str]:
+    """
+    Snapshot key of the current bundle in `directory`, None if there is none
+    """
+    head = read_head(directory)
+    return head[1] if head is not None else None
+
+
+def _set_current(directory: str, key: str) -> int:
+    """
+    Makes `key` the current bundle under the next generation, and returns it
+    """
+    head = read_head(directory)
+    generation = head[0] + 1 if head is not None else 1
+    tmp = os.path.join(directory, f'.{HEAD}.{os.getpid()}')
+    with open(tmp, 'wb') as f:
+        f.write(HEAD_FORMAT.pack(HEAD_MAGIC, SNAPSHOT_VERSION, generation, key.encode('ascii')))
+    os.replace(tmp, os.path.join(directory, HEAD))
+    return generation
+
+
+@timed()
+def load_bundle(directory: str, verify: bool = False, key: str = None) -> Optional[CredData]:
+    """
+    CredData of the current bundle in `directory` (or of its snapshot
+    `key`), memory-mapped read-only. The checksums are only verified with
+    `verify`: the bundle was complete when it was published. Snapshots
+    that fail to load are left to the process publishing them.
+    """
+    key = key or bundle_key(directory)
+    if key is None:
+        return None
+    return load_snapshot(key, directory, verify=verify, compact=True, discard=False)
+
+
+@timed()
+def build_bundle(cred_filename: str,
+                 accounts_filename: str,
+                 directory: str,
+                 verify: bool = False,
+                 cred_format: str = None) -> CredData:
+    """
+    Derives the compact CredData of the given files into `directory` and
+    makes it the current bundle (under a new generation when it changed)
+    """
+    previous = load_bundle(directory)
+    cred = load_cred_data(cred_filename, accounts_filename, directory, previous=previous, verify=verify, compact=True,
+                          cred_format=cred_format)
+    if previous is None or cred.snapshot_key != previous.snapshot_key:
+        _set_current(directory, cred.snapshot_key)
+    return cred
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--base-uri', help='sourcecred instance to fetch the cred output and output/accounts.json from')
+    source.add_argument('--cred-file', help='local cred output, e.g. credResult.json (with --accounts-file)')
+    parser.add_argument('--accounts-file', help='local accounts.json')
+    parser.add_argument('--data-dir', default='data', help='where fetched files are kept (with --base-uri)')
+    parser.add_argument('--output', default='data/bundle', help='bundle directory')
+    parser.add_argument('--verify', action='store_true', help='check incremental updates against a full rebuild')
+    parser.add_argument('--format', default='timeline', choices=list(PARSERS),
+                        help='cred output parsed: credResult.json (timeline) or credGrainView.json (participants)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='keep running, publishing a new bundle generation whenever the files change')
+    args = parser.parse_args()
+
+    if args.base_uri:
+        cred_name = get_parser(args.format).filename
+        cred_filename = os.path.join(args.data_dir, cred_name)
+        accounts_filename = os.path.join(args.data_dir, 'accounts.json')
+        os.makedirs(args.data_dir, exist_ok=True)
+    else:
+        if not args.accounts_file:
+            parser.error('--cred-file requires --accounts-file')
+        cred_filename, accounts_filename = args.cred_file, args.accounts_file
+
+    while True:
+        if args.base_uri:
+            for name, filename in ((cred_name, cred_filename), ('accounts.json', accounts_filename)):
+                if not fetch_file(f'{args.base_uri}/output/{name}', filename):
+                    if not args.watch:
+                        sys.exit(1)
+        start = time.perf_counter()
+        try:
+            cred = build_bundle(cred_filename, accounts_filename, args.output, verify=args.verify, cred_format=args.format)
+            print(f'Bundle {cred.snapshot_key} (generation {read_head(args.output)[0]}) written to {args.output} '
+                  f'in {time.perf_counter() - start:.1f}s: {cred!r}')
+        except Exception as e:
+            if not args.watch:
+                raise
+            print(f'Error while building the bundle: {e!r}')
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
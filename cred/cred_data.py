@@ -1,78 +1,221 @@
+from collections.abc import Mapping
+from concurrent.futures import Executor
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from cred.cred_result import NAT_MS, from_cred_json
+from cred.grain_ledger import ATTO, GrainLedger, to_grain
+from cred.graph import CredGraph
+from cred.utils.cache import LazyCache
+from cred.utils.columns import StringColumn, compact_frame, compact_node_columns, tables_nbytes
+from cred.utils.metrics import instrument
+from cred.utils.prefix import PrefixIndex
+from cred.utils.search import DEFAULT_TOP_K, UserSearchIndex
+from cred.whatif import WhatIfEngine, WhatIfRun
 
+# (start, end) datetimes, or epoch milliseconds, both inclusive
+DateRange = Tuple[Any, Any]
+
+# what each derived table is computed from: other tables, or the inputs
+# 'nodes' (the node columns but their cred), 'nodeCred' (the totalCred and
+# credRow columns), 'credMatrix', 'intervals', 'weights' (with the plugins),
+# 'edges' and 'accounts'. 'graph_result' is the full graph loaded for a
+# participants-only cred result (see CredData.graph_result).
+DEPENDENCIES = {
+    'df': ('nodes', 'nodeCred'),
+    'df_rank': ('df', 'df_accounts'),
+    'rank_index': ('df_rank',),
+    'user_search': ('df_rank',),
+    'grain_ledger': ('accounts',),
+    'graph_result': ('nodes', 'nodeCred', 'credMatrix'),
+    'graph': ('graph_result', 'nodes', 'nodeCred', 'weights', 'edges'),
+    'identity_nodes': ('graph_result', 'nodes'),
+    'what_if': ('graph_result', 'nodes', 'nodeCred', 'weights', 'edges'),
+    'df_grain': ('grain_ledger', 'intervals'),
+    'df_accounts': ('accounts', 'grain_ledger'),
+    'df_cred_ot': ('credMatrix', 'intervals'),
+    'df_cred_eflow': ('graph_result', 'weights'),
+    'df_cred_nflow': ('graph_result', 'weights'),
+    'df_grain_ot': ('grain_ledger', 'df_grain'),
+    'interval_ends': ('intervals',),
+    'cred_cumsum': ('credMatrix',),
+    'total_cred_cumsum': ('df_cred_ot',),
+}
+
+
+def to_ms(t: Any) -> int:
+    """
+    Epoch milliseconds of a datetime (naive datetimes are local time, like
+    CredData.get_dt_intervals) or of a number of milliseconds
+    """
+    if isinstance(t, (int, float, np.integer, np.floating)):
+        return int(t)
+    return int(round(datetime.timestamp(t) * 1000))
+
+
+def _top_positions(values: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Positions of the `top_n` largest values, in the order of a stable
+    descending sort, found with a partial sort
+    """
+    n = len(values)
+    if top_n >= n:
+        return np.argsort(-values, kind='stable')
+    kth = values[np.argpartition(values, n - top_n)[n - top_n]]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:top_n - len(above)]
+    top = np.concatenate([above, ties])
+    return top[np.argsort(-values[top], kind='stable')]
+
+
+class NodeView(Mapping):
+    """
+    Lazy, read-only view over a single row of the node columns
+    """
+    _keys = ('address.source', 'address.nodeType', 'address.id', 'totalCred',
+             'credOverTime', 'description', 'timestamp', 'user')
+
+    def __init__(self, columns: Dict[str, np.ndarray], cred_matrix: np.ndarray, i: int):
+        self._columns = columns
+        self._cred_matrix = cred_matrix
+        self._i = i
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        if key == 'timestamp':
+            ts = self._columns['timestamp'][self._i]
+            return None if ts == NAT_MS else int(ts)
+        if key == 'credOverTime':
+            row = self._columns['credRow'][self._i]
+            return self._cred_matrix[row].tolist() if row else []
+        value = self._columns[key][self._i]
+        if key == 'user' and pd.isna(value):
+            # missing values of a categorical column
+            return None
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+@instrument(cache_attr='cache')
 class CredData():
     """
         Parses information from Sourcecred
         - Works with TimelineCred data format (sourcecred <= v0.7x)
+        - Works with the credGrainView participants view (sourcecred >= v0.8x), see cred.parsers
     """
     
-    def __init__(self, cred_data, accounts_data):
-        self.cred_json_data = cred_data
-        self.weighted_graph = cred_data[1]['weightedGraph'][1]
-        self.cred_data = cred_data[1]['credData']
+    def __init__(self, cred_data, accounts_data, compact: bool = False):
+        """
+        `cred_data` is either the parsed credResult JSON or its compact
+        representation (see `cred.utils.io.fetch_cred_result` and
+        cred.parsers). Only the compact representation is kept.
+
+        With `compact`, repeated strings (node sources and types, users,
+        account types) are stored as categoricals, integer columns are
+        downcast and the node ids and descriptions are packed into
+        offset-indexed buffers (see cred.utils.columns), left out of
+        `to_df` and decoded on access.
+        """
+        self.cred_result = cred_data if isinstance(cred_data, dict) else from_cred_json(cred_data)
+        self.compact = compact
+        if compact:
+            self.cred_result = dict(self.cred_result, nodes=compact_node_columns(self.cred_result['nodes']))
         self.accounts_data = accounts_data
-        self.cache = {
-            'df': None,
-            'df_rank': None,
-            'df_grain': None,
-            'df_accounts': None,
-            'df_cred_ot': None,
-            'df_cred_eflow': None,
-            'df_cred_nflow': None,
-        }
+        # content hash of the source files when loaded through cred.snapshot
+        self.snapshot_key = None
+        # content hash of each source file, by name
+        self.source_hashes = None
+        # cred.incremental.CredDiff against the previous CredData, if updated incrementally
+        self.update_diff = None
+        # loads the compact cred result with the full graph when `cred_data`
+        # only holds the participants (see graph_result)
+        self.graph_source = None
+        # derived tables, each computed once even when sessions ask for it
+        # concurrently (see cred.utils.cache.LazyCache)
+        self.cache = LazyCache(DEPENDENCIES)
 
-    def get_weighted_graph(self, data) -> Dict[str, Any]:
+    @property
+    def has_graph(self) -> bool:
         """
-        Weighted graph from CredResult JSON data
+        Whether the cred result holds the whole weighted graph, not only
+        the participants
         """
-        return self.weighted_graph
+        return self.cred_result.get('fullGraph', True)
+
+    @property
+    def graph_result(self) -> Dict[str, Any]:
+        """
+        Compact cred result holding the whole weighted graph: the cred
+        result itself, or the one loaded by `graph_source` on first use
+        when it only holds the participants
+        """
+        if self.has_graph:
+            return self.cred_result
+        def derive():
+            if self.graph_source is None:
+                raise LookupError('The cred graph of this instance is not available')
+            graph_result = self.graph_source()
+            if self.compact:
+                graph_result = dict(graph_result, nodes=compact_node_columns(graph_result['nodes']))
+            return graph_result
+        return self.cache.compute('graph_result', derive)
 
-    def get_cred_data(self) -> Dict[str, Any]:
+    @property
+    def node_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Typed per-node columns
+        """
+        return self.cred_result['nodes']
+
+    @property
+    def cred_matrix(self) -> np.ndarray:
         """
-        Raw CredResult JSON data
+        Dense (nodes with cred over time + 1) x intervals cred matrix.
+        Use the 'credRow' column to map nodes to rows
         """
-        return self.cred_data     
-        
-    def get_node(self, i: int) -> Dict[str, Any]:
+        return self.cred_result['credMatrix']
+
+    def get_node(self, i: int) -> NodeView:
         """
         Returns specifc node's information
         """
-        node = dict()
-        address = self.weighted_graph['graphJSON'][1]['sortedNodeAddresses'][i]
-        node['address.source'] = f'{address[0]}/{address[1]}'
-        node['address.nodeType'] = address[2]
-        node['address.id'] = address[3]
-        node['totalCred'] = self.cred_data['nodeSummaries'][i]['cred']
-        node['credOverTime'] = self.cred_data['nodeOverTime'][i]['cred'] if self.cred_data['nodeOverTime'][i] else []
-        node['description'] = self.weighted_graph['graphJSON'][1]['nodes'][i]['description']
-        node['timestamp'] = self.weighted_graph['graphJSON'][1]['nodes'][i]['timestampMs']
-        node['user'] = self.weighted_graph['graphJSON'][1]['nodes'][i]['description'] if node['address.nodeType'] == 'IDENTITY' else None
-        
-        return node
+        if i < 0:
+            i += self.total_nodes
+        if not 0 <= i < self.total_nodes:
+            raise IndexError(i)
+        return NodeView(self.node_columns, self.cred_matrix, i)
     
     @property
     def total_nodes(self) -> int:
         """
         Total amount of nodes (users, posts, etc) in the graph
         """
-        return len(self.cred_data['nodeSummaries'])
+        return len(self.node_columns['totalCred'])
     
     @property
-    def nodes(self) -> List[Any]:
+    def nodes(self) -> List[NodeView]:
         """
         Returns all nodes in the graph
         """
-        return [self.get_node(i) for i in range(self.total_nodes)]   
+        return [NodeView(self.node_columns, self.cred_matrix, i) for i in range(self.total_nodes)]
     
     @property
     def intervals(self, to_datetime=False) -> List[Any]:
         """
         Returns timestamp intervals where cred was computed
         """
-        return self.cred_data['intervals']
+        return self.cred_result['intervals']
     
     def get_dt_intervals(self) -> List[Any]:
         """
@@ -80,52 +223,121 @@ class CredData():
         """
         return [datetime.fromtimestamp(interval[('endTimeMs')] / 1000) for interval in self.intervals]
     
+    @property
+    def interval_ends(self) -> np.ndarray:
+        """
+        Interval end times in epoch milliseconds
+        """
+        return self.cache.compute('interval_ends', lambda: np.array([interval['endTimeMs'] for interval in self.intervals],
+                                                                    dtype=np.int64))
+
+    def get_interval_range(self, date_range: DateRange = None) -> Tuple[int, int]:
+        """
+        [i0, i1) range of the intervals ending within `date_range`
+        """
+        ends = self.interval_ends
+        if date_range is None:
+            return 0, len(ends)
+        start, end = date_range
+        return (int(np.searchsorted(ends, to_ms(start), side='left')),
+                int(np.searchsorted(ends, to_ms(end), side='right')))
+
+    def _is_all_time(self, i0: int, i1: int) -> bool:
+        return i0 == 0 and i1 == len(self.interval_ends)
+
+    @property
+    def cred_cumsum(self) -> np.ndarray:
+        """
+        Cumulative cred matrix with a leading zero column: the cred of a row
+        over intervals [i0, i1) is cred_cumsum[row, i1] - cred_cumsum[row, i0]
+        """
+        def derive():
+            cred_matrix = self.cred_matrix
+            cumsum = np.zeros((cred_matrix.shape[0], cred_matrix.shape[1] + 1), dtype=np.float64)
+            np.cumsum(cred_matrix, axis=1, out=cumsum[:, 1:])
+            return cumsum
+        return self.cache.compute('cred_cumsum', derive)
+
     @property
     def distributed_cred(self) -> float:
         """
         Returns total distributed cred
         """
-        if self.cache['df'] is None:
-            self.to_df()
-        return self.cache['df'].totalCred.sum()
+        return self.node_columns['totalCred'].sum()
     
     @property
     def distributed_grain(self) -> float:
         """
         Returns total distributed grain
         """
-        if self.cache['df_grain'] is None:
-            self.get_grain_distribution()
-        return self.cache['df_grain'].amount.sum()
+        return self.grain_ledger.total() / ATTO
+
+    def get_distributed_cred(self, date_range: DateRange = None) -> float:
+        """
+        Returns cred distributed over the intervals ending within `date_range`
+        """
+        i0, i1 = self.get_interval_range(date_range)
+        if self._is_all_time(i0, i1):
+            return self.distributed_cred
+        total_cred_cumsum = self.cache.compute(
+            'total_cred_cumsum', lambda: np.concatenate([[0.], np.cumsum(self.get_cred_over_time().amount.to_numpy())]))
+        return total_cred_cumsum[i1] - total_cred_cumsum[i0]
+
+    def get_distributed_grain(self, date_range: DateRange = None) -> float:
+        """
+        Returns grain distributed for cred timestamps within `date_range`
+        """
+        if date_range is None:
+            return self.distributed_grain
+        return self.grain_ledger.total(to_ms(date_range[0]), to_ms(date_range[1])) / ATTO
+
+    @property
+    def grain_ledger(self) -> GrainLedger:
+        """
+        Exact grain ledger of the accounts in 'output/accounts.json'
+        """
+        return self.cache.compute('grain_ledger', lambda: GrainLedger.from_accounts(self.accounts_data))
     
     @property
     def accounts(self) -> pd.DataFrame:
         """
         Returns user accounts info from 'output/accounts.json' file
         """
-        if self.cache['df_accounts'] is None:
-            self.cache['df_accounts'] = pd.json_normalize(self.accounts_data['accounts'])
-            self.cache['df_accounts']['account.balance'] = self.cache['df_accounts']['account.balance'].map(float) / 1e18
-            self.cache['df_accounts']['account.paid'] = self.cache['df_accounts']['account.paid'].map(float) / 1e18
-        return self.cache['df_accounts']
+        def derive():
+            df_accounts = pd.json_normalize(self.accounts_data['accounts'])
+            df_accounts['account.balance'] = self.grain_ledger.balances
+            df_accounts['account.paid'] = self.grain_ledger.paid
+            return compact_frame(df_accounts) if self.compact else df_accounts
+        return self.cache.compute('df_accounts', derive)
     
     def get_user_nodes(self) -> pd.DataFrame:
         """
         Returns user nodes in the graph
         """
-        if self.cache['df'] is None:
-            self.to_df()
-        return self.cache['df'][self.cache['df']['address.nodeType'] == 'IDENTITY']
+        df = self.to_df()
+        df_users = df[df['address.nodeType'] == 'IDENTITY']
+        lazy = [name for name in self.node_columns if name not in df]
+        if lazy:
+            # columns left out of the compact DataFrame, decoded for these rows only
+            positions = df_users.index.to_numpy()
+            df_users = df_users.assign(**{name: self.node_columns[name][positions] for name in lazy})
+            df_users = df_users[list(self.node_columns)]
+        return df_users
     
-    def get_user_ranking(self) -> pd.DataFrame:
-        """
-        Returns the user raking by total amount of cred gained so far
-        """
-        if self.cache['df_rank'] is None:
-#             self.cache['df_rank'] = self.get_user_nodes().sort_values('totalCred', ascending=False).reset_index(drop=True)
-#             distributed_cred = self.cache['df_rank'].totalCred.sum()
-#             self.cache['df_rank']['credShare'] = (self.cache['df_rank'].totalCred / distributed_cred) * 100
-            df_rank_p = self.get_user_nodes()[['address.id', 'totalCred', 'credOverTime']]
+    def get_user_ranking(self, date_range: DateRange = None) -> pd.DataFrame:
+        """
+        Returns the user raking by total amount of cred gained so far, or
+        within the intervals ending in `date_range`
+        """
+        if date_range is not None:
+            i0, i1 = self.get_interval_range(date_range)
+            if not self._is_all_time(i0, i1):
+                return self._get_window_ranking(i0, i1)
+        def derive():
+#             df_rank = self.get_user_nodes().sort_values('totalCred', ascending=False).reset_index(drop=True)
+#             distributed_cred = df_rank.totalCred.sum()
+#             df_rank['credShare'] = (df_rank.totalCred / distributed_cred) * 100
+            df_rank_p = self.get_user_nodes()[['address.id', 'totalCred', 'credRow']].copy()
             distributed_cred = df_rank_p.totalCred.sum()
             df_rank_p['credShare'] = (df_rank_p.totalCred / distributed_cred) * 100
             df_rank_p.set_index('address.id', inplace=True)
@@ -136,129 +348,409 @@ class CredData():
                                       'account.balance',
                                       'account.paid'
                                      ]]
-            self.cache['df_rank'] = df_acc_p.join(df_rank_p,
-                                                  on='account.identity.id',
-                                                  how='inner'
-                                                 ).sort_values('totalCred', ascending=False).reset_index(drop=True)
-            self.cache['df_rank'].columns = ['id', 'user', 'type', 'active', 'grainBalance', 'grainPaid', 'totalCred', 'credOverTime', 'credShare']
-            
-        return self.cache['df_rank']
+            df_rank = df_acc_p.join(df_rank_p,
+                                    on='account.identity.id',
+                                    how='inner'
+                                   ).sort_values('totalCred', ascending=False).reset_index(drop=True)
+            df_rank.columns = ['id', 'user', 'type', 'active', 'grainBalance', 'grainPaid', 'totalCred', 'credRow', 'credShare']
+            return df_rank
+
+        return self.cache.compute('df_rank', derive)
+
+    @property
+    def rank_index(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hash indexes from username and from identity id to the user's
+        position in the all-time ranking
+        """
+        def derive():
+            df_rank = self.get_user_ranking()
+            by_user = dict()
+            for position, user in enumerate(df_rank.user.to_list()):
+                by_user.setdefault(user, position)
+            return {
+                'user': by_user,
+                'id': dict(zip(df_rank.id.to_list(), range(len(df_rank)))),
+            }
+        return self.cache.compute('rank_index', derive)
+
+    @property
+    def user_search(self) -> UserSearchIndex:
+        """
+        Case-insensitive prefix/substring search index over the usernames
+        of the all-time ranking
+        """
+        return self.cache.compute('user_search', lambda: UserSearchIndex(pd.unique(self.get_user_ranking().user)))
+
+    def search_users(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[str]:
+        """
+        Top-k usernames containing `query` (case-insensitive), the ones
+        starting with it first, then by all-time rank
+        """
+        return self.user_search.search(query, top_k)
+
+    def get_user_position(self, user: str) -> Optional[int]:
+        """
+        Position of a user (by username or identity id) in the all-time
+        ranking, or None when unknown
+        """
+        index = self.rank_index
+        position = index['user'].get(user)
+        return index['id'].get(user) if position is None else position
+
+    def get_user_rank(self, user: str, date_range: DateRange = None) -> Optional[int]:
+        """
+        1-based rank of a user (by username or identity id), all-time or
+        within `date_range`
+        """
+        position = self.get_user_position(user)
+        if position is None:
+            return None
+        i0, i1 = self.get_interval_range(date_range)
+        if self._is_all_time(i0, i1):
+            return position + 1
+        window_cred = self._get_window_cred(i0, i1)
+        cred = window_cred[position]
+        return int((window_cred > cred).sum() + (window_cred[:position] == cred).sum()) + 1
+
+    def get_top_ranking(self, top_n: int, date_range: DateRange = None) -> pd.DataFrame:
+        """
+        Returns the Top-N rows of the user ranking, all-time or within
+        `date_range`, without sorting the whole ranking
+        """
+        df_rank = self.get_user_ranking()
+        i0, i1 = self.get_interval_range(date_range)
+        if self._is_all_time(i0, i1):
+            return df_rank.head(top_n)
+        window_cred = self._get_window_cred(i0, i1)
+        top = _top_positions(window_cred, top_n)
+        distributed_cred = window_cred.sum()
+        df_top = df_rank.iloc[top].copy()
+        df_top['totalCred'] = window_cred[top]
+        df_top['credShare'] = (window_cred[top] / distributed_cred) * 100 if distributed_cred else 0.
+        return df_top.reset_index(drop=True)
+
+    def _get_window_cred(self, i0: int, i1: int) -> np.ndarray:
+        rows = self.get_user_ranking().credRow.to_numpy()
+        return self.cred_cumsum[rows, i1] - self.cred_cumsum[rows, i0]
+
+    def get_user_cred(self, date_range: DateRange = None) -> pd.Series:
+        """
+        Returns the cred of every ranked user (by id) within `date_range`
+        """
+        df_rank = self.get_user_ranking()
+        i0, i1 = self.get_interval_range(date_range)
+        if self._is_all_time(i0, i1):
+            return pd.Series(df_rank.totalCred.to_numpy(), index=df_rank.id, name='cred')
+        return pd.Series(self._get_window_cred(i0, i1), index=df_rank.id, name='cred')
+
+    def get_user_grain(self, date_range: DateRange = None) -> pd.Series:
+        """
+        Returns the grain received by every ranked user (by id) for cred
+        timestamps within `date_range` (0 for users without an account)
+        """
+        df_rank = self.get_user_ranking()
+        ledger = self.grain_ledger
+        if date_range is None:
+            high, low = ledger.account_totals()
+        else:
+            high, low = ledger.account_totals(to_ms(date_range[0]), to_ms(date_range[1]))
+        positions = ledger.get_positions(df_rank.id.to_list())
+        known = positions >= 0
+        grain = np.zeros(len(positions))
+        grain[known] = to_grain(high[positions[known]], low[positions[known]])
+        return pd.Series(grain, index=df_rank.id, name='grain')
+
+    def _get_window_ranking(self, i0: int, i1: int) -> pd.DataFrame:
+        df_rank = self.get_user_ranking().copy()
+        window_cred = self._get_window_cred(i0, i1)
+        distributed_cred = window_cred.sum()
+        df_rank['totalCred'] = window_cred
+        df_rank['credShare'] = (window_cred / distributed_cred) * 100 if distributed_cred else 0.
+        return df_rank.sort_values('totalCred', ascending=False, kind='stable').reset_index(drop=True)
     
     def get_grain_distribution(self) -> pd.DataFrame:
         """
         Returns the history of grain distribution
         """
-        if self.cache['df_grain'] is None:
-            grain_history = [acc for acc in self.accounts_data['accounts'] if 'allocationHistory' in acc['account']]
-            if len(grain_history) > 0:
-                grain_distribution = [{'credTimestampMs': record['credTimestampMs'], 'amount': int(record['grainReceipt']['amount']) / 1e18} \
-                                      for acc in grain_history for record in acc['account']['allocationHistory']]
-                self.cache['df_grain'] = pd.json_normalize(grain_distribution)
-                self.cache['df_grain']['credTimestampMs'] = pd.to_datetime(self.cache['df_grain']['credTimestampMs'], unit='ms')
-            else:
-                # zeros
-                self.cache['df_grain'] = pd.DataFrame([self.get_dt_intervals(), [0.] * len(self.intervals)]).T
-                self.cache['df_grain'].columns = ['credTimestampMs', 'amount']
-        return self.cache['df_grain']
-
-    def get_cred_over_time(self) -> pd.DataFrame:
-        """
-        Returns distributed cred summary over all intervals
-        """
-        if self.cache['df_cred_ot'] is None:
-            if self.cache['df'] is None:
-                self.to_df()
-            self.cache['df_cred_ot'] = pd.DataFrame([self.get_dt_intervals(),
-                                                     pd.DataFrame(self.cache['df'].credOverTime.to_list()).sum()
-                                                    ]).T
-            self.cache['df_cred_ot'].columns = ['credTimestampMs', 'amount']
-            self.cache['df_cred_ot'].set_index('credTimestampMs', drop=True, inplace=True)
-        return self.cache['df_cred_ot']
+        def derive():
+            ledger = self.grain_ledger
+            if ledger.n_receipts > 0:
+                return pd.DataFrame({'credTimestampMs': pd.to_datetime(ledger.timestamps, unit='ms'),
+                                     'amount': ledger.amounts})
+            # zeros
+            df_grain = pd.DataFrame([self.get_dt_intervals(), [0.] * len(self.intervals)]).T
+            df_grain.columns = ['credTimestampMs', 'amount']
+            return df_grain
+        return self.cache.compute('df_grain', derive)
+
+    def get_grain_over_time(self, date_range: DateRange = None) -> pd.DataFrame:
+        """
+        Returns distributed grain per cred timestamp
+        """
+        def derive():
+            ledger = self.grain_ledger
+            if ledger.n_receipts > 0:
+                timestamps, (high, low) = ledger.over_time()
+                return pd.DataFrame({'amount': to_grain(high, low)},
+                                    index=pd.to_datetime(timestamps, unit='ms').rename('credTimestampMs'))
+            return self.get_grain_distribution().groupby('credTimestampMs').sum()
+        df_grain_ot = self.cache.compute('df_grain_ot', derive)
+        if date_range is None:
+            return df_grain_ot
+        i0, i1 = self.get_grain_range(date_range)
+        return df_grain_ot.iloc[i0:i1]
+
+    def get_grain_range(self, date_range: DateRange = None) -> Tuple[int, int]:
+        """
+        [i0, i1) range of the rows of get_grain_over_time() with a cred
+        timestamp within `date_range`
+        """
+        df_grain_ot = self.get_grain_over_time()
+        if date_range is None:
+            return 0, len(df_grain_ot)
+        timestamps = pd.to_datetime(df_grain_ot.index).to_numpy().astype('datetime64[ms]').astype(np.int64)
+        return (int(np.searchsorted(timestamps, to_ms(date_range[0]), side='left')),
+                int(np.searchsorted(timestamps, to_ms(date_range[1]), side='right')))
+
+    def get_cred_over_time(self, date_range: DateRange = None) -> pd.DataFrame:
+        """
+        Returns distributed cred summary over all intervals, or the
+        intervals ending within `date_range`
+        """
+        df_cred_ot = self.cache.compute('df_cred_ot', lambda: pd.DataFrame({'amount': self.cred_matrix.sum(axis=0)},
+                                                                           index=self._dt_index()))
+        i0, i1 = self.get_interval_range(date_range)
+        return df_cred_ot.iloc[i0:i1]
+
+    def get_user_cred_over_time(self, user: str, date_range: DateRange = None) -> pd.Series:
+        """
+        Returns the cred over time of a single user (by username or identity id)
+        """
+        position = self.get_user_position(user)
+        if position is None:
+            raise KeyError(user)
+        row = self.get_user_ranking().credRow.iat[position]
+        i0, i1 = self.get_interval_range(date_range)
+        return pd.Series(self.cred_matrix[row, i0:i1], index=self._dt_index()[i0:i1], name=user)
+
+    def get_top_cred_over_time(self, top_n: int, date_range: DateRange = None) -> pd.DataFrame:
+        """
+        Returns the cred over time of the Top-N users (within `date_range`),
+        one column per user in ranking order
+        """
+        df_top = self.get_top_ranking(top_n, date_range)
+        i0, i1 = self.get_interval_range(date_range)
+        return pd.DataFrame(self.cred_matrix[df_top.credRow.to_numpy(), i0:i1].T,
+                            index=self._dt_index()[i0:i1],
+                            columns=df_top.user.to_list())
+
+    def _dt_index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.get_dt_intervals(), name='credTimestampMs')
     
     def to_df(self) -> pd.DataFrame:
         """
-        Retuns all nodes data as a DataFrame
+        Retuns all nodes data as a DataFrame (without the ids and
+        descriptions in compact mode). The cred over time of each node is
+        its 'credRow' row of `cred_matrix` (see with_cred_over_time).
         """
-        if self.cache['df'] is None:
-            self.cache['df'] = pd.json_normalize(self.nodes)
-            self.cache['df'].timestamp = pd.to_datetime(self.cache['df'].timestamp, unit='ms')
+        def derive():
+            columns = {name: values for name, values in self.node_columns.items() if not isinstance(values, StringColumn)}
+            columns['timestamp'] = columns['timestamp'].view('datetime64[ms]').astype('datetime64[ns]')
+            return pd.DataFrame(columns)
 #             distributedCred = self.df.totalCred.sum()
 #             self.df['credShare']  = self.df.totalCred / distributedCred
             
-        return self.cache['df']
+        return self.cache.compute('df', derive)
     
+    def with_cred_over_time(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        `df` (rows of to_df() or get_user_ranking()) with its 'credRow'
+        column replaced by the 'credOverTime' lists of the original schema:
+        the cred of each row over all intervals, [] for nodes without any
+        """
+        position = df.columns.get_loc('credRow')
+        cred_over_time = [self.cred_matrix[row].tolist() if row else [] for row in df.credRow.to_list()]
+        df = df.drop(columns='credRow')
+        df.insert(position, 'credOverTime', cred_over_time)
+        return df
+
+    def _plugin_types(self) -> Tuple[Dict[str, str], List[str], List[str]]:
+        """
+        Plugin of every node/edge prefix (without NULs), and the edge and
+        node type prefixes of the plugins
+        """
+        plugin_prefixes = dict()
+        edges = []
+        nodes = []
+        for plugin in self.graph_result['plugins']:
+            plugin_prefixes[plugin['nodePrefix'].replace('\x00', '')] = plugin['name']
+            plugin_prefixes[plugin['edgePrefix'].replace('\x00', '')] = plugin['name']
+            edges.extend([et['prefix'] for et in plugin['edgeTypes']])
+            nodes.extend([nt['prefix'] for nt in plugin['nodeTypes']])
+        return plugin_prefixes, edges, nodes
+
     def get_cred_flow_from_graph(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
         Gets cred flow through nodes & edges in the cred graph.
         """
-        if self.cache['df_cred_eflow'] is None:
-            
-            def set_plugin(label):
-                for prefix, plugin in plugin_prefixes.items():
-                    if label.startswith(prefix):
-                        return plugin
-                return 'Not Found'
-            
-            # PREPROCESSING
-            plugin_meta = dict()
-            edges = []
-            nodes = []
-            # edges_weights = dict()
-            # nodes_weights = dict()
-
-            for plugin in self.cred_json_data[1]['plugins'][1]:
-                plugin_meta[plugin['name']] = {
-                    'nodePrefix': plugin['nodePrefix'],
-                    'edgePrefix': plugin['edgePrefix'],
-                    'edgeTypes': [{'prefix': et['prefix'], 'weight': et['defaultWeight']} for et in plugin['edgeTypes']],
-                    'nodeTypes': [{'prefix': nt['prefix'], 'weight': nt['defaultWeight']} for nt in plugin['nodeTypes']],
-                }
-                edges.extend([et['prefix'] for et in plugin_meta[plugin['name']]['edgeTypes']])
-            #     for et in plugin_meta[plugin['name']]['edgeTypes']:
-            #         edges_weights[et['prefix']] = et['weight']
-                nodes.extend([nt['prefix'] for nt in plugin_meta[plugin['name']]['nodeTypes']])
-            #     for nt in plugin_meta[plugin['name']]['nodeTypes']:
-            #         nodes_weights[nt['prefix']] = nt['weight']
-
-
-            plugin_prefixes = {plugin_meta[p_name]['nodePrefix'].replace('\x00', ''): p_name for p_name in plugin_meta}
-            plugin_prefixes.update({plugin_meta[p_name]['edgePrefix'].replace('\x00', ''): p_name for p_name in plugin_meta})
-            
-            # EDGES
-            df_ew = pd.DataFrame([self.weighted_graph['weightsJSON'][1]['edgeWeights'].keys(),
-                      [v['backwards'] for v in self.weighted_graph['weightsJSON'][1]['edgeWeights'].values()],
-                      [v['forwards'] for v in self.weighted_graph['weightsJSON'][1]['edgeWeights'].values()]
-                     ]).T
-            df_ew.columns = ['edge', 'backward', 'forward']
-            
+        def derive_edges():
+            plugin_prefixes, edges, _ = self._plugin_types()
+            edge_weights = self.graph_result['edgeWeights']
+            backward, forward = PrefixIndex(edge_weights['keys']).group_sum(edges,
+                                                                            edge_weights['backwards'],
+                                                                            edge_weights['forwards'])
             cred_edges = dict()
-            for e in edges:
-                cred_edges[e.replace('\x00', '')] = [
-                    df_ew[df_ew.edge.str.startswith(e)].backward.sum(),
-                    df_ew[df_ew.edge.str.startswith(e)].forward.sum()
-                ]
-
-            self.cache['df_cred_eflow'] = pd.json_normalize(cred_edges).T
-            self.cache['df_cred_eflow']['backward'] = self.cache['df_cred_eflow'].iloc[:,0].apply(lambda x: x[0])
-            self.cache['df_cred_eflow']['forward'] = self.cache['df_cred_eflow'].iloc[:,0].apply(lambda x: x[1])
-            self.cache['df_cred_eflow']['plugin'] = self.cache['df_cred_eflow'].index.map(set_plugin)
-            self.cache['df_cred_eflow'].drop(columns=[0], inplace=True)
-            
-            # NODES
-            df_nw = pd.DataFrame([self.weighted_graph['weightsJSON'][1]['nodeWeights'].keys(),
-                                  self.weighted_graph['weightsJSON'][1]['nodeWeights'].values()
-                                 ]).T
-            df_nw.columns = ['node', 'weight']
-            
+            for e, b, f in zip(edges, backward, forward):
+                cred_edges[e.replace('\x00', '')] = (b, f)
+
+            df_cred_eflow = pd.DataFrame.from_dict(cred_edges, orient='index', columns=['backward', 'forward'])
+            df_cred_eflow['plugin'] = PrefixIndex(cred_edges).label(plugin_prefixes, default='Not Found')
+            return df_cred_eflow
+
+        def derive_nodes():
+            plugin_prefixes, _, nodes = self._plugin_types()
+            node_weights = self.graph_result['nodeWeights']
+            weight, = PrefixIndex(node_weights['keys']).group_sum(nodes, node_weights['weight'])
             cred_nodes = dict()
-            for n in nodes:
-                cred_nodes[n.replace('\x00', '')]  = df_nw[df_nw.node.str.startswith(n)].weight.sum()
+            for n, w in zip(nodes, weight):
+                cred_nodes[n.replace('\x00', '')] = w
 
-            self.cache['df_cred_nflow'] = pd.json_normalize(cred_nodes).T
-            self.cache['df_cred_nflow'].columns = ['weight']
-            self.cache['df_cred_nflow']['plugin'] = self.cache['df_cred_nflow'].index.map(set_plugin)
-            
-        return (self.cache['df_cred_nflow'], self.cache['df_cred_eflow'])
+            df_cred_nflow = pd.DataFrame.from_dict(cred_nodes, orient='index', columns=['weight'])
+            df_cred_nflow['plugin'] = PrefixIndex(cred_nodes).label(plugin_prefixes, default='Not Found')
+            return df_cred_nflow
+
+        return (self.cache.compute('df_cred_nflow', derive_nodes), self.cache.compute('df_cred_eflow', derive_edges))
+
+    @property
+    def graph(self) -> CredGraph:
+        """
+        Sparse cred flows between the nodes of the graph
+        """
+        return self.cache.compute('graph', lambda: CredGraph.from_cred_result(self.graph_result))
+
+    def _identity_nodes(self) -> Dict[str, int]:
+        def derive():
+            node_columns = self.graph_result['nodes']
+            identities = np.flatnonzero(node_columns['address.nodeType'] == 'IDENTITY')
+            return dict(zip(node_columns['address.id'][identities].tolist(), identities.tolist()))
+        return self.cache.compute('identity_nodes', derive)
+
+    def get_user_node(self, user: str) -> int:
+        """
+        Graph node index of a user (by username or identity id)
+        """
+        position = self.get_user_position(user)
+        if position is None:
+            raise KeyError(user)
+        return self._identity_nodes()[self.get_user_ranking().id.iat[position]]
+
+    def _node_frame(self, nodes: np.ndarray, **columns) -> pd.DataFrame:
+        node_columns = self.graph_result['nodes']
+        return pd.DataFrame(dict({'description': node_columns['description'][nodes],
+                                  'type': node_columns['address.nodeType'][nodes],
+                                  'source': node_columns['address.source'][nodes]}, **columns),
+                            index=pd.Index(nodes, name='node'))
+
+    def get_user_neighborhood(self, user: str) -> pd.DataFrame:
+        """
+        Nodes exchanging cred with a user: the cred each sends to the user
+        (inflow) and receives from them (outflow), largest exchanges first
+        """
+        nodes, inflow, outflow = self.graph.neighborhood(self.get_user_node(user))
+        order = np.argsort(-(inflow + outflow), kind='stable')
+        return self._node_frame(nodes[order], inflow=inflow[order], outflow=outflow[order])
+
+    def get_top_contributors(self, user: str, top_n: int = 10) -> pd.DataFrame:
+        """
+        Top-N nodes the cred of a user flows from
+        """
+        nodes, flows = self.graph.top_contributors(self.get_user_node(user), top_n)
+        return self._node_frame(nodes, flow=flows)
+
+    def get_top_recipients(self, user: str, top_n: int = 10) -> pd.DataFrame:
+        """
+        Top-N nodes the cred of a user flows to
+        """
+        nodes, flows = self.graph.top_recipients(self.get_user_node(user), top_n)
+        return self._node_frame(nodes, flow=flows)
+
+    def get_user_flow_by_plugin(self, user: str) -> pd.DataFrame:
+        """
+        Cred flowing in and out of a user through the edges of each plugin
+        """
+        return self.graph.flow_by_plugin(self.get_user_node(user))
+
+    @property
+    def what_if(self) -> WhatIfEngine:
+        """
+        Engine recomputing cred with other node/edge weights
+        """
+        return self.cache.compute('what_if', lambda: WhatIfEngine(self.graph_result))
+
+    def get_what_if_ranking(self,
+                            node_weights: Dict[str, float] = None,
+                            edge_weights: Dict[str, Dict[str, float]] = None) -> Tuple[pd.DataFrame, WhatIfRun]:
+        """
+        User ranking by what-if cred, with the node/edge weights of the
+        given prefixes overridden (see cred.whatif), and the run. 'rank'
+        is the published all-time rank and 'rankDelta' the number of
+        places gained.
+        """
+        engine = self.what_if
+        run = engine.run(node_weights, edge_weights)
+        df_rank = self.get_user_ranking()
+        nodes = df_rank.id.map(self._identity_nodes()).to_numpy()
+        what_if_cred = engine.cred(run)[nodes]
+        distributed_cred = what_if_cred.sum()
+        df_what_if = df_rank[['id', 'user', 'type', 'active', 'totalCred', 'credShare']].copy()
+        df_what_if['rank'] = np.arange(1, len(df_rank) + 1)
+        df_what_if['whatIfCred'] = what_if_cred
+        df_what_if['whatIfShare'] = (what_if_cred / distributed_cred) * 100 if distributed_cred else 0.
+        df_what_if = df_what_if.iloc[np.argsort(-what_if_cred, kind='stable')].reset_index(drop=True)
+        df_what_if['whatIfRank'] = np.arange(1, len(df_what_if) + 1)
+        df_what_if['rankDelta'] = df_what_if['rank'] - df_what_if['whatIfRank']
+        return df_what_if, run
+
+    def memory_usage(self) -> pd.Series:
+        """
+        Bytes held by every column of the node columns and of the node,
+        account and ranking tables (see cred.utils.columns.memory_report to
+        compare two CredData)
+        """
+        return tables_nbytes({
+            'nodes': self.node_columns,
+            'df': self.to_df(),
+            'df_accounts': self.accounts,
+            'df_rank': self.get_user_ranking(),
+        })
+
+    def invalidate(self, *names: str) -> List[str]:
+        """
+        Drops the given derived tables, or the tables derived from the
+        given inputs (see DEPENDENCIES), and every table derived from them.
+        Returns the tables dropped.
+        """
+        return self.cache.invalidate(*names)
+
+    def warm_up(self, executor: Executor = None) -> 'CredData':
+        """
+        Computes every derived table up front, the independent ones
+        concurrently on `executor` when given (not the executor running
+        this call: its workers would wait on each other). The graph tables
+        of a participants-only cred result are left to first use.
+        """
+        derivations = {
+            'df': self.to_df,
+            'df_accounts': lambda: self.accounts,
+            'df_rank': self.get_user_ranking,
+            'df_grain': self.get_grain_distribution,
+            'df_cred_ot': self.get_cred_over_time,
+        }
+        if self.has_graph:
+            derivations['df_cred_eflow'] = self.get_cred_flow_from_graph
+        self.cache.warm_up(derivations, executor)
+        return self
 
     def __repr__(self) -> str:
         return "<{} - ({} nodes & {} distributed CRED)>".format(self.__class__.__name__, self.total_nodes, self.distributed_cred)
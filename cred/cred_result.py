@@ -0,0 +1,230 @@
+from array import array
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+NAT_MS = np.iinfo(np.int64).min
+
+
+class NodeColumnsBuilder():
+    """
+    Accumulates graph nodes, node summaries and node cred over time into
+    typed columns, one element at a time
+    """
+
+    def __init__(self):
+        self._interned = dict()
+        self.source = []
+        self.node_type = []
+        self.node_id = []
+        self.description = []
+        self.timestamp = array('q')
+        self.total_cred = array('d')
+        self.cred_row = array('i')
+        self.cred = array('d')
+        self.n_rows = 0
+
+    def _intern(self, value: str) -> str:
+        return self._interned.setdefault(value, value)
+
+    def add_address(self, address: List[str]):
+        self.source.append(self._intern(f'{address[0]}/{address[1]}'))
+        self.node_type.append(self._intern(address[2]))
+        self.node_id.append(address[3])
+
+    def add_node(self, node: Dict[str, Any]):
+        self.description.append(node['description'])
+        ts = node['timestampMs']
+        self.timestamp.append(NAT_MS if ts is None else int(ts))
+
+    def add_summary(self, summary: Dict[str, Any]):
+        self.total_cred.append(summary['cred'])
+
+    def add_over_time(self, over_time: Dict[str, Any]):
+        if not over_time:
+            self.cred_row.append(0)
+            return
+        if self.n_rows == 0:
+            # shared zero row
+            self.cred.extend([0.] * len(over_time['cred']))
+        self.n_rows += 1
+        self.cred_row.append(self.n_rows)
+        self.cred.extend(over_time['cred'])
+
+    def build(self, n_intervals: int) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """
+        Returns the node columns and the dense cred matrix. Row 0 of the
+        matrix is all zeros and is shared by every node without cred over
+        time; 'credRow' maps each node to its row.
+        """
+        node_type = np.array(self.node_type, dtype=object)
+        description = np.array(self.description, dtype=object)
+        columns = {
+            'address.source': np.array(self.source, dtype=object),
+            'address.nodeType': node_type,
+            'address.id': np.array(self.node_id, dtype=object),
+            'totalCred': np.frombuffer(self.total_cred, dtype=np.float64),
+            'credRow': np.frombuffer(self.cred_row, dtype=np.int32),
+            'description': description,
+            'timestamp': np.frombuffer(self.timestamp, dtype=np.int64),
+            'user': np.where(node_type == 'IDENTITY', description, None),
+        }
+        if self.n_rows == 0:
+            cred_matrix = np.zeros((1, n_intervals), dtype=np.float64)
+        else:
+            cred_matrix = np.frombuffer(self.cred, dtype=np.float64).reshape(self.n_rows + 1, -1)
+        return columns, cred_matrix
+
+
+class EdgeColumnsBuilder():
+    """
+    Accumulates graph edges into source/destination node index columns
+    (aligned with sortedNodeAddresses) and small integer edge type codes,
+    one edge at a time
+    """
+
+    def __init__(self):
+        # edge type prefix (e.g. 'E\x00sourcecred\x00github\x00AUTHORS\x00') -> code
+        self.types = dict()
+        self.src = array('i')
+        self.dst = array('i')
+        self.type = array('h')
+
+    def add_edge(self, edge: Dict[str, Any]):
+        prefix = 'E\x00' + '\x00'.join(edge['address'][:3]) + '\x00'
+        code = self.types.get(prefix)
+        if code is None:
+            code = self.types[prefix] = len(self.types)
+        self.src.append(edge['srcIndex'])
+        self.dst.append(edge['dstIndex'])
+        self.type.append(code)
+
+    def build(self) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Returns the edge columns and the edge type prefixes, by code
+        """
+        columns = {
+            'src': np.frombuffer(self.src, dtype=np.int32),
+            'dst': np.frombuffer(self.dst, dtype=np.int32),
+            'type': np.frombuffer(self.type, dtype=np.int16),
+        }
+        return columns, list(self.types)
+
+
+def compact_cred_result(nodes: Dict[str, np.ndarray],
+                        cred_matrix: np.ndarray,
+                        intervals: List[Dict[str, int]],
+                        node_weights: Dict[str, Any],
+                        edge_weights: Dict[str, Any],
+                        plugins: List[Dict[str, Any]],
+                        edges: Dict[str, np.ndarray] = None,
+                        edge_types: List[str] = None,
+                        full_graph: bool = True) -> Dict[str, Any]:
+    """
+    Compact credResult representation used by CredData. Without
+    `full_graph`, the nodes are only the participants (identities) and the
+    graph (edges, weights, plugins) is left empty (see cred.parsers).
+    """
+    if edges is None:
+        edges, edge_types = EdgeColumnsBuilder().build()
+    return {
+        'nodes': nodes,
+        'credMatrix': cred_matrix,
+        'intervals': intervals,
+        'nodeWeights': node_weights,
+        'edgeWeights': edge_weights,
+        'plugins': plugins,
+        'edges': edges,
+        'edgeTypes': edge_types,
+        'fullGraph': full_graph,
+    }
+
+
+def build_node_columns(graph_json: Dict[str, Any],
+                       cred_data: Dict[str, Any]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Builds typed node columns in a single pass over the graph addresses,
+    nodes and cred summaries, together with the dense nodes x intervals
+    cred matrix
+    """
+    builder = NodeColumnsBuilder()
+    for address, node, summary, over_time in zip(graph_json['sortedNodeAddresses'],
+                                                 graph_json['nodes'],
+                                                 cred_data['nodeSummaries'],
+                                                 cred_data['nodeOverTime']):
+        builder.add_address(address)
+        builder.add_node(node)
+        builder.add_summary(summary)
+        builder.add_over_time(over_time)
+    return builder.build(len(cred_data['intervals']))
+
+
+def from_cred_json(cred_json: List[Any]) -> Dict[str, Any]:
+    """
+    Compacts an already parsed credResult JSON (TimelineCred format)
+    """
+    weighted_graph = cred_json[1]['weightedGraph'][1]
+    cred_data = cred_json[1]['credData']
+    weights = weighted_graph['weightsJSON'][1]
+    nodes, cred_matrix = build_node_columns(weighted_graph['graphJSON'][1], cred_data)
+    edges = EdgeColumnsBuilder()
+    for edge in weighted_graph['graphJSON'][1]['edges']:
+        edges.add_edge(edge)
+    edge_columns, edge_types = edges.build()
+    return compact_cred_result(
+        nodes=nodes,
+        cred_matrix=cred_matrix,
+        intervals=cred_data['intervals'],
+        node_weights={
+            'keys': list(weights['nodeWeights'].keys()),
+            'weight': np.fromiter(weights['nodeWeights'].values(), dtype=np.float64, count=len(weights['nodeWeights'])),
+        },
+        edge_weights={
+            'keys': list(weights['edgeWeights'].keys()),
+            'backwards': np.fromiter((v['backwards'] for v in weights['edgeWeights'].values()),
+                                     dtype=np.float64, count=len(weights['edgeWeights'])),
+            'forwards': np.fromiter((v['forwards'] for v in weights['edgeWeights'].values()),
+                                    dtype=np.float64, count=len(weights['edgeWeights'])),
+        },
+        plugins=cred_json[1]['plugins'][1],
+        edges=edge_columns,
+        edge_types=edge_types,
+    )
+
+
+def empty_weights() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Node and edge weights of a cred result without graph
+    """
+    return ({'keys': [], 'weight': np.zeros(0, dtype=np.float64)},
+            {'keys': [], 'backwards': np.zeros(0, dtype=np.float64), 'forwards': np.zeros(0, dtype=np.float64)})
+
+
+def from_cred_grain_view(view_json: Any) -> Dict[str, Any]:
+    """
+    Compacts a parsed credGrainView JSON (sourcecred >= 0.8): one IDENTITY
+    node per participant with its cred per interval, and no graph
+    """
+    if isinstance(view_json, list):
+        # [{type, version} header, payload]
+        view_json = view_json[1]
+    builder = NodeColumnsBuilder()
+    for participant in view_json['participants']:
+        identity = participant['identity']
+        address = identity.get('address')
+        # 'N\x00sourcecred\x00core\x00IDENTITY\x00<id>\x00'
+        parts = address.split('\x00')[1:-1] if address else ['sourcecred', 'core', 'IDENTITY', identity['id']]
+        builder.add_address(parts)
+        builder.add_node({'description': identity['name'], 'timestampMs': None})
+        builder.add_summary({'cred': participant['cred']})
+        builder.add_over_time({'cred': participant['credPerInterval']})
+    nodes, cred_matrix = builder.build(len(view_json['intervals']))
+    node_weights, edge_weights = empty_weights()
+    return compact_cred_result(
+        nodes=nodes,
+        cred_matrix=cred_matrix,
+        intervals=view_json['intervals'],
+        node_weights=node_weights,
+        edge_weights=edge_weights,
+        plugins=[],
+        full_graph=False,
+    )
@@ -0,0 +1,237 @@
+"""
+Columnar, exact grain ledger built from 'output/accounts.json'.
+
+Grain amounts are attoGRAIN integers (1 GRAIN = 10^18 attoGRAIN) serialized
+as decimal strings, which overflow int64 past ~9.2 GRAIN. Amounts are kept
+as two int64 limbs, `high * 10^9 + low` attoGRAIN with 0 <= low < 10^9, so
+sums and prefix sums are exact (up to ~9.2 billion GRAIN in total) and only
+converted to floats for display.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cred.utils.cache import LazyCache
+
+LOW_DIGITS = 9
+LOW = 10 ** LOW_DIGITS
+ATTO = 10 ** 18
+
+# (high, low) limbs of attoGRAIN amounts
+Amounts = Tuple[np.ndarray, np.ndarray]
+
+
+def parse_amounts(values: Sequence[str]) -> Amounts:
+    """
+    Splits attoGRAIN decimal strings into exact (high, low) int64 limbs
+    """
+    amounts = np.array([int(v) for v in values], dtype=object).reshape(-1)
+    return (amounts // LOW).astype(np.int64), (amounts % LOW).astype(np.int64)
+
+
+def to_grain(high: Any, low: Any) -> Any:
+    """
+    attoGRAIN limbs to (float) GRAIN
+    """
+    return high / 1e9 + low / 1e18
+
+
+def to_atto(high: Any, low: Any) -> int:
+    """
+    Exact attoGRAIN integer of a pair of limbs
+    """
+    return int(high) * LOW + int(low)
+
+
+def _normalize(high: np.ndarray, low: np.ndarray) -> Amounts:
+    carry, low = np.divmod(low, LOW)
+    return high + carry, low
+
+
+def _cumsum(values: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+
+
+class GrainLedger():
+    """
+    Grain receipts of every account as columns sorted by account then
+    credTimestampMs, with the balance and paid amounts of every account.
+    Accounts are referred to by their position in accounts.json.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        # derived from the (immutable) columns only, computed once even when
+        # several sessions ask at the same time
+        self.cache = LazyCache({
+            'offsets': (),
+            'time_cumsum': (),
+            'account_cumsum': (),
+            'positions': (),
+        })
+
+    @classmethod
+    def from_accounts(cls, accounts_data: Dict[str, Any]) -> 'GrainLedger':
+        """
+        Parses the accounts and their allocation history in one pass
+        """
+        accounts = [acc['account'] for acc in accounts_data['accounts']]
+        history = [acc.get('allocationHistory', ()) for acc in accounts]
+        n_receipts = np.array([len(h) for h in history], dtype=np.int64)
+        receipts = [record for h in history for record in h]
+
+        account = np.repeat(np.arange(len(accounts), dtype=np.int32), n_receipts)
+        timestamps = np.array([record['credTimestampMs'] for record in receipts], dtype=np.int64).reshape(-1)
+        amount_high, amount_low = parse_amounts([record['grainReceipt']['amount'] for record in receipts])
+        # allocation histories are usually chronological already
+        order = np.lexsort((timestamps, account))
+        balance_high, balance_low = parse_amounts([acc['balance'] for acc in accounts])
+        paid_high, paid_low = parse_amounts([acc['paid'] for acc in accounts])
+        return cls({
+            'accounts.id': np.array([acc['identity']['id'] for acc in accounts], dtype=object),
+            'accounts.balance.high': balance_high,
+            'accounts.balance.low': balance_low,
+            'accounts.paid.high': paid_high,
+            'accounts.paid.low': paid_low,
+            'receipts.account': account[order],
+            'receipts.credTimestampMs': timestamps[order],
+            'receipts.amount.high': amount_high[order],
+            'receipts.amount.low': amount_low[order],
+        })
+
+    @property
+    def n_accounts(self) -> int:
+        return len(self.columns['accounts.id'])
+
+    @property
+    def n_receipts(self) -> int:
+        return len(self.columns['receipts.account'])
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.columns['receipts.credTimestampMs']
+
+    @property
+    def amounts(self) -> np.ndarray:
+        """
+        Receipt amounts in GRAIN
+        """
+        return to_grain(self.columns['receipts.amount.high'], self.columns['receipts.amount.low'])
+
+    @property
+    def balances(self) -> np.ndarray:
+        """
+        Account balances in GRAIN
+        """
+        return to_grain(self.columns['accounts.balance.high'], self.columns['accounts.balance.low'])
+
+    @property
+    def paid(self) -> np.ndarray:
+        """
+        Grain paid to every account, in GRAIN
+        """
+        return to_grain(self.columns['accounts.paid.high'], self.columns['accounts.paid.low'])
+
+    def balance(self, position: int) -> int:
+        """
+        Exact attoGRAIN balance of an account
+        """
+        return to_atto(self.columns['accounts.balance.high'][position], self.columns['accounts.balance.low'][position])
+
+    @property
+    def positions(self) -> Dict[str, int]:
+        """
+        Hash index from identity id to account position
+        """
+        return self.cache.compute('positions', lambda: {i: p for p, i in enumerate(self.columns['accounts.id'])})
+
+    def get_positions(self, identity_ids: Sequence[str]) -> np.ndarray:
+        """
+        Account positions of several identities (-1 when unknown)
+        """
+        positions = self.positions
+        return np.array([positions.get(i, -1) for i in identity_ids], dtype=np.int64).reshape(-1)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        Receipts of account `p` are the rows offsets[p]:offsets[p + 1]
+        """
+        return self.cache.compute('offsets', lambda: np.searchsorted(self.columns['receipts.account'],
+                                                                     np.arange(self.n_accounts + 1)))
+
+    def _time_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Receipt cred timestamps in order and the prefix sums of their limbs
+        """
+        def derive():
+            order = np.argsort(self.timestamps, kind='stable')
+            return (self.timestamps[order],
+                    _cumsum(self.columns['receipts.amount.high'][order]),
+                    _cumsum(self.columns['receipts.amount.low'][order]))
+
+        return self.cache.compute('time_cumsum', derive)
+
+    def _time_span(self, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        timestamps, _, _ = self._time_index()
+        i0 = 0 if start_ms is None else np.searchsorted(timestamps, start_ms, side='left')
+        i1 = len(timestamps) if end_ms is None else np.searchsorted(timestamps, end_ms, side='right')
+        return i0, max(i0, i1)
+
+    def total(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> int:
+        """
+        Exact attoGRAIN distributed for cred timestamps within
+        [`start_ms`, `end_ms`]
+        """
+        _, high, low = self._time_index()
+        i0, i1 = self._time_span(start_ms, end_ms)
+        return to_atto(high[i1] - high[i0], low[i1] - low[i0])
+
+    def over_time(self) -> Tuple[np.ndarray, Amounts]:
+        """
+        Distinct cred timestamps and the limbs of the grain distributed at each
+        """
+        timestamps, high, low = self._time_index()
+        if len(timestamps) == 0:
+            return timestamps, (high[:0], low[:0])
+        last = np.flatnonzero(np.diff(timestamps)) + 1
+        ends = np.concatenate([last, [len(timestamps)]])
+        starts = np.concatenate([[0], last])
+        return timestamps[starts], _normalize(high[ends] - high[starts], low[ends] - low[starts])
+
+    def _account_cumsum(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.cache.compute('account_cumsum', lambda: (_cumsum(self.columns['receipts.amount.high']),
+                                                             _cumsum(self.columns['receipts.amount.low'])))
+
+    def account_totals(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Amounts:
+        """
+        Limbs of the grain received by every account for cred timestamps
+        within [`start_ms`, `end_ms`]
+        """
+        offsets = self.offsets
+        if start_ms is None and end_ms is None:
+            high, low = self._account_cumsum()
+            return _normalize(np.diff(high[offsets]), np.diff(low[offsets]))
+        timestamps = self.timestamps
+        inside = np.ones(self.n_receipts, dtype=bool)
+        if start_ms is not None:
+            inside &= timestamps >= start_ms
+        if end_ms is not None:
+            inside &= timestamps <= end_ms
+        high = _cumsum(np.where(inside, self.columns['receipts.amount.high'], 0))
+        low = _cumsum(np.where(inside, self.columns['receipts.amount.low'], 0))
+        return _normalize(np.diff(high[offsets]), np.diff(low[offsets]))
+
+    def verify(self) -> List[str]:
+        """
+        Accounts (by identity id) whose paid amount is not the sum of their
+        receipts
+        """
+        high, low = self.account_totals()
+        paid_high, paid_low = self.columns['accounts.paid.high'], self.columns['accounts.paid.low']
+        mismatched = np.flatnonzero((high != paid_high) | (low != paid_low))
+        return [self.columns['accounts.id'][p] for p in mismatched]
+
+    def __repr__(self) -> str:
+        return "<{} - ({} accounts & {} receipts, {} distributed GRAIN)>".format(
+            self.__class__.__name__, self.n_accounts, self.n_receipts, self.total() / ATTO)
@@ -0,0 +1,192 @@
+"""
+Sparse cred graph engine.
+
+Edges of the weighted graph are kept as source/destination node indices
+(aligned with sortedNodeAddresses) and edge type codes. Cred flows like in
+sourcecred's Markov chain: every edge carries cred forwards (src -> dst)
+and backwards (dst -> src), and a node splits the cred it does not send
+back to the seed between its outgoing transitions, proportionally to their
+weights. The flow of a transition u -> v is then
+
+    (1 - alpha) * cred(u) * weight(u -> v) / total weight leaving u
+
+All flows are kept in scipy.sparse matrices, so neighborhoods, top
+contributors and per-plugin in/out flows are sparse row/column slices.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# probability of teleporting back to the seed (sourcecred's default alpha)
+DEFAULT_ALPHA = 0.05
+
+
+def _prefixes(address: str) -> List[str]:
+    """
+    Every prefix of a NUL-separated address, shortest first
+    """
+    parts = address.split('\x00')[:-1]
+    return ['\x00'.join(parts[:i]) + '\x00' for i in range(1, len(parts) + 1)]
+
+
+def _type_weights(types: List[str],
+                  weights: Dict[str, np.ndarray],
+                  defaults: Dict[str, np.ndarray],
+                  width: int) -> np.ndarray:
+    """
+    Weights of every type: the product of the weights of every prefix of
+    the type, the type itself defaulting to its plugin's default weight
+    """
+    result = np.ones((len(types), width))
+    for code, prefix in enumerate(types):
+        for key in _prefixes(prefix):
+            if key in weights:
+                result[code] *= weights[key]
+            elif key == prefix:
+                result[code] *= defaults.get(key, 1.)
+    return result
+
+
+def edge_type_weights(edge_types: List[str],
+                      edge_weights: Dict[str, Any],
+                      plugins: List[Dict[str, Any]],
+                      overrides: Dict[str, Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (forwards, backwards) weights of every edge type, with the weightsJSON
+    `edge_weights` updated by `overrides` ({prefix: {'forwards': f,
+    'backwards': b}}). Weights of single edges (keys longer than the type
+    prefix) are not applied.
+    """
+    weights = {k: np.array([f, b]) for k, f, b in zip(edge_weights['keys'], edge_weights['forwards'], edge_weights['backwards'])}
+    weights.update({k: np.array([w['forwards'], w['backwards']]) for k, w in (overrides or {}).items()})
+    defaults = {et['prefix']: np.array([et['defaultWeight']['forwards'], et['defaultWeight']['backwards']])
+                for plugin in plugins for et in plugin['edgeTypes']}
+    result = _type_weights(edge_types, weights, defaults, 2)
+    return result[:, 0], result[:, 1]
+
+
+def node_type_weights(node_types: List[str],
+                      node_weights: Dict[str, Any],
+                      plugins: List[Dict[str, Any]],
+                      overrides: Dict[str, float] = None) -> np.ndarray:
+    """
+    Weight of every node type, with the weightsJSON `node_weights` updated
+    by `overrides` ({prefix: weight})
+    """
+    weights = dict(zip(node_weights['keys'], node_weights['weight']))
+    weights.update(overrides or {})
+    defaults = {nt['prefix']: nt['defaultWeight'] for plugin in plugins for nt in plugin['nodeTypes']}
+    return _type_weights(node_types, weights, defaults, 1)[:, 0]
+
+
+def edge_type_plugins(edge_types: List[str], plugins: List[Dict[str, Any]]) -> List[str]:
+    """
+    Name of the plugin of every edge type ('Not Found' when unknown)
+    """
+    prefixes = {plugin['edgePrefix']: plugin['name'] for plugin in plugins}
+    return [next((prefixes[p] for p in _prefixes(prefix) if p in prefixes), 'Not Found') for prefix in edge_types]
+
+
+class CredGraph():
+    """
+    Cred flows between the nodes of the weighted graph
+    """
+
+    def __init__(self,
+                 edges: Dict[str, np.ndarray],
+                 edge_types: List[str],
+                 scores: np.ndarray,
+                 type_forwards: np.ndarray,
+                 type_backwards: np.ndarray,
+                 type_plugins: List[str],
+                 alpha: float = DEFAULT_ALPHA):
+        self.n_nodes = len(scores)
+        self.edge_types = edge_types
+        self.type_plugins = type_plugins
+        self.plugins = sorted(set(type_plugins))
+        self.alpha = alpha
+        src = edges['src'].astype(np.int64)
+        dst = edges['dst'].astype(np.int64)
+        edge_type = edges['type'].astype(np.int64)
+
+        # forward transitions then backward ones
+        origin = np.concatenate([src, dst])
+        target = np.concatenate([dst, src])
+        weight = np.concatenate([type_forwards[edge_type], type_backwards[edge_type]])
+        out_weight = np.bincount(origin, weights=weight, minlength=self.n_nodes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            flow = np.where(out_weight[origin] > 0,
+                            (1 - alpha) * scores[origin] * weight / out_weight[origin], 0.)
+        plugin_codes = np.array([self.plugins.index(p) for p in type_plugins], dtype=np.int64)
+        transition_plugin = np.tile(plugin_codes[edge_type], 2)
+
+        shape = (self.n_nodes, self.n_nodes)
+        # flows[u, v]: cred flowing from u to v, summed over parallel edges
+        self.flows = sparse.csr_matrix((flow, (origin, target)), shape=shape)
+        self.inflows = self.flows.tocsc()
+        by_plugin = (self.n_nodes, len(self.plugins))
+        self.outflows_by_plugin = sparse.csr_matrix((flow, (origin, transition_plugin)), shape=by_plugin)
+        self.inflows_by_plugin = sparse.csr_matrix((flow, (target, transition_plugin)), shape=by_plugin)
+
+    @classmethod
+    def from_cred_result(cls, cred_result: Dict[str, Any], alpha: float = DEFAULT_ALPHA) -> 'CredGraph':
+        edge_types = cred_result['edgeTypes']
+        forwards, backwards = edge_type_weights(edge_types, cred_result['edgeWeights'], cred_result['plugins'])
+        return cls(cred_result['edges'], edge_types, np.asarray(cred_result['nodes']['totalCred'], dtype=np.float64),
+                   forwards, backwards, edge_type_plugins(edge_types, cred_result['plugins']), alpha=alpha)
+
+    @property
+    def n_edges(self) -> int:
+        return self.flows.nnz
+
+    @staticmethod
+    def _slice(matrix: sparse.spmatrix, node: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = matrix.indptr[node], matrix.indptr[node + 1]
+        return matrix.indices[lo:hi], matrix.data[lo:hi]
+
+    def neighborhood(self, node: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Nodes sending cred to or receiving cred from `node`, with the cred
+        each sends to it (inflow) and receives from it (outflow)
+        """
+        in_nodes, in_flows = self._slice(self.inflows, node)
+        out_nodes, out_flows = self._slice(self.flows, node)
+        nodes = np.union1d(in_nodes, out_nodes)
+        inflow = np.zeros(len(nodes))
+        inflow[np.searchsorted(nodes, in_nodes)] = in_flows
+        outflow = np.zeros(len(nodes))
+        outflow[np.searchsorted(nodes, out_nodes)] = out_flows
+        return nodes, inflow, outflow
+
+    def _top(self, matrix: sparse.spmatrix, node: int, top_n: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        nodes, flows = self._slice(matrix, node)
+        if top_n is not None and len(flows) > top_n:
+            top = np.argpartition(flows, -top_n)[-top_n:]
+            nodes, flows = nodes[top], flows[top]
+        order = np.argsort(-flows, kind='stable')
+        return nodes[order], flows[order]
+
+    def top_contributors(self, node: int, top_n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nodes sending the most cred to `node`, and their flows
+        """
+        return self._top(self.inflows, node, top_n)
+
+    def top_recipients(self, node: int, top_n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nodes receiving the most cred from `node`, and their flows
+        """
+        return self._top(self.flows, node, top_n)
+
+    def flow_by_plugin(self, node: int) -> pd.DataFrame:
+        """
+        Cred flowing in and out of `node` through the edges of each plugin
+        """
+        return pd.DataFrame({'inflow': self.inflows_by_plugin[node].toarray().ravel(),
+                             'outflow': self.outflows_by_plugin[node].toarray().ravel()},
+                            index=pd.Index(self.plugins, name='plugin'))
+
+    def __repr__(self) -> str:
+        return "<{} - ({} nodes & {} weighted transitions)>".format(self.__class__.__name__, self.n_nodes, self.n_edges)
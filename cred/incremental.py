@@ -0,0 +1,345 @@
+"""
+Incremental CredData updates.
+
+Between two sourcecred runs most of the graph stays the same: nodes keep
+their address, historical intervals are kept and new ones are appended.
+`update_cred_data` diffs a new compact credResult against the previous
+CredData, reuses every array that did not change (so that the snapshot can
+link them instead of rewriting them) and carries over the derived tables
+whose inputs did not change. When only the cred of some nodes changed, the
+node table, ranking indexes and cred prefix sums are patched for their rows
+and the appended intervals; the other affected tables are recomputed.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from cred.cred_data import CredData
+from cred.grain_ledger import GrainLedger
+from cred.utils.columns import StringColumn, compact_node_columns, frame_view, same_column
+from cred.utils.search import UserSearchIndex
+from cred.utils.metrics import timed
+
+# rows compared at once when diffing the cred matrices
+ROW_CHUNK = 1 << 14
+
+# node columns holding the cred of the nodes (the 'nodeCred' input)
+CRED_COLUMNS = ('totalCred', 'credRow')
+
+
+class CredDiff():
+    """
+    Node level differences between the previous and the new cred result
+    """
+
+    def __init__(self, old_index: np.ndarray, changed: np.ndarray, n_old_nodes: int, n_old_intervals: int, n_intervals: int):
+        # position of each new node in the previous node columns, -1 if new
+        self.old_index = old_index
+        # new nodes whose total cred or cred over time changed (new nodes included)
+        self.changed = changed
+        self.n_old_nodes = n_old_nodes
+        self.n_old_intervals = n_old_intervals
+        self.n_intervals = n_intervals
+
+    @property
+    def added(self) -> int:
+        return int((self.old_index < 0).sum())
+
+    @property
+    def removed(self) -> int:
+        return self.n_old_nodes - (len(self.old_index) - self.added)
+
+    @property
+    def appended_intervals(self) -> int:
+        return self.n_intervals - self.n_old_intervals
+
+    def __repr__(self) -> str:
+        return '<{} - ({} changed, {} added & {} removed nodes, {} new intervals)>'.format(
+            self.__class__.__name__, int(self.changed.sum()), self.added, self.removed, self.appended_intervals)
+
+
+def _address_keys(columns: Dict[str, np.ndarray]) -> List[str]:
+    return [f'{s}\x00{t}\x00{i}' for s, t, i in zip(columns['address.source'],
+                                                   columns['address.nodeType'],
+                                                   columns['address.id'])]
+
+
+def _reuse(old: Any, new: Any) -> Any:
+    """
+    `old` when it holds the same values as `new`, so unchanged arrays are
+    shared with the previous snapshot
+    """
+    if old is None or len(old) != len(new):
+        return new
+    if isinstance(new, list):
+        return old if list(old) == new else new
+    if isinstance(new, (pd.Categorical, StringColumn)):
+        return old if same_column(new, old) else new
+    if np.asarray(old).shape != np.asarray(new).shape:
+        return new
+    return old if np.array_equal(old, new) else new
+
+
+@timed()
+def diff_cred_results(previous: CredData, cred_result: Dict[str, Any]) -> Optional[CredDiff]:
+    """
+    Matches the nodes of `cred_result` to the previous nodes by address and
+    finds the ones whose cred changed. Returns None when the intervals of
+    the previous result are not a prefix of the new ones.
+    """
+    old_intervals = previous.intervals
+    new_intervals = cred_result['intervals']
+    n_old = len(old_intervals)
+    if len(new_intervals) < n_old or list(new_intervals[:n_old]) != list(old_intervals):
+        return None
+
+    old_columns = previous.node_columns
+    new_columns = cred_result['nodes']
+    if all(old_columns[name] is new_columns[name] for name in ('address.source', 'address.nodeType', 'address.id')):
+        old_index = np.arange(len(new_columns['address.id']))
+    else:
+        old_index = pd.Index(_address_keys(old_columns)).get_indexer(_address_keys(new_columns))
+
+    matched = np.flatnonzero(old_index >= 0)
+    changed = old_index < 0
+    changed[matched] |= old_columns['totalCred'][old_index[matched]] != new_columns['totalCred'][matched]
+
+    old_matrix = previous.cred_matrix
+    new_matrix = cred_result['credMatrix']
+    old_rows = old_columns['credRow'][old_index[matched]]
+    new_rows = new_columns['credRow'][matched]
+    for start in range(0, len(matched), ROW_CHUNK):
+        chunk = slice(start, start + ROW_CHUNK)
+        history = (new_matrix[new_rows[chunk], :n_old] != old_matrix[old_rows[chunk]]).any(axis=1)
+        appended = (new_matrix[new_rows[chunk], n_old:] != 0).any(axis=1)
+        changed[matched[chunk]] |= history | appended
+    return CredDiff(old_index, changed, len(old_columns['address.id']), n_old, len(new_intervals))
+
+
+def _identities_changed(previous: CredData, cred: CredData, diff: CredDiff) -> bool:
+    old_identities = previous.node_columns['address.nodeType'] == 'IDENTITY'
+    new_identities = cred.node_columns['address.nodeType'] == 'IDENTITY'
+    if old_identities.sum() != new_identities.sum():
+        return True
+    return bool((diff.changed & new_identities).any() or (diff.old_index[new_identities] < 0).any())
+
+
+def _frame_column(series: pd.Series) -> Any:
+    return series.array if series.dtype.name == 'category' else series.to_numpy()
+
+
+def _patch_cumsum(cumsum: np.ndarray, cred_matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Cumulative cred matrix (see CredData.cred_cumsum) from the previous
+    one: extended over the appended intervals and recomputed for `rows`
+    """
+    n_old = cumsum.shape[1] - 1
+    patched = np.empty((cred_matrix.shape[0], cred_matrix.shape[1] + 1), dtype=np.float64)
+    patched[:, :n_old + 1] = cumsum
+    if cred_matrix.shape[1] > n_old:
+        np.cumsum(np.hstack([cumsum[:, n_old:], cred_matrix[:, n_old:]]), axis=1, out=patched[:, n_old:])
+    patched[rows, 1:] = np.cumsum(cred_matrix[rows], axis=1)
+    return patched
+
+
+def _patch_tables(previous: CredData, cred: CredData, diff: CredDiff, changed: List[str]) -> Dict[str, Any]:
+    """
+    Derived tables of `previous` patched for the nodes whose cred changed
+    and the appended intervals, when no node was added, removed or moved
+    """
+    if 'nodes' in changed:
+        return {}
+    patches = {}
+    if cred.has_graph and previous.cache.get('identity_nodes') is not None:
+        # the graph nodes are the same nodes
+        patches['identity_nodes'] = previous.cache['identity_nodes']
+    columns = cred.node_columns
+    n_old = diff.n_old_intervals
+    df = previous.cache.get('df')
+    if 'nodeCred' in changed and df is not None:
+        patches['df'] = frame_view({name: columns[name] if name in CRED_COLUMNS else _frame_column(df[name])
+                                    for name in df.columns})
+    interval_ends = previous.cache.get('interval_ends')
+    if 'intervals' in changed and interval_ends is not None:
+        appended = np.array([interval['endTimeMs'] for interval in cred.intervals[n_old:]], dtype=np.int64)
+        patches['interval_ends'] = np.concatenate([interval_ends, appended])
+    cred_matrix = cred.cred_matrix
+    if ('credMatrix' not in changed or columns['credRow'] is not previous.node_columns['credRow']
+            or cred_matrix.shape[0] != previous.cred_matrix.shape[0]):
+        return patches
+    # same rows: only the ones of the changed nodes hold new values
+    rows = np.unique(columns['credRow'][diff.changed])
+    cumsum = previous.cache.get('cred_cumsum')
+    if cumsum is not None:
+        patches['cred_cumsum'] = _patch_cumsum(cumsum, cred_matrix, rows)
+    df_cred_ot = previous.cache.get('df_cred_ot')
+    if df_cred_ot is not None:
+        amount = df_cred_ot.amount.to_numpy() + (cred_matrix[rows, :n_old] - previous.cred_matrix[rows]).sum(axis=0)
+        amount = np.concatenate([amount, cred_matrix[:, n_old:].sum(axis=0)])
+        patches['df_cred_ot'] = pd.DataFrame({'amount': amount}, index=cred._dt_index())
+    return patches
+
+
+def _reindex_ranking(previous: CredData, cred: CredData):
+    """
+    Carries the rank index and user search of `previous` over to the
+    recomputed ranking of `cred` when it ranks the same users, updated for
+    the positions that changed
+    """
+    old_rank = previous.cache['df_rank']
+    df_rank = cred.get_user_ranking()
+    if len(df_rank) != len(old_rank):
+        return
+    old_users = old_rank[['id', 'user']].sort_values('id').to_numpy()
+    if not np.array_equal(old_users, df_rank[['id', 'user']].sort_values('id').to_numpy()):
+        return
+    ids, users = df_rank.id.to_numpy(), df_rank.user
+    moved = np.flatnonzero(old_rank.id.to_numpy() != ids)
+    rank_index = previous.cache.get('rank_index')
+    user_search = previous.cache.get('user_search')
+    if len(moved) and rank_index is not None:
+        by_id = dict(rank_index['id'])
+        by_id.update(zip(ids[moved].tolist(), moved.tolist()))
+        # first position of the usernames that moved
+        firsts = users[users.isin(set(users.iloc[moved]))].drop_duplicates()
+        by_user = dict(rank_index['user'])
+        by_user.update(zip(firsts.tolist(), firsts.index.tolist()))
+        rank_index = {'user': by_user, 'id': by_id}
+    if len(moved) and user_search is not None:
+        user_search = user_search.reordered(pd.unique(users))
+    cred.cache['rank_index'] = rank_index
+    cred.cache['user_search'] = user_search
+
+
+@timed()
+def update_cred_data(previous: CredData,
+                     cred_result: Dict[str, Any],
+                     accounts_data: Dict[str, Any],
+                     accounts_changed: bool = True,
+                     verify: bool = False) -> CredData:
+    """
+    Builds the CredData of a new compact `cred_result` from the previous
+    one, recomputing only the derived tables affected by the change.
+
+    With `verify`, the result is checked against a full rebuild; the full
+    rebuild is returned when they differ.
+    """
+    if previous.compact:
+        # compared with the previous columns in the same representation
+        cred_result = dict(cred_result, nodes=compact_node_columns(cred_result['nodes']))
+    diff = diff_cred_results(previous, cred_result)
+    if diff is None:
+        print('Cred intervals were rewritten, rebuilding CredData')
+        return CredData(cred_result, accounts_data, compact=previous.compact)
+
+    patched = dict(cred_result)
+    patched['nodes'] = {name: _reuse(previous.node_columns.get(name), column)
+                        for name, column in cred_result['nodes'].items()}
+    patched['credMatrix'] = _reuse(previous.cred_matrix, cred_result['credMatrix'])
+    for weights in ('nodeWeights', 'edgeWeights'):
+        patched[weights] = {name: _reuse(previous.cred_result[weights].get(name), values)
+                            for name, values in cred_result[weights].items()}
+    patched['edges'] = {name: _reuse(previous.cred_result['edges'].get(name), column)
+                        for name, column in cred_result['edges'].items()}
+    cred = CredData(patched, accounts_data, compact=previous.compact)
+
+    columns = patched['nodes']
+    same_nodes = all(columns[name] is previous.node_columns.get(name) for name in columns if name not in CRED_COLUMNS)
+    same_node_cred = all(columns[name] is previous.node_columns.get(name) for name in CRED_COLUMNS)
+    same_intervals = diff.appended_intervals == 0
+    same_cred = patched['credMatrix'] is previous.cred_matrix and same_intervals
+    same_weights = (patched['plugins'] == previous.cred_result['plugins']
+                    and all(patched[w][name] is previous.cred_result[w].get(name)
+                            for w in ('nodeWeights', 'edgeWeights') for name in patched[w]))
+    same_edges = (patched['edgeTypes'] == previous.cred_result['edgeTypes']
+                  and all(patched['edges'][name] is previous.cred_result['edges'].get(name) for name in patched['edges']))
+    changed = [name for name, same in (('nodes', same_nodes), ('nodeCred', same_node_cred), ('credMatrix', same_cred),
+                                       ('intervals', same_intervals), ('weights', same_weights),
+                                       ('edges', same_edges), ('accounts', not accounts_changed)) if not same]
+    # every derived table of the previous CredData, except the ones derived
+    # from a changed input (see cred.cred_data.DEPENDENCIES), some of them
+    # patched for the changed rows and appended intervals instead
+    cred.cache.update(previous.cache)
+    patches = _patch_tables(previous, cred, diff, changed)
+    cred.invalidate(*changed)
+    cred.cache.update(patches)
+    if cred.cache['df_rank'] is None and previous.cache.get('df_rank') is not None:
+        if not accounts_changed and not _identities_changed(previous, cred, diff):
+            # same users and cred: only the cred matrix rows may have moved
+            identities = cred.node_columns['address.nodeType'] == 'IDENTITY'
+            rows = dict(zip(cred.node_columns['address.id'][identities], cred.node_columns['credRow'][identities]))
+            df_rank = previous.cache['df_rank']
+            cred_rows = df_rank.id.map(rows).astype(df_rank.credRow.dtype)
+            if not cred_rows.equals(df_rank.credRow):
+                df_rank = df_rank.copy()
+                df_rank['credRow'] = cred_rows
+            cred.cache['df_rank'] = df_rank
+            cred.cache['rank_index'] = previous.cache.get('rank_index')
+            cred.cache['user_search'] = previous.cache.get('user_search')
+        else:
+            _reindex_ranking(previous, cred)
+    cred.update_diff = diff
+
+    if verify:
+        rebuilt = CredData(cred_result, accounts_data, compact=previous.compact)
+        mismatches = verify_cred_data(cred, rebuilt)
+        if mismatches:
+            print(f'Incremental update differs from a full rebuild in {", ".join(mismatches)}; using the rebuild')
+            return rebuilt
+    return cred
+
+
+def _same_frame(a: Any, b: Any) -> bool:
+    if isinstance(a, tuple):
+        return len(a) == len(b) and all(_same_frame(x, y) for x, y in zip(a, b))
+    if isinstance(a, GrainLedger):
+        return _same_frame(a.columns, b.columns)
+    if isinstance(a, UserSearchIndex):
+        return a.users == b.users
+    if isinstance(a, np.ndarray):
+        if a.dtype.kind not in 'biuf':
+            return np.array_equal(a, b)
+        return a.shape == b.shape and np.allclose(a, b, rtol=1e-9, atol=1e-12)
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same_frame(a[k], b[k]) for k in a)
+    if not isinstance(a, (pd.Series, pd.DataFrame)):
+        return a == b
+    try:
+        if isinstance(a, pd.Series):
+            pd.testing.assert_series_equal(a, b, check_exact=False, rtol=1e-9)
+        else:
+            pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=1e-9)
+    except AssertionError:
+        return False
+    return True
+
+
+@timed()
+def verify_cred_data(cred: CredData, rebuilt: CredData) -> List[str]:
+    """
+    Names of the derived tables of `cred` that differ from the full
+    rebuild `rebuilt`
+    """
+    cred.warm_up()
+    rebuilt.warm_up()
+    rebuilt.cred_cumsum
+    rebuilt.rank_index
+    rebuilt.user_search
+    rebuilt.interval_ends
+    mismatches = []
+    for name, value in cred.cache.items():
+        expected = rebuilt.cache.get(name)
+        if value is None or expected is None:
+            continue
+        if not _same_frame(value, expected):
+            mismatches.append(name)
+    for name in rebuilt.node_columns:
+        if not same_column(cred.node_columns[name], rebuilt.node_columns[name]):
+            mismatches.append(f'nodes.{name}')
+    if not np.array_equal(cred.cred_matrix, rebuilt.cred_matrix):
+        mismatches.append('credMatrix')
+    for name in rebuilt.cred_result['edges']:
+        if not np.array_equal(cred.cred_result['edges'][name], rebuilt.cred_result['edges'][name]):
+            mismatches.append(f'edges.{name}')
+    return mismatches
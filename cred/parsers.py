@@ -0,0 +1,96 @@
+"""
+Parser backends for the cred output of sourcecred instances.
+
+Every backend reads one file of the instance's `output/` directory into
+the compact cred result used by CredData (see
+cred.cred_result.compact_cred_result):
+
+- 'timeline': credResult.json of sourcecred <= 0.7 (TimelineCred),
+  streamed. It holds every node of the weighted graph, its edges, weights
+  and plugins.
+- 'participants': credGrainView.json of sourcecred >= 0.8, the cred of
+  every participant per interval. It is a small fraction of the graph's
+  size and is all the ranking and cred over time need. The graph views
+  (cred flow, user neighborhoods, what-if weights) load the full graph
+  with the backend's `graph_format` when first used (see
+  CredData.graph_result). Instances that don't publish it (sourcecred's
+  CredGraph output has no reader here) have no graph views.
+"""
+import abc
+import json
+from typing import Any, BinaryIO, Dict, Optional
+
+from cred.cred_result import from_cred_grain_view
+from cred.utils.io import stream_cred_result
+from cred.utils.metrics import timed
+
+DEFAULT_FORMAT = 'timeline'
+
+
+class CredParser(abc.ABC):
+    """
+    Reads an output file of a sourcecred instance into a compact cred result
+    """
+    # file parsed, under the instance's output/ directory
+    filename = None
+    # whether the results hold the whole weighted graph
+    full_graph = True
+    # backend loading the full graph when the results don't hold it
+    graph_format = None
+
+    @property
+    def source(self) -> str:
+        """
+        Name of the parsed file in the snapshot sources (e.g. 'credResult')
+        """
+        return self.filename.rsplit('.', 1)[0]
+
+    @abc.abstractmethod
+    def parse(self, fp: BinaryIO) -> Dict[str, Any]:
+        """
+        Compact cred result of the file read from `fp`
+        """
+
+    def __repr__(self) -> str:
+        return "<{} - ({})>".format(self.__class__.__name__, self.filename)
+
+
+class TimelineCredParser(CredParser):
+    """
+    credResult.json (TimelineCred format, sourcecred <= 0.7), streamed (see
+    cred.utils.io.stream_cred_result)
+    """
+    filename = 'credResult.json'
+
+    def parse(self, fp: BinaryIO) -> Dict[str, Any]:
+        return stream_cred_result(fp)
+
+
+class CredGrainViewParser(CredParser):
+    """
+    credGrainView.json (sourcecred >= 0.8): the participants' cred per
+    interval, without the graph
+    """
+    filename = 'credGrainView.json'
+    full_graph = False
+    graph_format = 'timeline'
+
+    @timed()
+    def parse(self, fp: BinaryIO) -> Dict[str, Any]:
+        return from_cred_grain_view(json.load(fp))
+
+
+PARSERS = {
+    'timeline': TimelineCredParser,
+    'participants': CredGrainViewParser,
+}
+
+
+def get_parser(cred_format: Optional[str] = None) -> CredParser:
+    """
+    Parser backend of a cred output format (default: 'timeline')
+    """
+    cred_format = cred_format or DEFAULT_FORMAT
+    if cred_format not in PARSERS:
+        raise ValueError(f'Unknown cred format {cred_format!r}, expected one of {", ".join(PARSERS)}')
+    return PARSERS[cred_format]()
@@ -0,0 +1,166 @@
+"""
+Several sourcecred instances served by one process.
+
+Each instance has its own CredDataService (and data, snapshot and bundle
+directories). Instances are loaded concurrently: their files are fetched
+in parallel and their snapshots derived in worker processes, then loaded
+memory-mapped, so loading takes about as long as the slowest instance.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cred.cred_data import CredData
+from cred.service import CredDataService, get_service
+from cred.utils.metrics import timed
+
+
+def parse_instances(value: str) -> Dict[str, str]:
+    """
+    Instances from comma-separated name=base_uri pairs
+    """
+    instances = dict()
+    for pair in value.split(','):
+        name, _, base_uri = pair.strip().partition('=')
+        if not base_uri:
+            raise ValueError(f'Expected name=base_uri, got {pair!r}')
+        instances[name.strip()] = base_uri.strip()
+    return instances
+
+
+class CredRegistry():
+    """
+    CredDataServices of several sourcecred instances, by name, and the
+    comparisons between them
+    """
+
+    def __init__(self, instances: Dict[str, str], data_dir: str = 'data', bundle_dir: str = None, **kwargs):
+        self.instances = dict(instances)
+        self.services = {
+            name: get_service(base_uri,
+                              data_dir=os.path.join(data_dir, name),
+                              snapshot_dir=os.path.join(data_dir, name, 'snapshots'),
+                              bundle_dir=os.path.join(bundle_dir, name) if bundle_dir else None,
+                              **kwargs)
+            for name, base_uri in self.instances.items()
+        }
+        self._load_lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> CredDataService:
+        return self.services[name]
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    @timed()
+    def load(self, processes: Optional[int] = None):
+        """
+        Loads every instance not loaded yet, concurrently. Their snapshots
+        are derived in `processes` worker processes (default: one per
+        instance, up to the CPU count; 0 derives them in threads).
+        """
+        with self._load_lock:
+            pending = {name: service for name, service in self.services.items() if service.current()[1] is None}
+            if not pending:
+                return
+            if processes is None:
+                processes = min(len(pending), os.cpu_count() or 1)
+            # a single instance is derived in its loading thread
+            pool = ProcessPoolExecutor(processes, mp_context=get_context('spawn')) if processes and len(pending) > 1 else None
+            try:
+                with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='cred-load') as threads:
+                    futures = {name: threads.submit(service.refresh, pool) for name, service in pending.items()}
+                    for name, future in futures.items():
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(f'Error while loading {name} ({self.instances[name]}): {e!r}')
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+    def creds(self) -> Dict[str, CredData]:
+        """
+        Current CredData of every loaded instance, loading them first if
+        needed
+        """
+        self.load()
+        creds = {name: service.current()[1] for name, service in self.services.items()}
+        return {name: cred for name, cred in creds.items() if cred is not None}
+
+    def snapshot_keys(self) -> Tuple[str, ...]:
+        """
+        Snapshot key of every instance, identifying the data compared
+        """
+        return tuple(cred.snapshot_key or str(id(cred)) for cred in self.creds().values())
+
+    def compare_totals(self) -> pd.DataFrame:
+        """
+        Size and distributed cred and grain of every instance
+        """
+        rows = dict()
+        for name, cred in self.creds().items():
+            intervals = cred.get_dt_intervals()
+            rows[name] = {
+                'nodes': cred.total_nodes,
+                'users': len(cred.get_user_ranking()),
+                'distributedCred': cred.distributed_cred,
+                'distributedGrain': cred.distributed_grain,
+                'intervals': len(intervals),
+                'firstInterval': intervals[0] if intervals else None,
+                'lastInterval': intervals[-1] if intervals else None,
+            }
+        return pd.DataFrame.from_dict(rows, orient='index').rename_axis('instance')
+
+    def get_cred_over_time(self) -> pd.DataFrame:
+        """
+        Distributed cred of every instance (columns) by week, so that
+        instances whose intervals end at different times line up
+        """
+        series = {name: cred.get_cred_over_time().amount for name, cred in self.creds().items()}
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1).resample('W').sum(min_count=1).rename_axis('date')
+
+    def get_overlapping_contributors(self, min_instances: int = 2) -> pd.DataFrame:
+        """
+        Users (matched by username) with cred in at least `min_instances`
+        instances, with their cred and rank in each, by number of instances
+        and total cred
+        """
+        columns = dict()
+        for name, cred in self.creds().items():
+            df_rank = cred.get_user_ranking()
+            df_rank = df_rank.assign(rank=np.arange(1, len(df_rank) + 1))
+            df_rank = df_rank[df_rank.totalCred > 0].drop_duplicates('user').set_index('user')
+            columns[f'{name} cred'] = df_rank.totalCred
+            columns[f'{name} rank'] = df_rank['rank']
+        df = pd.DataFrame(columns)
+        cred_columns = df.columns[::2]
+        df.insert(0, 'instances', df[cred_columns].notna().sum(axis=1))
+        df.insert(1, 'totalCred', df[cred_columns].sum(axis=1))
+        df = df[df.instances >= min_instances]
+        return df.sort_values(['instances', 'totalCred'], ascending=False).rename_axis('user')
+
+    def __repr__(self) -> str:
+        return "<{} - ({})>".format(self.__class__.__name__, ', '.join(f'{name}: {uri}' for name, uri in self.instances.items()))
+
+
+_registries: Dict[Tuple[Tuple[str, str], ...], CredRegistry] = dict()
+_registries_lock = threading.Lock()
+
+
+def get_registry(instances: Dict[str, str], **kwargs) -> CredRegistry:
+    """
+    Process-wide CredRegistry of `instances`
+    """
+    key = tuple(sorted(instances.items()))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = CredRegistry(instances, **kwargs)
+        return _registries[key]
@@ -0,0 +1,247 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cred.bundle import load_bundle, read_head
+from cred.cred_data import CredData
+from cred.parsers import get_parser
+from cred.snapshot import SNAPSHOT_DIR, load_cred_data, load_snapshot
+from cred.utils.cache import DEFAULT_CACHE_SIZE, RenderCache
+from cred.utils.io import download_file, fetch_file
+from cred.utils.metrics import METRICS, timed
+
+DEFAULT_REFRESH_INTERVAL = 3600
+# seconds between two reads of the bundle generation
+DEFAULT_BUNDLE_POLL_INTERVAL = 5
+
+
+def build_snapshot(cred_filename: str,
+                   accounts_filename: str,
+                   directory: str,
+                   compact: bool = False,
+                   cred_format: str = None) -> str:
+    """
+    Derives the snapshot of the given files (see cred.snapshot) and returns
+    its key. Meant to run in a worker process: the caller then loads the
+    snapshot memory-mapped instead of receiving the CredData.
+    """
+    return load_cred_data(cred_filename, accounts_filename, directory, compact=compact,
+                          cred_format=cred_format).snapshot_key
+
+
+class CredDataService():
+    """
+    Owns the current CredData snapshot of a sourcecred instance and shares
+    it, read-only, between every dashboard session of the process.
+
+    A background thread re-fetches the instance data every
+    `refresh_interval` seconds, builds the new snapshot off the request
+    path and swaps it in atomically. The rendered views cached in
+    `render_cache` are dropped on every swap.
+
+    With a `bundle_dir` (see cred.bundle), the service loads the bundles
+    precomputed by the batch job instead of fetching and deriving the data
+    itself, and only falls back to that when there is no bundle yet (never
+    with `bundle_only`: it waits for the first bundle instead). The bundle
+    generation is read every `bundle_poll_interval` seconds, and a new one
+    attached memory-mapped, read-only.
+
+    `cred_format` picks the cred output parsed (see cred.parsers). With a
+    participants-only format, the full graph is only fetched and parsed
+    when a graph view first needs it (see CredData.graph_result).
+    """
+
+    def __init__(self,
+                 base_uri: str,
+                 data_dir: str = 'data',
+                 snapshot_dir: str = SNAPSHOT_DIR,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 render_cache_size: int = DEFAULT_CACHE_SIZE,
+                 verify_updates: bool = False,
+                 bundle_dir: str = None,
+                 compact: bool = False,
+                 cred_format: str = None,
+                 bundle_only: bool = False,
+                 bundle_poll_interval: float = DEFAULT_BUNDLE_POLL_INTERVAL):
+        self.base_uri = base_uri
+        self.data_dir = data_dir
+        self.cred_format = cred_format
+        self.parser = get_parser(cred_format)
+        self.cred_filename = os.path.join(data_dir, self.parser.filename)
+        self.accounts_filename = os.path.join(data_dir, 'accounts.json')
+        self.snapshot_dir = snapshot_dir
+        self.refresh_interval = refresh_interval
+        # check incremental updates against a full rebuild
+        self.verify_updates = verify_updates
+        # compact storage mode of the CredData built here (see CredData)
+        self.compact = compact
+        self.bundle_dir = bundle_dir
+        self.bundle_only = bundle_only
+        self.bundle_poll_interval = bundle_poll_interval
+        # generation of the last bundle loaded
+        self.bundle_generation = None
+        self.version = 0
+        self.last_refresh = None
+        self.render_cache = RenderCache(render_cache_size)
+        self._cred = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        METRICS.add_collector(f'service:{base_uri}', self.collect_metrics)
+
+    @property
+    def cred(self) -> CredData:
+        """
+        Current CredData snapshot, loading it first if needed
+        """
+        if self._cred is None:
+            self.refresh()
+            if self._cred is None and self.bundle_only:
+                raise LookupError(f'No bundle in {self.bundle_dir} yet')
+        return self._cred
+
+    def current(self) -> Tuple[int, Optional[CredData]]:
+        """
+        (version, CredData) pair of the current snapshot
+        """
+        with self._lock:
+            return self.version, self._cred
+
+    def on_swap(self, callback: Callable[[int, CredData], None]):
+        """
+        Registers a callback run with (version, cred) after each swap
+        """
+        self._listeners.append(callback)
+
+    @timed()
+    def refresh(self, executor: Executor = None) -> bool:
+        """
+        Fetches the instance data and swaps in a new snapshot when it
+        changed. Returns True when a new snapshot was swapped in.
+
+        The first snapshot is derived in `executor` (e.g. a process pool,
+        see `build_snapshot`) when given.
+        """
+        with self._refresh_lock:
+            cred = self._load(executor)
+            self.last_refresh = time.time()
+            if cred is None or (self._cred is not None and cred.snapshot_key == self._cred.snapshot_key):
+                return False
+            if not cred.has_graph:
+                cred.graph_source = self._load_graph
+            with self._lock:
+                self._cred = cred
+                self.version += 1
+                version = self.version
+            self.render_cache.clear()
+        for callback in self._listeners:
+            callback(version, cred)
+        return True
+
+    def _fetch(self) -> List[Optional[bool]]:
+        """
+        Downloads the cred output and accounts.json concurrently (see
+        download_file for the results)
+        """
+        files = [(f'{self.base_uri}/output/{self.parser.filename}', self.cred_filename),
+                 (f'{self.base_uri}/output/accounts.json', self.accounts_filename)]
+        with ThreadPoolExecutor(max_workers=len(files), thread_name_prefix='cred-fetch') as pool:
+            return list(pool.map(lambda file: download_file(*file), files))
+
+    def _load(self, executor: Executor = None) -> Optional[CredData]:
+        """
+        CredData of the instance, or None when it did not change
+        """
+        if self.bundle_dir is not None:
+            head = read_head(self.bundle_dir)
+            if self._cred is not None and (head is None or head[0] == self.bundle_generation):
+                return None
+            cred = load_bundle(self.bundle_dir, key=head[1]) if head is not None else None
+            if cred is not None:
+                self.bundle_generation = head[0]
+            if cred is not None or self._cred is not None or self.bundle_only:
+                return cred
+            print(f'No bundle in {self.bundle_dir}, loading {self.base_uri} instead')
+
+        changed = self._fetch()
+        if self._cred is not None and not any(changed):
+            return None
+        if self._cred is None and executor is not None:
+            key = executor.submit(build_snapshot, self.cred_filename, self.accounts_filename, self.snapshot_dir,
+                                  self.compact, self.cred_format).result()
+            cred = load_snapshot(key, self.snapshot_dir, verify=False, compact=self.compact)
+            if cred is not None:
+                return cred
+        return load_cred_data(self.cred_filename, self.accounts_filename, self.snapshot_dir,
+                              previous=self._cred, verify=self.verify_updates, compact=self.compact,
+                              cred_format=self.cred_format)
+
+    @timed()
+    def _load_graph(self) -> Dict[str, Any]:
+        """
+        Compact cred result with the full graph of the instance, for a
+        participants-only CredData: fetched and parsed on first use
+        """
+        parser = get_parser(self.parser.graph_format)
+        filename = os.path.join(self.data_dir, parser.filename)
+        if not fetch_file(f'{self.base_uri}/output/{parser.filename}', filename):
+            raise LookupError(f'{self.base_uri} does not publish output/{parser.filename}, '
+                              f'which the cred flow and what-if views need')
+        with open(filename, 'rb') as f:
+            return parser.parse(f)
+
+    def collect_metrics(self):
+        """
+        Snapshot version and render cache samples for the metrics endpoint
+        """
+        labels = {'instance': self.base_uri}
+        cache = self.render_cache.stats()
+        return [
+            ('cred_snapshot_version', 'gauge', labels, self.version),
+            ('cred_bundle_generation', 'gauge', labels, self.bundle_generation or 0),
+            ('cred_last_refresh_timestamp_seconds', 'gauge', labels, self.last_refresh or 0.),
+            ('cred_render_cache_hits_total', 'counter', labels, cache['hits']),
+            ('cred_render_cache_misses_total', 'counter', labels, cache['misses']),
+            ('cred_render_cache_entries', 'gauge', labels, cache['size']),
+        ]
+
+    def _run(self):
+        interval = self.bundle_poll_interval if self.bundle_dir is not None else self.refresh_interval
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f'Error while refreshing {self.base_uri}: {e!r}')
+
+    def start(self) -> 'CredDataService':
+        """
+        Starts the background refresh thread
+        """
+        if self._thread is None and self.refresh_interval:
+            self._thread = threading.Thread(target=self._run, name='cred-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_services: Dict[str, CredDataService] = dict()
+_services_lock = threading.Lock()
+
+
+def get_service(base_uri: str, **kwargs) -> CredDataService:
+    """
+    Process-wide CredDataService for `base_uri`, started on first use
+    """
+    with _services_lock:
+        if base_uri not in _services:
+            _services[base_uri] = CredDataService(base_uri, **kwargs).start()
+        return _services[base_uri]
@@ -0,0 +1,424 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from cred.cred_data import CredData
+from cred.grain_ledger import GrainLedger
+from cred.incremental import update_cred_data
+from cred.cred_result import compact_cred_result
+from cred.parsers import get_parser
+from cred.utils.columns import StringColumn, frame_view
+from cred.utils.executor import get_executor
+from cred.utils.metrics import timed
+
+SNAPSHOT_VERSION = 7
+SNAPSHOT_DIR = 'data/snapshots'
+MANIFEST = 'manifest.json'
+# the node table is left out: it is built from the memory-mapped node
+# columns when needed, instead of being copied into every process
+FRAMES = ('df_rank', 'df_grain', 'df_accounts', 'df_cred_ot', 'df_cred_eflow', 'df_cred_nflow')
+# derived hash indexes, stored as JSON
+INDEXES = ('rank_index',)
+# worker threads deriving the independent tables of a new snapshot
+WARM_UP_WORKERS = 4
+# complete snapshots kept by prune_snapshots, so processes still loading
+# one of the previous generations can finish
+KEEP_SNAPSHOTS = 3
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def content_hash(*filenames: str) -> str:
+    """
+    Hash of the snapshot format version and the contents of the source files
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f'v{SNAPSHOT_VERSION}'.encode())
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def snapshot_key(source_hashes: Dict[str, str]) -> str:
+    """
+    Snapshot key of a set of source files, from their content hashes
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f'v{SNAPSHOT_VERSION}'.encode())
+    for name in sorted(source_hashes):
+        h.update(f'{name}={source_hashes[name]}\x00'.encode())
+    return h.hexdigest()
+
+
+def _crc32(path: str) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _write_array(directory: str, name: str, values: Any) -> Dict[str, Any]:
+    array = np.asarray(values)
+    if array.dtype.kind == 'U':
+        # numpy strips trailing NULs from fixed-width strings, and
+        # sourcecred addresses end with one
+        array = np.array(values, dtype=object)
+    values = array
+    filename = f'{name}.npy'
+    path = os.path.join(directory, filename)
+    np.save(path, values, allow_pickle=values.dtype == object)
+    return {
+        'file': filename,
+        'dtype': values.dtype.str,
+        'size': os.path.getsize(path),
+        'crc32': _crc32(path),
+    }
+
+
+def _read_array(directory: str, meta: Dict[str, Any], mmap_mode: Optional[str], verify: bool) -> np.ndarray:
+    path = os.path.join(directory, meta['file'])
+    if os.path.getsize(path) != meta['size']:
+        raise SnapshotError(f'{meta["file"]} has the wrong size')
+    if verify and _crc32(path) != meta['crc32']:
+        raise SnapshotError(f'{meta["file"]} is corrupted')
+    # object columns are pickled and can't be memory-mapped
+    if meta['dtype'] == '|O':
+        return np.load(path, allow_pickle=True)
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def _write_column(directory: str, name: str, values: Any) -> Dict[str, Any]:
+    """
+    Writes an array, a categorical (its codes and categories) or a
+    StringColumn (its buffer and offsets), so that only the categories are
+    pickled
+    """
+    if isinstance(values, pd.Categorical):
+        return {
+            'kind': 'categorical',
+            'codes': _write_array(directory, f'{name}.codes', values.codes),
+            'categories': _write_array(directory, f'{name}.categories', values.categories.to_numpy()),
+        }
+    if isinstance(values, StringColumn):
+        return {
+            'kind': 'strings',
+            'data': _write_array(directory, f'{name}.data', values.data),
+            'offsets': _write_array(directory, f'{name}.offsets', values.offsets),
+        }
+    return _write_array(directory, name, values)
+
+
+def _read_column(directory: str, meta: Dict[str, Any], mmap_mode: Optional[str], verify: bool) -> Any:
+    kind = meta.get('kind')
+    if kind == 'categorical':
+        return pd.Categorical.from_codes(_read_array(directory, meta['codes'], mmap_mode, verify),
+                                         _read_array(directory, meta['categories'], mmap_mode, verify))
+    if kind == 'strings':
+        return StringColumn(_read_array(directory, meta['data'], mmap_mode, verify),
+                            _read_array(directory, meta['offsets'], mmap_mode, verify))
+    return _read_array(directory, meta, mmap_mode, verify)
+
+
+def _link_array(base: str, directory: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Hard-links (or copies) an array file of the `base` snapshot
+    """
+    src = os.path.join(base, meta['file'])
+    dst = os.path.join(directory, meta['file'])
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+    return meta
+
+
+def _link_column(base: str, directory: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    if 'kind' in meta:
+        for name, array in meta.items():
+            if name != 'kind':
+                _link_array(base, directory, array)
+        return meta
+    return _link_array(base, directory, meta)
+
+
+def _link_frame(base: str, directory: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    for array in meta['arrays']:
+        _link_column(base, directory, array)
+    if meta['index'] is not None:
+        _link_array(base, directory, meta['index']['array'])
+    return meta
+
+
+def _frame_column(column: pd.Series) -> Any:
+    return column.array if column.dtype.name == 'category' else column.to_numpy()
+
+
+def _write_frame(directory: str, name: str, df: pd.DataFrame) -> Dict[str, Any]:
+    meta = {
+        'columns': df.columns.to_list(),
+        'arrays': [_write_column(directory, f'{name}.{i}', _frame_column(df.iloc[:, i])) for i in range(df.shape[1])],
+        'index': None,
+    }
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        meta['index'] = {'name': df.index.name, 'array': _write_array(directory, f'{name}.index', df.index.to_numpy())}
+    return meta
+
+
+def _read_frame(directory: str, meta: Dict[str, Any], mmap_mode: Optional[str], verify: bool) -> pd.DataFrame:
+    index = None
+    if meta['index'] is not None:
+        index = pd.Index(_read_array(directory, meta['index']['array'], mmap_mode, verify), name=meta['index']['name'])
+    columns = [_read_column(directory, array, mmap_mode, verify) for array in meta['arrays']]
+    return frame_view(dict(zip(meta['columns'], columns)), index=index)
+
+
+def _write_json(directory: str, name: str, value: Any) -> Dict[str, Any]:
+    filename = f'{name}.json'
+    path = os.path.join(directory, filename)
+    with open(path, 'w') as f:
+        json.dump(value, f)
+    return {
+        'file': filename,
+        'size': os.path.getsize(path),
+        'crc32': _crc32(path),
+    }
+
+
+def _read_json(directory: str, meta: Dict[str, Any], verify: bool) -> Any:
+    path = os.path.join(directory, meta['file'])
+    if verify and _crc32(path) != meta['crc32']:
+        raise SnapshotError(f'{meta["file"]} is corrupted')
+    with open(path) as f:
+        return json.load(f)
+
+
+@timed()
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def save_snapshot(cred: CredData, key: str, directory: str = SNAPSHOT_DIR, base: CredData = None) -> str:
+    """
+    Writes the fully derived CredData state under `directory`/`key`.
+    The snapshot is written to a temporary directory and moved into place
+    once complete.
+
+    Arrays and tables `cred` shares with `base` (see
+    cred.incremental.update_cred_data) are hard-linked from the snapshot of
+    `base` instead of being written again.
+    """
+    cred.warm_up(get_executor('warm-up', WARM_UP_WORKERS))
+    for name in INDEXES:
+        getattr(cred, name)
+    cred_cumsum = cred.cred_cumsum
+    os.makedirs(directory, exist_ok=True)
+    base_path = os.path.join(directory, base.snapshot_key) if base is not None and base.snapshot_key else None
+    base_manifest = None
+    if base_path is not None and base_path != os.path.join(directory, key):
+        try:
+            base_manifest = _read_manifest(base_path)
+        except (OSError, ValueError):
+            base_manifest = None
+        if base_manifest is not None and (base_manifest.get('version') != SNAPSHOT_VERSION
+                                          or base_manifest.get('compact') != cred.compact):
+            base_manifest = None
+
+    tmp = tempfile.mkdtemp(dir=directory, prefix=f'.{key}.')
+
+    def array(filename, values, group, name, base_values):
+        if base_manifest is not None and values is base_values:
+            meta = base_manifest[group][name] if name is not None else base_manifest[group]
+            return _link_column(base_path, tmp, meta)
+        return _write_column(tmp, filename, values)
+
+    def frame(name):
+        if base_manifest is not None and cred.cache[name] is base.cache.get(name):
+            return _link_frame(base_path, tmp, base_manifest['frames'][name])
+        return _write_frame(tmp, name, cred.cache[name])
+
+    def index(name):
+        if base_manifest is not None and cred.cache[name] is base.cache.get(name):
+            return _link_array(base_path, tmp, base_manifest['indexes'][name])
+        return _write_json(tmp, name, cred.cache[name])
+
+    try:
+        node_weights = cred.cred_result['nodeWeights']
+        edge_weights = cred.cred_result['edgeWeights']
+        base_result = base.cred_result if base_manifest is not None else None
+        base_ledger = base.cache.get('grain_ledger') if base_manifest is not None else None
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'key': key,
+            'compact': cred.compact,
+            'fullGraph': cred.has_graph,
+            'created': time.time(),
+            'sources': cred.source_hashes,
+            'intervals': cred.intervals,
+            'plugins': cred.cred_result['plugins'],
+            'nodes': {name: array(f'nodes.{i}', column, 'nodes', name,
+                                  base_result and base_result['nodes'].get(name))
+                      for i, (name, column) in enumerate(cred.node_columns.items())},
+            'credMatrix': array('credMatrix', cred.cred_matrix, 'credMatrix', None,
+                                base_result and base_result['credMatrix']),
+            'credCumsum': array('credCumsum', cred_cumsum, 'credCumsum', None,
+                                base_manifest is not None and base.cache.get('cred_cumsum')),
+            'nodeWeights': {name: array(f'nodeWeights.{name}', node_weights[name], 'nodeWeights', name,
+                                        base_result and base_result['nodeWeights'].get(name))
+                            for name in ('keys', 'weight')},
+            'edgeWeights': {name: array(f'edgeWeights.{name}', edge_weights[name], 'edgeWeights', name,
+                                        base_result and base_result['edgeWeights'].get(name))
+                            for name in ('keys', 'backwards', 'forwards')},
+            'edges': {name: array(f'edges.{name}', column, 'edges', name,
+                                  base_result and base_result['edges'].get(name))
+                      for name, column in cred.cred_result['edges'].items()},
+            'edgeTypes': cred.cred_result['edgeTypes'],
+            'grainLedger': {name: array(f'grainLedger.{name}', column, 'grainLedger', name,
+                                        base_ledger and base_ledger.columns.get(name))
+                            for name, column in cred.grain_ledger.columns.items()},
+            # the graph tables of a participants-only result are derived on first use
+            'frames': {name: frame(name) for name in FRAMES if cred.cache[name] is not None},
+            'indexes': {name: index(name) for name in INDEXES},
+        }
+        # the manifest goes last: a snapshot without it is incomplete
+        with open(os.path.join(tmp, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        target = os.path.join(directory, key)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+@timed()
+def load_snapshot(key: str,
+                  directory: str = SNAPSHOT_DIR,
+                  mmap_mode: Optional[str] = 'r',
+                  verify: bool = True,
+                  compact: Optional[bool] = None,
+                  discard: bool = True) -> Optional[CredData]:
+    """
+    Loads a CredData snapshot, memory-mapping its numeric arrays (and the
+    buffers of its compact columns), which the tables share without
+    copying them. Returns None when there is no snapshot for `key`; stale
+    or corrupted snapshots, and snapshots not in the `compact` mode when
+    given, are deleted when `discard` is set.
+    """
+    path = os.path.join(directory, key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        manifest = _read_manifest(path)
+        if manifest['version'] != SNAPSHOT_VERSION or manifest['key'] != key:
+            raise SnapshotError('stale snapshot')
+        if compact is not None and manifest['compact'] != compact:
+            raise SnapshotError('snapshot of the other storage mode')
+
+        def read(meta):
+            return _read_column(path, meta, mmap_mode, verify)
+
+        cred_result = compact_cred_result(
+            nodes={name: read(meta) for name, meta in manifest['nodes'].items()},
+            cred_matrix=read(manifest['credMatrix']),
+            intervals=manifest['intervals'],
+            node_weights={name: read(meta) for name, meta in manifest['nodeWeights'].items()},
+            edge_weights={name: read(meta) for name, meta in manifest['edgeWeights'].items()},
+            plugins=manifest['plugins'],
+            edges={name: read(meta) for name, meta in manifest['edges'].items()},
+            edge_types=manifest['edgeTypes'],
+            full_graph=manifest.get('fullGraph', True),
+        )
+        tables = {name: _read_frame(path, meta, mmap_mode, verify) for name, meta in manifest['frames'].items()}
+        tables.update({name: _read_json(path, meta, verify) for name, meta in manifest['indexes'].items()})
+        tables['grain_ledger'] = GrainLedger({name: read(meta) for name, meta in manifest['grainLedger'].items()})
+        tables['cred_cumsum'] = read(manifest['credCumsum'])
+    except (OSError, ValueError, KeyError, TypeError, EOFError, pickle.UnpicklingError, SnapshotError) as e:
+        if discard:
+            print(f'Discarding snapshot {path}: {e}')
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            print(f'Could not load snapshot {path}: {e}')
+        return None
+
+    cred = CredData(cred_result, accounts_data=None, compact=manifest['compact'])
+    cred.cache.update(tables)
+    cred.snapshot_key = key
+    cred.source_hashes = manifest.get('sources')
+    return cred
+
+
+def prune_snapshots(directory: str = SNAPSHOT_DIR, keep: str = None, count: int = KEEP_SNAPSHOTS):
+    """
+    Removes the complete snapshots but `keep` and the most recent others,
+    `count` in all: a process that just read the key of a previous one
+    can still load it
+    """
+    if not os.path.isdir(directory):
+        return
+    names = [name for name in os.listdir(directory)
+             if not name.startswith('.') and os.path.isdir(os.path.join(directory, name))]
+    names.sort(key=lambda name: (name != keep, -os.path.getmtime(os.path.join(directory, name))))
+    for name in names[max(count, 1):]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+@timed()
+def load_cred_data(cred_filename: str,
+                   accounts_filename: str,
+                   directory: str = SNAPSHOT_DIR,
+                   previous: CredData = None,
+                   verify: bool = False,
+                   compact: bool = False,
+                   cred_format: str = None) -> CredData:
+    """
+    Loads CredData for the given cred output (credResult.json by default,
+    see cred.parsers for the other `cred_format`s) and accounts.json files
+    from its snapshot, rebuilding the snapshot when it is missing, stale,
+    corrupted or not in the `compact` mode (see CredData).
+
+    With the `previous` CredData of the same instance, the new one is
+    updated incrementally from it (see cred.incremental), checked against a
+    full rebuild when `verify` is set.
+    """
+    parser = get_parser(cred_format)
+    source_hashes = {parser.source: content_hash(cred_filename), 'accounts': content_hash(accounts_filename)}
+    key = snapshot_key(source_hashes)
+    cred = load_snapshot(key, directory, compact=compact)
+    if cred is None:
+        incremental = (previous is not None and previous.source_hashes is not None and previous.compact == compact
+                       and previous.has_graph == parser.full_graph)
+        if incremental and previous.source_hashes.get(parser.source) == source_hashes[parser.source]:
+            # only the accounts changed: the cred result is not parsed again
+            cred_result = previous.cred_result
+        else:
+            with open(cred_filename, 'rb') as f:
+                cred_result = parser.parse(f)
+        with open(accounts_filename, 'r') as f:
+            accounts_data = json.load(f)
+        if incremental:
+            accounts_changed = previous.source_hashes.get('accounts') != source_hashes['accounts']
+            cred = update_cred_data(previous, cred_result, accounts_data, accounts_changed=accounts_changed, verify=verify)
+        else:
+            cred = CredData(cred_result, accounts_data, compact=compact)
+        cred.snapshot_key = key
+        cred.source_hashes = source_hashes
+        save_snapshot(cred, key, directory, base=previous)
+        prune_snapshots(directory, keep=key)
+    return cred
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from concurrent.futures import Executor
+import contextvars
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from cred.utils.metrics import note_cache_fill
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class RenderCache():
+    """
+    Bounded LRU cache of rendered dashboard views, shared by every session
+    of the process. Keys are built by the caller, typically
+    (snapshot, view name, *params).
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, render: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for `key`, calling `render` to build it on
+        a miss. Rendering happens outside the lock, so two sessions missing
+        the same key at once may both render it.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = render()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else None,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+class LazyCache(dict):
+    """
+    Values derived lazily from an object, by key (None until computed).
+
+    `dependencies` declares what each key is derived from: other keys, or
+    inputs of the object that are not cached themselves (e.g. 'nodes').
+    `compute` runs the derivation of a key at most once, even when several
+    threads ask for it at the same time: the first one computes it under
+    the key's lock while the others wait for its value. Invalidating a key
+    or an input also drops every key derived from it.
+    """
+
+    def __init__(self, dependencies: Dict[str, Tuple[str, ...]]):
+        super().__init__({key: None for key in dependencies})
+        self.dependencies = dependencies
+        self.dependents = {key: [] for key in dependencies}
+        for key, inputs in dependencies.items():
+            for name in inputs:
+                self.dependents.setdefault(name, []).append(key)
+        # reentrant: a derivation may ask for its own key again
+        self._locks = {key: threading.RLock() for key in dependencies}
+
+    def compute(self, key: str, derive: Callable[[], Any]) -> Any:
+        """
+        Value of `key`, calling `derive` to compute it on first use. The
+        value is only published once complete; a derivation may also fill
+        sibling keys computed along with it.
+        """
+        value = self[key]
+        if value is not None:
+            return value
+        with self._locks[key]:
+            value = self[key]
+            if value is None:
+                value = derive()
+                self[key] = value
+                note_cache_fill(key)
+            return value
+
+    def invalidate(self, *names: str) -> List[str]:
+        """
+        Drops the given keys or inputs and every key derived from them.
+        Returns the keys dropped.
+        """
+        dropped = []
+        pending = list(names)
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in self._locks:
+                with self._locks[name]:
+                    if self[name] is not None:
+                        dropped.append(name)
+                    self[name] = None
+            pending.extend(self.dependents.get(name, ()))
+        return dropped
+
+    def order(self, keys: Iterable[str] = None) -> List[str]:
+        """
+        `keys` (default: every key) and the keys they depend on, each after
+        its dependencies
+        """
+        ordered = []
+        visiting = set()
+
+        def visit(key):
+            if key in ordered or key not in self._locks:
+                return
+            if key in visiting:
+                raise ValueError(f'Dependency cycle through {key!r}')
+            visiting.add(key)
+            for name in self.dependencies[key]:
+                visit(name)
+            visiting.discard(key)
+            ordered.append(key)
+
+        for key in (self if keys is None else keys):
+            visit(key)
+        return ordered
+
+    def warm_up(self, derivations: Dict[str, Callable[[], Any]], executor: Executor = None):
+        """
+        Computes the keys of `derivations` (key -> call computing it), in
+        dependency order, or concurrently on `executor`: independent keys
+        are derived in parallel, and a key waits on the locks of the
+        dependencies another worker is still computing.
+        """
+        keys = [key for key in self.order(derivations) if key in derivations]
+        if executor is None:
+            for key in keys:
+                derivations[key]()
+            return
+        # in the caller's context, so the fills count towards its instrumented call
+        for future in [executor.submit(contextvars.copy_context().run, derivations[key]) for key in keys]:
+            future.result()
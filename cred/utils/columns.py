@@ -0,0 +1,223 @@
+import sys
+from typing import Any, Dict, Iterable, Iterator, Mapping
+
+import numpy as np
+import pandas as pd
+
+# string columns with at most this share of distinct values become categoricals
+CATEGORY_RATIO = 0.5
+# node columns kept in an offset-indexed buffer in compact mode
+TEXT_COLUMNS = ('address.id', 'description')
+# strings decoded at once when iterating over a StringColumn
+DECODE_CHUNK = 1 << 16
+
+
+class StringColumn():
+    """
+    Read-only column of strings packed into one UTF-8 buffer: string i is
+    data[offsets[i]:offsets[i + 1]]. Strings are only decoded when
+    accessed, so rarely used text costs about a byte per character instead
+    of a Python object per row.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> 'StringColumn':
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _decode(self, positions: np.ndarray) -> np.ndarray:
+        starts = self.offsets[positions].tolist()
+        ends = self.offsets[positions + 1].tolist()
+        if len(positions) > len(self) // 8:
+            data = self.data.tobytes()
+        else:
+            data = self.data
+        values = np.empty(len(positions), dtype=object)
+        values[:] = [bytes(data[start:end]).decode('utf-8', 'surrogatepass') for start, end in zip(starts, ends)]
+        return values
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError(key)
+            return bytes(self.data[self.offsets[key]:self.offsets[key + 1]]).decode('utf-8', 'surrogatepass')
+        if isinstance(key, slice):
+            return self._decode(np.arange(len(self))[key])
+        positions = np.asarray(key)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        positions = positions.astype(np.int64, copy=False)
+        return self._decode(np.where(positions < 0, positions + len(self), positions))
+
+    def __iter__(self) -> Iterator[str]:
+        for start in range(0, len(self), DECODE_CHUNK):
+            yield from self[start:start + DECODE_CHUNK]
+
+    def __array__(self, dtype: Any = None) -> np.ndarray:
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+    def tolist(self) -> list:
+        return self[:].tolist()
+
+    def equals(self, other: Any) -> bool:
+        return (isinstance(other, StringColumn)
+                and np.array_equal(self.offsets, other.offsets)
+                and np.array_equal(self.data, other.data))
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+    def __repr__(self) -> str:
+        return "<{} - ({} strings, {} bytes)>".format(self.__class__.__name__, len(self), self.nbytes)
+
+
+def downcast(values: np.ndarray) -> np.ndarray:
+    """
+    Integer `values` in the smallest integer dtype holding all of them
+    (floats are kept: float32 sums and shares would drift)
+    """
+    if values.dtype.kind not in 'iu' or len(values) == 0:
+        return values
+    lo, hi = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype) if info.bits < values.dtype.itemsize * 8 else values
+    return values
+
+
+def categorize(values: np.ndarray) -> Any:
+    """
+    String `values` as a pd.Categorical (missing values as NaN) when few of
+    them are distinct, `values` otherwise
+    """
+    if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        return values
+    missing = pd.isna(values)
+    present = values[~missing].tolist()
+    # interned with a dict: pandas hashes object strings up to their first
+    # NUL, so pd.Categorical would merge e.g. the NUL-separated addresses
+    categories = sorted(set(present))
+    if len(categories) > CATEGORY_RATIO * len(values):
+        return values
+    lookup = {value: code for code, value in enumerate(categories)}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    codes[~missing] = [lookup[value] for value in present]
+    return pd.Categorical.from_codes(downcast(codes), categories=pd.Index(categories, dtype=object))
+
+
+def compact_column(values: Any) -> Any:
+    """
+    `values` as a categorical when they are repeated strings, downcast when
+    they are integers
+    """
+    if isinstance(values, (pd.Categorical, StringColumn)):
+        return values
+    if values.dtype == object:
+        return categorize(values)
+    return downcast(values)
+
+
+def compact_node_columns(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Node columns with the text columns packed into StringColumns and the
+    others compacted (see compact_column)
+    """
+    return {name: (values if isinstance(values, StringColumn) else StringColumn.from_strings(values))
+            if name in TEXT_COLUMNS else compact_column(values)
+            for name, values in columns.items()}
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with its columns compacted (see compact_column)
+    """
+    columns = {name: compact_column(df[name].array if df[name].dtype.name == 'category' else df[name].to_numpy())
+               for name in df.columns}
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frame_view(columns: Dict[str, Any], index: pd.Index = None) -> pd.DataFrame:
+    """
+    DataFrame over `columns` (arrays or categoricals), without copying them
+    where pandas allows it, so memory-mapped columns stay shared between
+    processes. pandas >= 1.3 honours copy=False for dicts of columns;
+    older versions copy them into consolidated blocks.
+    """
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def same_column(a: Any, b: Any) -> bool:
+    """
+    Whether two columns (numpy arrays, categoricals or StringColumns) hold
+    the same values
+    """
+    if isinstance(a, (pd.Categorical, StringColumn)) and type(a) is type(b):
+        return a.equals(b)
+    return np.array_equal(a, b)
+
+
+def same_values(a: Any, b: Any) -> bool:
+    """
+    Whether two columns hold the same values whatever their representation,
+    e.g. a compact column and the column it was built from
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape:
+        return False
+    missing = pd.isna(a)
+    return bool((missing == pd.isna(b)).all() and (a[~missing] == b[~missing]).all())
+
+
+def column_nbytes(values: Any) -> int:
+    """
+    Bytes held by a column, counting every distinct Python object it
+    references once
+    """
+    if isinstance(values, pd.Series):
+        values = values.array if values.dtype.name == 'category' else values.to_numpy()
+    if isinstance(values, pd.Categorical):
+        return values.codes.nbytes + column_nbytes(values.categories.to_numpy())
+    if isinstance(values, StringColumn):
+        return values.nbytes
+    values = np.asarray(values)
+    if values.dtype != object:
+        return values.nbytes
+    objects = {id(value): value for value in values.tolist()}
+    return values.nbytes + sum(sys.getsizeof(value) for value in objects.values())
+
+
+def tables_nbytes(tables: Dict[str, Mapping[str, Any]]) -> pd.Series:
+    """
+    Bytes held by every column of `tables` (frames or dicts of columns),
+    by table and column
+    """
+    nbytes = {(table, name): column_nbytes(columns[name]) for table, columns in tables.items() for name in columns}
+    return pd.Series(nbytes, name='bytes', dtype=np.int64).rename_axis(['table', 'column'])
+
+
+def memory_report(before: pd.Series, after: pd.Series) -> pd.DataFrame:
+    """
+    Bytes per column of two representations (see tables_nbytes) side by
+    side, with the bytes saved and the after/before ratio, and a total row
+    (columns missing from one side count as 0 bytes)
+    """
+    df = pd.concat({'before': before, 'after': after}, axis=1).fillna(0).astype(np.int64)
+    total = pd.DataFrame([df.sum()], index=pd.MultiIndex.from_tuples([('total', '')], names=df.index.names))
+    df = pd.concat([df, total])
+    df['saved'] = df.before - df.after
+    df['ratio'] = df.after / df.before.replace(0, np.nan)
+    return df
@@ -0,0 +1,141 @@
+"""
+Downsampling of time series before plotting, so that the points sent to
+the browser are bounded by the plot width rather than by the length of
+the history.
+
+Both decimations work on several series at once (one row per series) and
+return, for every series, the positions of the points to keep:
+- `minmax_indices` keeps the min and the max of equally sized buckets, so
+  every peak survives
+- `lttb_indices` (Largest-Triangle-Three-Buckets) keeps, in every bucket,
+  the point forming the largest triangle with the previously kept point
+  and the average of the next bucket
+"""
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+METHODS = ('minmax', 'lttb')
+
+
+def _buckets(start: int, stop: int, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions of `n_buckets` nearly equal buckets covering [start, stop),
+    padded to the widest bucket, and the mask of the valid ones
+    """
+    edges = np.linspace(start, stop, n_buckets + 1).astype(np.int64)
+    width = int(np.diff(edges).max())
+    positions = edges[:-1, None] + np.arange(width)
+    return np.minimum(positions, stop - 1), positions < edges[1:, None]
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Positions of at most `n_out` (and at least 4) points of every row of
+    `y`: the first, the last and the min and max of (n_out - 2) / 2
+    buckets in between
+    """
+    y = np.atleast_2d(y)
+    n = y.shape[1]
+    if n <= n_out:
+        return np.broadcast_to(np.arange(n), y.shape)
+    positions, valid = _buckets(1, n - 1, max(1, (n_out - 2) // 2))
+    values = y[:, positions]
+    lows = np.where(valid, values, np.inf).argmin(axis=2)
+    highs = np.where(valid, values, -np.inf).argmax(axis=2)
+    rows = np.arange(positions.shape[0])
+    picked = np.concatenate([positions[rows, lows], positions[rows, highs]], axis=1)
+    ends = np.broadcast_to([0, n - 1], (y.shape[0], 2))
+    return np.sort(np.concatenate([ends, picked], axis=1), axis=1)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Positions of `n_out` points of every row of `y` (over the shared `x`)
+    selected with Largest-Triangle-Three-Buckets
+    """
+    y = np.atleast_2d(y)
+    n = y.shape[1]
+    if n <= n_out:
+        return np.broadcast_to(np.arange(n), y.shape)
+    if n_out < 3:
+        return minmax_indices(y, n_out)
+    x = np.asarray(x, dtype=np.float64)
+    positions, valid = _buckets(1, n - 1, n_out - 2)
+    rows = np.arange(y.shape[0])
+    picked = np.empty((y.shape[0], n_out), dtype=np.int64)
+    picked[:, 0] = 0
+    picked[:, -1] = n - 1
+    for b in range(n_out - 2):
+        bucket = positions[b][valid[b]]
+        if b + 1 < n_out - 2:
+            following = positions[b + 1][valid[b + 1]]
+            next_x, next_y = x[following].mean(), y[:, following].mean(axis=1)
+        else:
+            next_x, next_y = x[n - 1], y[:, n - 1]
+        prev_x, prev_y = x[picked[:, b]], y[rows, picked[:, b]]
+        # twice the area of the triangles (previous, candidate, next average)
+        area = np.abs((prev_x[:, None] - next_x) * (y[:, bucket] - prev_y[:, None])
+                      - (prev_x[:, None] - x[bucket]) * (next_y - prev_y)[:, None])
+        picked[:, b + 1] = bucket[area.argmax(axis=1)]
+    return picked
+
+
+def _numeric_index(index: pd.Index) -> np.ndarray:
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(np.float64)
+    return index.to_numpy(dtype=np.float64)
+
+
+def _clip(data: Union[pd.Series, pd.DataFrame], x_range: Optional[Tuple[Any, Any]]) -> Union[pd.Series, pd.DataFrame]:
+    """
+    Rows of `data` within `x_range`, plus one on either side so lines run
+    to the edges of the plot
+    """
+    if x_range is None or None in x_range:
+        return data
+    start, end = x_range
+    if isinstance(data.index, pd.DatetimeIndex):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    i0 = max(0, data.index.searchsorted(start, side='left') - 1)
+    i1 = min(len(data), data.index.searchsorted(end, side='right') + 1)
+    return data.iloc[i0:i1]
+
+
+def _positions(data: Union[pd.Series, pd.DataFrame], n_out: int, method: str) -> np.ndarray:
+    if method not in METHODS:
+        raise ValueError(f'Unknown downsampling method {method!r}, expected one of {METHODS}')
+    values = data.to_numpy(dtype=np.float64).T
+    if method == 'minmax':
+        return minmax_indices(values, n_out)
+    return lttb_indices(_numeric_index(data.index), values, n_out)
+
+
+def downsample(data: Union[pd.Series, pd.DataFrame],
+               n_out: int,
+               method: str = 'minmax',
+               x_range: Optional[Tuple[Any, Any]] = None) -> Union[pd.Series, pd.DataFrame]:
+    """
+    Rows of `data` (sorted by index) within `x_range`, downsampled to at
+    most `n_out` points per column. Columns share the union of the rows
+    kept for each: see `downsample_columns` to bound each series.
+    """
+    data = _clip(data, x_range)
+    if len(data) <= n_out:
+        return data
+    return data.iloc[np.unique(_positions(data, n_out, method))]
+
+
+def downsample_columns(data: pd.DataFrame,
+                       n_out: int,
+                       method: str = 'minmax',
+                       x_range: Optional[Tuple[Any, Any]] = None) -> List[pd.Series]:
+    """
+    Every column of `data` within `x_range`, downsampled on its own to at
+    most `n_out` points
+    """
+    data = _clip(data, x_range)
+    if len(data) <= n_out:
+        return [data.iloc[:, i] for i in range(data.shape[1])]
+    return [data.iloc[np.unique(positions), i] for i, positions in enumerate(_positions(data, n_out, method))]
@@ -0,0 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Dict
+
+_executors: Dict[str, ThreadPoolExecutor] = dict()
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """
+    Process-wide pool of worker threads named `name`, created on first use,
+    so that work shared by every dashboard session stays off their event
+    loop
+    """
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
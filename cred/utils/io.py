@@ -1,21 +1,330 @@
+from array import array
 import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, BinaryIO, Callable, Dict, Optional
+from urllib3.util.retry import Retry
 
+import ijson
+import numpy as np
+
+from cred.cred_result import EdgeColumnsBuilder, NodeColumnsBuilder, compact_cred_result
+from cred.utils.metrics import timed
+
+CRED_RESULT_PREFIX = 'item'
+GRAPH_PREFIX = f'{CRED_RESULT_PREFIX}.weightedGraph.item.graphJSON.item'
+WEIGHTS_PREFIX = f'{CRED_RESULT_PREFIX}.weightedGraph.item.weightsJSON.item'
+CRED_DATA_PREFIX = f'{CRED_RESULT_PREFIX}.credData'
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 60)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+CHUNK_SIZE = 1 << 16
+
+_START = ('start_map', 'start_array')
+_END = ('end_map', 'end_array')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide HTTP session with connection pooling, gzip transfer and
+    bounded retries on connection errors and 429/5xx responses
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retries = Retry(total=MAX_RETRIES,
+                            backoff_factor=BACKOFF_FACTOR,
+                            status_forcelist=(429, 500, 502, 503, 504),
+                            raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return _session
+
+
+def _validators_filename(filename: str) -> str:
+    return f'{filename}.validators.json'
+
+
+def _load_validators(uri: str, filename: str) -> Dict[str, str]:
+    if not os.path.exists(filename):
+        return dict()
+    try:
+        with open(_validators_filename(filename), 'r') as f:
+            validators = json.load(f)
+    except (OSError, ValueError):
+        return dict()
+    if validators.get('uri') != uri:
+        return dict()
+    return validators
+
+
+def _atomic_write(filename: str, write: Callable[[BinaryIO], None]):
+    directory = os.path.dirname(filename) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(filename)}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+
+@timed()
+def download_file(uri: str,
+                  filename: str,
+                  session: requests.Session = None,
+                  timeout=DEFAULT_TIMEOUT) -> Optional[bool]:
+    """
+    Conditionally downloads `uri` to `filename`.
+
+    The ETag/Last-Modified validators of the last download are stored next
+    to the file and sent back, so a 304 reuses the local copy. New content
+    is streamed to a temporary file and renamed into place once complete.
+    Returns True when the file changed, False when the local copy is still
+    current and None on error.
+    """
+    session = session or get_session()
+    validators = _load_validators(uri, filename)
+    headers = dict()
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last-modified' in validators:
+        headers['If-Modified-Since'] = validators['last-modified']
+
+    for attempt in range(MAX_RETRIES + 1):
+        r = None
+        try:
+            with session.get(uri, headers=headers, stream=True, timeout=timeout) as r:
+                if r.status_code == 304:
+                    return False
+                if r.status_code != 200:
+                    print(f'Error while trying to fetch data from URI: {uri} => {r.reason}')
+                    return
+
+                def write(f):
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+
+                _atomic_write(filename, write)
+                validators = {'uri': uri}
+                if 'ETag' in r.headers:
+                    validators['etag'] = r.headers['ETag']
+                if 'Last-Modified' in r.headers:
+                    validators['last-modified'] = r.headers['Last-Modified']
+                _atomic_write(_validators_filename(filename), lambda f: f.write(json.dumps(validators).encode()))
+                return True
+        except requests.RequestException as e:
+            # the adapter already retried the request itself, but not
+            # failures while streaming the body
+            if r is None or attempt == MAX_RETRIES:
+                print(f'Error while trying to fetch data from URI: {uri} => {e}')
+                return
+            time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+
+
+def fetch_file(uri: str, filename: str) -> bool:
+    """
+    Revalidates the local copy of `uri` in `filename` (see download_file),
+    downloading it when it changed. Returns whether `filename` holds a
+    copy, the last one fetched when `uri` could not be reached.
+    """
+    return download_file(uri, filename) is not None or os.path.exists(filename)
+
+
+@timed()
 def fetch_cred_data(uri: str, filename: str, cache=True):
     """
+    Loads a JSON file from its local copy, revalidated against `uri`
+    first, or from `uri` directly when `cache` is off
     """
-    if os.path.exists(filename) and cache:
+    if cache:
+        if not fetch_file(uri, filename):
+            return
         with open(filename, 'r') as f:
             return json.load(f)
-    else:
-        r = requests.get(uri)
-        if r.status_code != 200:
-            print(f'Error while trying to fetch data from URI: {uri} => {r.reason}')
-            return
-        data = r.json()
-        if cache:
-            with open(filename, 'w') as f:
-                json.dump(data, f)
+    try:
+        r = get_session().get(uri, timeout=DEFAULT_TIMEOUT)
+    except requests.RequestException as e:
+        print(f'Error while trying to fetch data from URI: {uri} => {e}')
+        return
+    if r.status_code != 200:
+        print(f'Error while trying to fetch data from URI: {uri} => {r.reason}')
+        return
+    return r.json()
+
+
+class _StreamReader():
+    """
+    File-like wrapper counting the bytes read
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.fp.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _stream_items(events, handlers: Dict[str, Callable[[Optional[str], Any], None]]):
+    """
+    Routes the elements of the JSON arrays/objects found at the `handlers`
+    prefixes to their handler as soon as each element is complete. Only one
+    element is materialized at a time; everything else is skipped.
+    """
+    depth = 0
+    handler = None
+    builder = None
+    key = None
+    for prefix, event, value in events:
+        if handler is None:
+            if event in _START and prefix in handlers:
+                handler = handlers[prefix]
+                base = depth
+            depth += (event in _START) - (event in _END)
+            continue
+
+        if depth == base + 1 and builder is None:
+            # container level
+            if event in _END:
+                handler = None
+                depth -= 1
+            elif event == 'map_key':
+                key = value
+            elif event in _START:
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                depth += 1
+            else:
+                handler(key, value)
+            continue
+
+        builder.event(event, value)
+        depth += (event in _START) - (event in _END)
+        if depth == base + 1:
+            handler(key, builder.value)
+            builder = None
+
 
-        return data
\ No newline at end of file
+@timed()
+def stream_cred_result(fp: BinaryIO, trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Streams a credResult.json (TimelineCred format) from a binary file
+    object or HTTP body, keeping only the compact arrays used by CredData.
+    The raw JSON tree is never materialized.
+
+    The returned 'stats' entry reports the JSON size and the size of the
+    compact arrays. With `trace_memory` it also reports (and prints) the peak memory
+    while parsing and the memory saved against `json.load`, which holds at
+    least the whole JSON text on top of the parsed tree (a lower bound).
+    """
+    reader = _StreamReader(fp)
+    nodes = NodeColumnsBuilder()
+    edges = EdgeColumnsBuilder()
+    intervals = []
+    node_weights = ([], array('d'))
+    edge_weights = ([], array('d'), array('d'))
+    plugins = []
+
+    def add_node_weight(key, weight):
+        node_weights[0].append(key)
+        node_weights[1].append(weight)
+
+    def add_edge_weight(key, weight):
+        edge_weights[0].append(key)
+        edge_weights[1].append(weight['backwards'])
+        edge_weights[2].append(weight['forwards'])
+
+    def add_plugins(key, item):
+        if isinstance(item, list):
+            plugins.extend(item)
+
+    handlers = {
+        f'{GRAPH_PREFIX}.sortedNodeAddresses': lambda k, v: nodes.add_address(v),
+        f'{GRAPH_PREFIX}.nodes': lambda k, v: nodes.add_node(v),
+        f'{GRAPH_PREFIX}.edges': lambda k, v: edges.add_edge(v),
+        f'{WEIGHTS_PREFIX}.nodeWeights': add_node_weight,
+        f'{WEIGHTS_PREFIX}.edgeWeights': add_edge_weight,
+        f'{CRED_DATA_PREFIX}.intervals': lambda k, v: intervals.append(v),
+        f'{CRED_DATA_PREFIX}.nodeSummaries': lambda k, v: nodes.add_summary(v),
+        f'{CRED_DATA_PREFIX}.nodeOverTime': lambda k, v: nodes.add_over_time(v),
+        f'{CRED_RESULT_PREFIX}.plugins': add_plugins,
+    }
+
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        _stream_items(ijson.parse(reader, use_float=True), handlers)
+        node_columns, cred_matrix = nodes.build(len(intervals))
+        edge_columns, edge_types = edges.build()
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    cred_result = compact_cred_result(
+        nodes=node_columns,
+        cred_matrix=cred_matrix,
+        intervals=intervals,
+        node_weights={'keys': node_weights[0], 'weight': np.frombuffer(node_weights[1], dtype=np.float64)},
+        edge_weights={'keys': edge_weights[0],
+                      'backwards': np.frombuffer(edge_weights[1], dtype=np.float64),
+                      'forwards': np.frombuffer(edge_weights[2], dtype=np.float64)},
+        plugins=plugins,
+        edges=edge_columns,
+        edge_types=edge_types,
+    )
+    compact_bytes = (cred_matrix.nbytes + sum(c.nbytes for c in node_columns.values())
+                     + sum(c.nbytes for c in edge_columns.values()))
+    cred_result['stats'] = {
+        'jsonBytes': reader.bytes_read,
+        'compactBytes': compact_bytes,
+        'peakBytes': peak,
+        'savedBytes': None if peak is None else reader.bytes_read - peak,
+    }
+    if trace_memory:
+        print(f'Streamed credResult: {reader.bytes_read / 2**20:.1f}MB of JSON into '
+              f'{compact_bytes / 2**20:.1f}MB of arrays (peak {peak / 2**20:.1f}MB while parsing, '
+              f'>= {(reader.bytes_read - peak) / 2**20:.1f}MB saved)')
+    return cred_result
+
+
+@timed()
+def fetch_cred_result(uri: str, filename: str, cache=True, trace_memory=False) -> Optional[Dict[str, Any]]:
+    """
+    Streams credResult.json from its local copy, revalidated against `uri`
+    first, or from `uri` directly when `cache` is off, into the compact
+    representation used by CredData
+    """
+    if cache:
+        if not fetch_file(uri, filename):
+            return
+        with open(filename, 'rb') as f:
+            return stream_cred_result(f, trace_memory=trace_memory)
+    try:
+        with get_session().get(uri, stream=True, timeout=DEFAULT_TIMEOUT) as r:
+            if r.status_code != 200:
+                print(f'Error while trying to fetch data from URI: {uri} => {r.reason}')
+                return
+            r.raw.decode_content = True
+            return stream_cred_result(r.raw, trace_memory=trace_memory)
+    except requests.RequestException as e:
+        print(f'Error while trying to fetch data from URI: {uri} => {e}')
@@ -0,0 +1,322 @@
+"""
+Lightweight instrumentation of the data and dashboard hot paths.
+
+Instrumented calls record their count, wall time (as a histogram), errors
+and, when tracemalloc is tracing, the memory they allocated. The totals are
+exposed in the Prometheus text format by `render_prometheus` and
+`start_metrics_server`. A `Trace` additionally records every call made
+while it is active, e.g. the callbacks of one dashboard session, and dumps
+them in the Chrome trace event format (chrome://tracing, Perfetto).
+
+Set CRED_METRICS=0 to switch the instrumentation off, and
+CRED_METRICS_MEMORY=1 to also trace allocations (slower).
+"""
+import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import http.server
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# histogram buckets, in seconds
+BUCKETS = (.001, .005, .01, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+
+_active_trace = ContextVar('cred_trace', default=None)
+# cache keys filled during the innermost instrumented call (see note_cache_fill)
+_call_fills = ContextVar('cred_call_fills', default=None)
+
+
+class _Stat():
+    __slots__ = ('count', 'errors', 'seconds', 'max_seconds', 'buckets', 'allocated')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.
+        self.max_seconds = 0.
+        self.buckets = [0] * len(BUCKETS)
+        self.allocated = 0
+
+
+class Trace():
+    """
+    Calls recorded while the trace is active
+    """
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.events = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def activate(self) -> Iterator['Trace']:
+        token = _active_trace.set(self)
+        try:
+            yield self
+        finally:
+            _active_trace.reset(token)
+
+    def add(self, name: str, start: float, seconds: float, labels: Dict[str, str]):
+        self.events.append((name, start, seconds, threading.get_ident(), labels))
+
+    def to_chrome(self) -> Dict[str, Any]:
+        return {
+            'traceEvents': [{'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                             'ts': (start - self._origin) * 1e6, 'dur': seconds * 1e6, 'args': labels}
+                            for name, start, seconds, tid, labels in self.events],
+            'otherData': {'name': self.name},
+        }
+
+    def dump(self, filename: str):
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome(), f)
+
+
+class Metrics():
+    """
+    Process-wide registry of call statistics
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = time.time()
+        self._stats: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], _Stat] = dict()
+        self._cache_fills: Dict[str, int] = dict()
+        self._collectors: Dict[str, Callable[[], List[Tuple[str, str, Dict[str, str], float]]]] = dict()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, error: bool = False, allocated: int = 0, **labels: str):
+        self._record((name, tuple(sorted(labels.items()))), seconds, error, allocated)
+
+    def _record(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], seconds: float, error: bool, allocated: int):
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = _Stat()
+            stat.count += 1
+            stat.errors += error
+            stat.seconds += seconds
+            stat.max_seconds = max(stat.max_seconds, seconds)
+            stat.allocated += allocated
+            i = bisect.bisect_left(BUCKETS, seconds)
+            if i < len(BUCKETS):
+                stat.buckets[i] += 1
+
+    def record_cache_fill(self, key: str):
+        with self._lock:
+            self._cache_fills[key] = self._cache_fills.get(key, 0) + 1
+
+    def add_collector(self, name: str, collect: Callable[[], List[Tuple[str, str, Dict[str, str], float]]]):
+        """
+        Registers (or replaces) a callable returning extra samples as
+        (metric name, type, labels, value) tuples
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Copy of the call statistics, by name and labels
+        """
+        with self._lock:
+            return {
+                'calls': {(name, labels): {'count': s.count, 'errors': s.errors, 'seconds': s.seconds,
+                                           'maxSeconds': s.max_seconds, 'buckets': list(s.buckets),
+                                           'allocatedBytes': s.allocated}
+                          for (name, labels), s in self._stats.items()},
+                'cacheFills': dict(self._cache_fills),
+                'collectors': list(self._collectors.values()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._cache_fills.clear()
+
+
+METRICS = Metrics(enabled=os.environ.get('CRED_METRICS', '1') != '0')
+
+if os.environ.get('CRED_METRICS_MEMORY', '0') != '0' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def note_cache_fill(key: str):
+    """
+    Counts a cache entry computed (see cred.utils.cache.LazyCache), and
+    makes the instrumented calls in progress cache misses
+    """
+    if not METRICS.enabled:
+        return
+    METRICS.record_cache_fill(key)
+    fills = _call_fills.get()
+    if fills is not None:
+        fills.append(key)
+
+
+def _wrap(f: Callable, name: str, cache_attr: Optional[str] = None, trace_attr: Optional[str] = None) -> Callable:
+    plain = (name, ())
+    hit = (name, (('cache', 'hit'),))
+    miss = (name, (('cache', 'miss'),))
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        if not METRICS.enabled:
+            return f(*args, **kwargs)
+        if trace_attr is not None:
+            trace = getattr(args[0], trace_attr, None)
+            if trace is not None and _active_trace.get() is not trace:
+                with trace.activate():
+                    return wrapper(*args, **kwargs)
+        fills = [] if cache_attr is not None else None
+        token = _call_fills.set(fills) if fills is not None else None
+        before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        start = time.perf_counter()
+        error = True
+        try:
+            result = f(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            allocated = 0 if before is None else max(0, tracemalloc.get_traced_memory()[0] - before)
+            key = plain
+            if fills is not None:
+                _call_fills.reset(token)
+                key = miss if fills else hit
+                # an inner miss is a miss of the calls it was made from too
+                outer = _call_fills.get()
+                if fills and outer is not None:
+                    outer.extend(fills)
+            METRICS._record(key, seconds, error, allocated)
+            trace = _active_trace.get()
+            if trace is not None:
+                trace.add(name, start, seconds, dict(key[1]))
+    return wrapper
+
+
+def timed(name: str = None, trace_attr: str = None) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording the calls of a function. On methods, `trace_attr`
+    names an attribute holding a `Trace` to activate during the call.
+    """
+    def decorator(f):
+        return _wrap(f, name or f.__qualname__, trace_attr=trace_attr)
+    return decorator
+
+
+def instrument(cache_attr: str = None) -> Callable[[type], type]:
+    """
+    Class decorator recording the calls of every public method and
+    property. With `cache_attr`, calls are labelled as cache misses when
+    they computed an entry of that cache (see note_cache_fill), as hits
+    otherwise.
+    """
+    def decorator(cls):
+        for attr_name, attr in list(vars(cls).items()):
+            if attr_name.startswith('_'):
+                continue
+            name = f'{cls.__name__}.{attr_name}'
+            if isinstance(attr, property) and attr.fget is not None:
+                setattr(cls, attr_name, property(_wrap(attr.fget, name, cache_attr), attr.fset, attr.fdel, attr.__doc__))
+            elif inspect.isfunction(attr):
+                setattr(cls, attr_name, _wrap(attr, name, cache_attr))
+        return cls
+    return decorator
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def render_prometheus(metrics: Metrics = METRICS) -> str:
+    """
+    Statistics in the Prometheus text exposition format
+    """
+    snapshot = metrics.snapshot()
+    calls = snapshot['calls']
+    lines = []
+
+    def family(name: str, kind: str, help: str):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('cred_calls_total', 'counter', 'Instrumented calls')
+    for (name, labels), s in calls.items():
+        lines.append(f'cred_calls_total{_labels({"name": name, **dict(labels)})} {s["count"]}')
+    family('cred_call_errors_total', 'counter', 'Instrumented calls that raised')
+    for (name, labels), s in calls.items():
+        lines.append(f'cred_call_errors_total{_labels({"name": name, **dict(labels)})} {s["errors"]}')
+    family('cred_call_seconds', 'histogram', 'Wall time of instrumented calls')
+    for (name, labels), s in calls.items():
+        cumulative = 0
+        for le, n in zip(BUCKETS, s['buckets']):
+            cumulative += n
+            lines.append(f'cred_call_seconds_bucket{_labels({"name": name, **dict(labels), "le": repr(le)})} {cumulative}')
+        lines.append(f'cred_call_seconds_bucket{_labels({"name": name, **dict(labels), "le": "+Inf"})} {s["count"]}')
+        lines.append(f'cred_call_seconds_sum{_labels({"name": name, **dict(labels)})} {s["seconds"]!r}')
+        lines.append(f'cred_call_seconds_count{_labels({"name": name, **dict(labels)})} {s["count"]}')
+    family('cred_call_max_seconds', 'gauge', 'Slowest instrumented call')
+    for (name, labels), s in calls.items():
+        lines.append(f'cred_call_max_seconds{_labels({"name": name, **dict(labels)})} {s["maxSeconds"]!r}')
+    if tracemalloc.is_tracing():
+        family('cred_call_allocated_bytes_total', 'counter', 'Memory allocated by instrumented calls (net)')
+        for (name, labels), s in calls.items():
+            lines.append(f'cred_call_allocated_bytes_total{_labels({"name": name, **dict(labels)})} {s["allocatedBytes"]}')
+    family('cred_cache_fills_total', 'counter', 'CredData cache entries computed')
+    for key, count in snapshot['cacheFills'].items():
+        lines.append(f'cred_cache_fills_total{_labels({"key": key})} {count}')
+
+    families = dict()
+    for collect in snapshot['collectors']:
+        for name, kind, labels, value in collect():
+            families.setdefault((name, kind), []).append(f'{name}{_labels(labels)} {value!r}')
+    for (name, kind), samples in families.items():
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    family('cred_process_uptime_seconds', 'gauge', 'Seconds since the metrics registry was created')
+    lines.append(f'cred_process_uptime_seconds {time.time() - metrics.started!r}')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, address: str = '0.0.0.0') -> http.server.HTTPServer:
+    """
+    Serves /metrics from a daemon thread, once per process
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = http.server.ThreadingHTTPServer((address, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='cred-metrics', daemon=True).start()
+        return _server
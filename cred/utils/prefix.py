@@ -0,0 +1,84 @@
+from bisect import bisect_left
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+def prefix_successor(prefix: str) -> Optional[str]:
+    """
+    Smallest string greater than every string starting with `prefix`
+    (None when there is no such string)
+    """
+    prefix = prefix.rstrip(MAX_CHAR)
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixIndex():
+    """
+    Sorted index over string keys (e.g. NUL-separated sourcecred addresses).
+    Every key starting with a given prefix lives in one contiguous range of
+    the sorted keys, found with two binary searches.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = list(keys)
+        self.order = np.array(sorted(range(len(self.keys)), key=self.keys.__getitem__), dtype=np.int64)
+        self.sorted_keys = [self.keys[i] for i in self.order]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def span(self, prefix: str) -> Tuple[int, int]:
+        """
+        [lo, hi) range of the sorted keys starting with `prefix`
+        """
+        lo = bisect_left(self.sorted_keys, prefix)
+        successor = prefix_successor(prefix)
+        hi = len(self.sorted_keys) if successor is None else bisect_left(self.sorted_keys, successor, lo)
+        return lo, hi
+
+    def members(self, prefix: str) -> np.ndarray:
+        """
+        Positions (in insertion order) of the keys starting with `prefix`
+        """
+        lo, hi = self.span(prefix)
+        return np.sort(self.order[lo:hi])
+
+    def group(self, prefixes: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Assigns keys to every prefix they start with. Returns (positions, groups)
+        pairs sorted by key position, where groups index into `prefixes`
+        """
+        spans = [self.span(p) for p in prefixes]
+        positions = np.concatenate([self.order[lo:hi] for lo, hi in spans] + [np.empty(0, dtype=np.int64)])
+        groups = np.repeat(np.arange(len(prefixes)), [hi - lo for lo, hi in spans])
+        ix = np.argsort(positions, kind='stable')
+        return positions[ix], groups[ix]
+
+    def group_sum(self, prefixes: Sequence[str], *values: Sequence[float]) -> List[np.ndarray]:
+        """
+        Sums each of `values` (aligned with the keys) per prefix. Values are
+        accumulated in key insertion order, like a sequential sum over a mask
+        """
+        positions, groups = self.group(prefixes)
+        return [np.bincount(groups,
+                            weights=np.asarray(v, dtype=np.float64)[positions],
+                            minlength=len(prefixes))
+                for v in values]
+
+    def label(self, prefix_labels: Dict[str, str], default: str = None) -> np.ndarray:
+        """
+        Labels each key with the value of the first prefix (in dict order)
+        it starts with, or `default`
+        """
+        labels = np.full(len(self.keys), default, dtype=object)
+        assigned = np.zeros(len(self.keys), dtype=bool)
+        for prefix, label in prefix_labels.items():
+            members = self.members(prefix)
+            members = members[~assigned[members]]
+            labels[members] = label
+            assigned[members] = True
+        return labels
@@ -0,0 +1,103 @@
+import copy
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_TOP_K = 10
+
+
+class _SuffixPrefixes():
+    """
+    Sequence of the first `width` characters of every suffix of a suffix
+    array, in sorted order, for bisect
+    """
+
+    def __init__(self, text: str, positions: np.ndarray, width: int):
+        self.text = text
+        self.positions = positions
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, i: int) -> str:
+        p = self.positions[i]
+        return self.text[p:p + self.width]
+
+
+class UserSearchIndex():
+    """
+    Case-insensitive prefix and substring search over usernames.
+
+    Every suffix of every lowercased username is kept in a suffix array
+    over the NUL-joined usernames: the usernames containing a query are the
+    owners of the suffixes starting with it, one contiguous range of the
+    array found with two binary searches. Usernames are given in ranking
+    order; matches are returned prefix matches first, then by rank.
+    """
+
+    def __init__(self, users: Sequence[str]):
+        self.users = list(users)
+        lowered = [user.lower() for user in self.users]
+        self.text = '\x00'.join(lowered) + '\x00'
+        lengths = np.array([len(user) for user in lowered], dtype=np.int64)
+        # start of every username in the text
+        starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]]).astype(np.int64)
+        # owner and offset within its username of every suffix
+        owners = np.repeat(np.arange(len(lowered), dtype=np.int64), lengths)
+        offsets = np.arange(len(owners), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        suffixes = [user[i:] for user in lowered for i in range(len(user))]
+        order = np.array(sorted(range(len(suffixes)), key=suffixes.__getitem__), dtype=np.int64)
+        self.positions = (starts[owners] + offsets)[order]
+        self.owners = owners[order].astype(np.int32)
+        self.is_prefix = offsets[order] == 0
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def span(self, query: str) -> range:
+        """
+        Range of the suffix array starting with `query` (lowercased)
+        """
+        query = query.lower()
+        suffixes = _SuffixPrefixes(self.text, self.positions, len(query))
+        return range(bisect_left(suffixes, query), bisect_right(suffixes, query))
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[str]:
+        """
+        Top-k usernames containing `query`, case-insensitively: the ones
+        starting with it first, then the others, each by rank
+        """
+        if not query or '\x00' in query:
+            return []
+        span = self.span(query)
+        owners = self.owners[span.start:span.stop]
+        is_prefix = self.is_prefix[span.start:span.stop]
+        # a username starts with the query at most once
+        top = np.sort(owners[is_prefix])[:top_k]
+        if len(top) < top_k:
+            others = np.unique(owners[~is_prefix])
+            others = others[~np.isin(others, top, assume_unique=True)][:top_k - len(top)]
+            top = np.concatenate([top, others])
+        return [self.users[i] for i in top.tolist()]
+
+    def reordered(self, users: Sequence[str]) -> Optional['UserSearchIndex']:
+        """
+        Index of the same usernames in a new ranking order, sharing the
+        suffix array. None when `users` are not a permutation of them.
+        """
+        rank = {user: i for i, user in enumerate(users)}
+        if len(rank) != len(self.users) or len(users) != len(self.users):
+            return None
+        try:
+            owner_rank = np.array([rank[user] for user in self.users], dtype=np.int32)
+        except KeyError:
+            return None
+        index = copy.copy(self)
+        index.users = list(users)
+        index.owners = owner_rank[self.owners]
+        return index
+
+    def __repr__(self) -> str:
+        return "<{} - ({} users, {} suffixes)>".format(self.__class__.__name__, len(self.users), len(self.positions))
@@ -0,0 +1,191 @@
+"""
+What-if cred recomputation.
+
+Recomputes cred on the weighted graph with some node/edge weights changed
+by prefix (e.g. a plugin's node or edge type), without rerunning
+sourcecred. Cred is the stationary distribution of sourcecred's Markov
+chain: from every node, cred teleports back to the seed (the nodes,
+proportionally to their weight) with probability alpha, or follows one of
+the node's forward/backward edge transitions (or its synthetic self loop),
+proportionally to their weights. It is found with a sparse power
+iteration, warm-started from the published scores and stopped once no
+score moves by more than the tolerance.
+
+The published cred comes from sourcecred's timeline cred, which this
+single, all-time chain only approximates: the what-if cred of a node is its
+published cred plus the change between a baseline run with the published
+weights and a run with the overrides.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from cred.graph import DEFAULT_ALPHA, edge_type_weights, node_type_weights
+
+# largest score change between two iterations once converged
+DEFAULT_TOLERANCE = 1e-7
+DEFAULT_MAX_ITERATIONS = 255
+# weight of the synthetic self loop of every node (sourcecred's default)
+SYNTHETIC_LOOP_WEIGHT = 1e-3
+
+
+def node_type_prefix(source: str, node_type: str) -> str:
+    """
+    Node address prefix of a node type, e.g. ('sourcecred/github', 'PULL')
+    -> 'N\\x00sourcecred\\x00github\\x00PULL\\x00'
+    """
+    return 'N\x00' + source.replace('/', '\x00') + '\x00' + node_type + '\x00'
+
+
+class WhatIfRun():
+    """
+    Scores of one power iteration
+    """
+
+    def __init__(self, scores: np.ndarray, minted: float, iterations: int, delta: float, tolerance: float, seconds: float):
+        # stationary distribution over the nodes (sums to 1)
+        self.scores = scores
+        # total node weight, i.e. the cred minted by the seed
+        self.minted = minted
+        self.iterations = iterations
+        # largest score change in the last iteration
+        self.delta = delta
+        self.converged = delta < tolerance
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return '<{} - ({} iterations in {:.2f}s, {})>'.format(
+            self.__class__.__name__, self.iterations, self.seconds,
+            'converged' if self.converged else f'not converged, delta {self.delta:.2e}')
+
+
+class WhatIfEngine():
+    """
+    Sparse power iteration over the Markov chain of a compact cred result
+    """
+
+    def __init__(self,
+                 cred_result: Dict[str, Any],
+                 alpha: float = DEFAULT_ALPHA,
+                 tolerance: float = DEFAULT_TOLERANCE,
+                 max_iterations: int = DEFAULT_MAX_ITERATIONS):
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.node_weights = cred_result['nodeWeights']
+        self.edge_weights = cred_result['edgeWeights']
+        self.plugins = cred_result['plugins']
+        self.edge_types = cred_result['edgeTypes']
+        nodes = cred_result['nodes']
+        self.n_nodes = len(nodes['totalCred'])
+        self.published = np.asarray(nodes['totalCred'], dtype=np.float64)
+        self._ids = nodes['address.id']
+        self._address_index = None
+        self._baseline = None
+        # the baseline is computed once, even for concurrent runs
+        self._lock = threading.Lock()
+
+        # node type of every node, as a code into the node type prefixes
+        source_codes, sources = pd.factorize(nodes['address.source'])
+        type_codes, types = pd.factorize(nodes['address.nodeType'])
+        pair_codes, pairs = pd.factorize(source_codes.astype(np.int64) * len(types) + type_codes)
+        self.node_type = pair_codes
+        self.node_types = [node_type_prefix(sources[p // len(types)], types[p % len(types)]) for p in pairs]
+
+        # forward transitions then backward ones, as a CSR matrix (target x
+        # origin) whose structure is shared by every run
+        edges = cred_result['edges']
+        self._origin = np.concatenate([edges['src'], edges['dst']]).astype(np.int32)
+        target = np.concatenate([edges['dst'], edges['src']]).astype(np.int64)
+        self._edge_type = edges['type'].astype(np.intp)
+        self._order = np.argsort(target, kind='stable').astype(np.int32)
+        self._indices = self._origin[self._order]
+        self._indptr = np.concatenate([[0], np.cumsum(np.bincount(target, minlength=self.n_nodes))]).astype(np.int32)
+
+    def _node_index(self, keys: pd.Index) -> np.ndarray:
+        """
+        Node of every full node address key (-1 when unknown)
+        """
+        if self._address_index is None:
+            self._address_index = pd.Index([f'{self.node_types[t]}{i}\x00' for t, i in zip(self.node_type, self._ids)])
+        return self._address_index.get_indexer(keys)
+
+    def seed_weights(self, overrides: Dict[str, float] = None) -> np.ndarray:
+        """
+        Weight of every node: the weight of its type, times the weight of
+        its own address (only for 4 part addresses) when it has one
+        """
+        weights = node_type_weights(self.node_types, self.node_weights, self.plugins, overrides)[self.node_type]
+        node_keys = dict(zip(self.node_weights['keys'], self.node_weights['weight']))
+        node_keys.update(overrides or {})
+        node_keys = {k: w for k, w in node_keys.items() if k.count('\x00') == 5}
+        if node_keys:
+            nodes = self._node_index(pd.Index(list(node_keys)))
+            found = nodes >= 0
+            np.multiply.at(weights, nodes[found], np.fromiter(node_keys.values(), dtype=np.float64)[found])
+        return weights
+
+    def run(self,
+            node_overrides: Dict[str, float] = None,
+            edge_overrides: Dict[str, Dict[str, float]] = None,
+            warm_start: Optional[np.ndarray] = None) -> WhatIfRun:
+        """
+        Stationary distribution of the chain with the weightsJSON weights
+        updated by `node_overrides` ({prefix: weight}) and `edge_overrides`
+        ({prefix: {'forwards': f, 'backwards': b}}), starting from
+        `warm_start` (default: the baseline run)
+        """
+        start = time.perf_counter()
+        seed = self.seed_weights(node_overrides)
+        minted = seed.sum()
+        seed = seed / minted if minted > 0 else np.full(self.n_nodes, 1. / self.n_nodes)
+
+        forwards, backwards = edge_type_weights(self.edge_types, self.edge_weights, self.plugins, edge_overrides)
+        weight = np.concatenate([forwards[self._edge_type], backwards[self._edge_type]])
+        out_weight = np.bincount(self._origin, weights=weight, minlength=self.n_nodes) + SYNTHETIC_LOOP_WEIGHT
+        # chain[v, u]: probability of moving from u to v along an edge
+        chain = sparse.csr_matrix(((weight / out_weight[self._origin])[self._order], self._indices, self._indptr),
+                                  shape=(self.n_nodes, self.n_nodes))
+        loop = SYNTHETIC_LOOP_WEIGHT / out_weight
+
+        if warm_start is None:
+            warm_start = self.baseline.scores
+        total = warm_start.sum()
+        scores = warm_start / total if total > 0 else seed
+        delta, iterations = np.inf, 0
+        while iterations < self.max_iterations and delta >= self.tolerance:
+            updated = (1 - self.alpha) * (chain @ scores + loop * scores) + self.alpha * seed
+            delta = np.abs(updated - scores).max()
+            scores = updated
+            iterations += 1
+        return WhatIfRun(scores, minted, iterations, delta, self.tolerance, time.perf_counter() - start)
+
+    @property
+    def baseline(self) -> WhatIfRun:
+        """
+        Run with the published weights, warm-started from the published
+        node scores
+        """
+        with self._lock:
+            if self._baseline is None:
+                self._baseline = self.run(warm_start=self.published)
+            return self._baseline
+
+    def cred(self, run: WhatIfRun) -> np.ndarray:
+        """
+        What-if cred of every node: its published cred plus the change
+        between the baseline and `run`. The cred minted scales with the
+        total node weight.
+        """
+        baseline = self.baseline
+        published_total = self.published.sum()
+        total = published_total * run.minted / baseline.minted if baseline.minted > 0 else published_total
+        return np.maximum(self.published + total * run.scores - published_total * baseline.scores, 0.)
+
+    def __repr__(self) -> str:
+        return "<{} - ({} nodes & {} transitions, alpha {})>".format(
+            self.__class__.__name__, self.n_nodes, len(self._origin), self.alpha)